@@ -0,0 +1,18 @@
+# admin.py - Autorização dos endpoints administrativos
+# -------------------------------------------------
+# Os endpoints /admin/* só funcionam se a variável ADMIN_TOKEN estiver
+# definida, e a requisição precisa enviar o mesmo valor no cabeçalho
+# X-Admin-Token. Sem ADMIN_TOKEN eles ficam desligados (403).
+# -------------------------------------------------
+
+import os
+import hmac
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+CABECALHO_TOKEN = 'X-Admin-Token'
+
+def token_admin_valido(token_recebido):
+    """Retorna True se o token recebido confere com ADMIN_TOKEN."""
+    if not ADMIN_TOKEN or not token_recebido:
+        return False
+    return hmac.compare_digest(token_recebido.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
@@ -0,0 +1,118 @@
+# agendador.py - Expirações agendadas (heap) em vez de verificações preguiçosas
+# -------------------------------------------------
+# Guarda um prazo por (chave, tipo) em um heap de mínimos. Reagendar ou
+# cancelar só troca a versão do item: a entrada antiga fica no heap e é
+# descartada quando chega ao topo. Cada operação custa O(log n) e nada
+# percorre a lista de sessões; quando o heap acumula entradas velhas demais
+# ele é reconstruído.
+#
+# Uma thread por processo dorme até o prazo mais próximo e chama o
+# tratador registrado para o tipo (registrar_tratador). A thread é
+# criada no primeiro agendamento de cada processo, então funciona também
+# depois do fork dos workers do gunicorn.
+# -------------------------------------------------
+
+import os
+import time
+import heapq
+import itertools
+import threading
+
+_condicao = threading.Condition()
+_heap = []                  # (prazo, sequência, chave, tipo)
+_prazos = {}                # (chave, tipo) -> (prazo, sequência) válido
+_tratadores = {}            # tipo -> funcao(chave)
+_sequencia = itertools.count()
+_pid_thread = None
+
+def registrar_tratador(tipo, funcao):
+    """Define a função chamada (com a chave) quando um prazo do `tipo` vence."""
+    _tratadores[tipo] = funcao
+
+def agendar(chave, tipo, prazo):
+    """Agenda (ou reagenda) a expiração de `chave` para o instante `prazo` (epoch em segundos)."""
+    with _condicao:
+        atual = _prazos.get((chave, tipo))
+        if atual is not None and atual[0] == prazo:
+            return
+        item = (prazo, next(_sequencia), chave, tipo)
+        _prazos[(chave, tipo)] = item[:2]
+        heapq.heappush(_heap, item)
+        if len(_heap) > 2 * len(_prazos) + 1024:
+            _compactar()
+        if _heap[0] is item:
+            _condicao.notify()
+    _garantir_thread()
+
+def cancelar(chave, tipo):
+    """Cancela a expiração pendente de `chave` (se houver)."""
+    with _condicao:
+        _prazos.pop((chave, tipo), None)
+
+def pendentes():
+    """Quantidade de expirações agendadas e ainda válidas."""
+    return len(_prazos)
+
+def _compactar():
+    """Remove do heap as entradas reagendadas/canceladas (chamar com _condicao)."""
+    global _heap
+    _heap = [item for item in _heap if _prazos.get((item[2], item[3])) == item[:2]]
+    heapq.heapify(_heap)
+
+def _retirar_vencidos(agora):
+    """Retira do heap os itens válidos com prazo <= agora (chamar com _condicao)."""
+    vencidos = []
+    while _heap and _heap[0][0] <= agora:
+        prazo, sequencia, chave, tipo = heapq.heappop(_heap)
+        if _prazos.get((chave, tipo)) == (prazo, sequencia):
+            del _prazos[(chave, tipo)]
+            vencidos.append((chave, tipo))
+    return vencidos
+
+def _executar(vencidos):
+    for chave, tipo in vencidos:
+        tratador = _tratadores.get(tipo)
+        if tratador is None:
+            continue
+        try:
+            tratador(chave)
+        except Exception as e:
+            print(f"❌ Erro ao expirar '{tipo}' de {chave}: {e}")
+
+def processar_vencidos(agora=None):
+    """Executa agora os tratadores de tudo que já venceu. Retorna quantos expiraram."""
+    with _condicao:
+        vencidos = _retirar_vencidos(time.time() if agora is None else agora)
+    _executar(vencidos)
+    return len(vencidos)
+
+def vencer(chave):
+    """Executa agora as expirações pendentes de `chave`, como se os prazos já tivessem passado (simulações)."""
+    with _condicao:
+        vencidos = [item for item in _prazos if item[0] == chave]
+        for item in vencidos:
+            del _prazos[item]
+    _executar(vencidos)
+    return len(vencidos)
+
+def _laco():
+    while True:
+        with _condicao:
+            while True:
+                agora = time.time()
+                vencidos = _retirar_vencidos(agora)
+                if vencidos:
+                    break
+                espera = _heap[0][0] - agora if _heap else None
+                _condicao.wait(espera)
+        _executar(vencidos)
+
+def _garantir_thread():
+    global _pid_thread
+    if _pid_thread == os.getpid():
+        return
+    with _condicao:
+        if _pid_thread == os.getpid():
+            return
+        _pid_thread = os.getpid()
+        threading.Thread(target=_laco, name="agendador-expiracoes", daemon=True).start()
@@ -0,0 +1,313 @@
+# analise.py - Agregados por hora das conversas (fluxos, intenções, abandonos)
+# -------------------------------------------------
+# O bot_logic registra aqui, a cada mensagem, eventos como:
+#   mensagem        (rótulo: fluxo em que a mensagem chegou)
+#   fluxo_iniciado  (fluxo em que o cliente entrou)
+#   transicao       ("fluxo:estado -> fluxo:estado")
+#   intencao        (chave de regra respondida)
+#   fallback        (fluxo em que a resposta foi RESPOSTA_FORA_MENU)
+#   encaminhamento  (fluxo de onde a conversa foi para o atendente)
+#   pedido          (fluxo em que um pedido foi confirmado)
+#   abandono        ("fluxo:estado" em que a sessão expirou parada)
+#
+# Os contadores ficam em colunas: `_horas` tem o início de cada hora e
+# cada série (evento, rótulo) é um array com uma contagem por hora, na
+# mesma posição. Registrar um evento custa um incremento; uma consulta
+# soma só as fatias das horas pedidas, sem reler histórico bruto.
+# Horas que começaram há mais de ANALISE_RETENCAO_HORAS são descartadas.
+#
+# Os contadores são de cada processo. Com ANALISE_DIR (padrão:
+# PERSISTENCIA_DIR/analise) cada worker ocupa um arquivo próprio,
+# ANALISE_DIR/analise_<n>.json (trava com flock, como os diretórios da
+# persistência), carrega o que estava nele ao subir e o regrava a cada
+# INTERVALO_GRAVACAO_SEGUNDOS. A consulta soma a memória do processo com
+# os arquivos dos outros workers: /admin/analise mostra todos os workers
+# e o histórico sobrevive a reinícios. Sem ANALISE_DIR, só o processo atual.
+# -------------------------------------------------
+
+import os
+import json
+import time
+import atexit
+import bisect
+import math
+import datetime
+import threading
+from array import array
+
+RETENCAO_HORAS = int(os.getenv('ANALISE_RETENCAO_HORAS', str(24 * 30)))
+EVENTOS = ('mensagem', 'fluxo_iniciado', 'transicao', 'intencao', 'fallback',
+           'encaminhamento', 'pedido', 'abandono')
+
+_PERSISTENCIA_DIR = os.getenv('PERSISTENCIA_DIR')
+ANALISE_DIR = os.getenv('ANALISE_DIR') or (os.path.join(_PERSISTENCIA_DIR, 'analise') if _PERSISTENCIA_DIR else None)
+MAX_ARQUIVOS_WORKERS = 64
+INTERVALO_GRAVACAO_SEGUNDOS = 5.0
+
+_trava = threading.Lock()
+_trava_gravacao = threading.Lock()
+_horas = []      # início de cada hora (epoch, múltiplo de 3600), em ordem
+_colunas = {}    # (evento, rótulo) -> array('L') com uma contagem por hora de _horas
+_alterado = False        # há contagens ainda não gravadas no arquivo do worker
+_arquivo = None          # arquivo deste processo em ANALISE_DIR (ver iniciar)
+_fd_trava = None
+_pid_iniciado = None
+
+def _indice_hora(hora, agora):
+    """
+    Posição da `hora` em _horas, criando a hora em todas as colunas se preciso
+    (chamar com _trava). None se a hora já passou da retenção em relação a `agora`.
+    """
+    if _horas and _horas[-1] == hora:
+        return len(_horas) - 1
+    posicao = bisect.bisect_left(_horas, hora)
+    if posicao < len(_horas) and _horas[posicao] == hora:
+        return posicao
+    limite = agora - RETENCAO_HORAS * 3600
+    if hora < limite:
+        return None
+    _horas.insert(posicao, hora)
+    for coluna in _colunas.values():
+        coluna.insert(posicao, 0)
+    return posicao - _descartar_antigas(limite)
+
+def _descartar_antigas(limite):
+    """Descarta as horas que começam antes de `limite` (epoch) e retorna quantas foram (chamar com _trava)."""
+    excesso = bisect.bisect_left(_horas, limite)
+    if excesso > 0:
+        del _horas[:excesso]
+        for coluna in _colunas.values():
+            del coluna[:excesso]
+    return excesso
+
+def registrar_varios(eventos, agora=None):
+    """Soma uma ocorrência de cada (evento, rótulo) de `eventos` na hora atual (ou na hora de `agora`, epoch)."""
+    global _alterado
+    agora = agora if agora is not None else time.time()
+    hora = int(agora // 3600) * 3600
+    with _trava:
+        posicao = _indice_hora(hora, agora)
+        if posicao is None:
+            return
+        for chave in eventos:
+            _coluna(chave)[posicao] += 1
+        _alterado = True
+
+def _coluna(chave):
+    """Coluna da série `chave`, criada zerada se preciso (chamar com _trava)."""
+    coluna = _colunas.get(chave)
+    if coluna is None:
+        coluna = _colunas[chave] = array('L', [0]) * len(_horas)
+    return coluna
+
+def registrar(evento, rotulo, agora=None):
+    """Soma uma ocorrência de (evento, rótulo)."""
+    registrar_varios(((evento, rotulo),), agora)
+
+# -------------------------------------------------
+# Arquivos dos workers (ANALISE_DIR)
+# -------------------------------------------------
+def _retrato():
+    with _trava:
+        return {'horas': list(_horas),
+                'series': [[evento, rotulo, coluna.tolist()] for (evento, rotulo), coluna in _colunas.items()]}
+
+def _gravar():
+    global _alterado
+    with _trava_gravacao:
+        with _trava:
+            if not _alterado:
+                return
+            _alterado = False
+        temporario = f"{_arquivo}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(_retrato(), f)
+            os.replace(temporario, _arquivo)
+        except OSError:
+            _alterado = True
+            raise
+
+def _laco_gravacao():
+    while True:
+        time.sleep(INTERVALO_GRAVACAO_SEGUNDOS)
+        try:
+            _gravar()
+        except OSError as e:
+            print(f"❌ Erro ao gravar a análise em {_arquivo}: {e}")
+
+def _ler(caminho):
+    """(horas, {(evento, rótulo): contagens}) de um arquivo de worker, ou None se ilegível."""
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            dados = json.load(f)
+        horas = dados['horas']
+        series = {(evento, rotulo): contagens for evento, rotulo, contagens in dados['series']}
+        if any(len(contagens) != len(horas) for contagens in series.values()):
+            raise ValueError("séries com tamanho diferente das horas")
+        return horas, series
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _travar_arquivo(caminho):
+    """Reserva o arquivo para este processo. Retorna False se outro worker já o usa."""
+    global _fd_trava
+    import fcntl
+    fd = os.open(f"{caminho}.trava", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _fd_trava = fd
+    return True
+
+def iniciar():
+    """
+    Ocupa o primeiro arquivo livre de ANALISE_DIR, soma nos contadores o histórico gravado
+    nele e inicia a thread de gravação. Uma vez por processo (chamada pelo inicializar_worker).
+    """
+    global _arquivo, _pid_iniciado, _alterado
+    if not ANALISE_DIR or _pid_iniciado == os.getpid():
+        return
+    _pid_iniciado = os.getpid()
+    try:
+        os.makedirs(ANALISE_DIR, exist_ok=True)
+        for numero in range(MAX_ARQUIVOS_WORKERS):
+            caminho = os.path.join(ANALISE_DIR, f"analise_{numero}.json")
+            if _travar_arquivo(caminho):
+                break
+        else:
+            print(f"⚠️ ANALISE_DIR: os {MAX_ARQUIVOS_WORKERS} arquivos de {ANALISE_DIR} já estão em uso; "
+                  "a análise deste worker ficará só em memória.")
+            return
+    except OSError as e:
+        print(f"❌ Erro ao abrir ANALISE_DIR {ANALISE_DIR}: {e}. A análise deste worker ficará só em memória.")
+        return
+
+    salvo = _ler(caminho) if os.path.exists(caminho) else None
+    agora = time.time()
+    with _trava:
+        _arquivo = caminho
+        if salvo:
+            horas, series = salvo
+            for posicao_salva, hora in enumerate(horas):
+                posicao = _indice_hora(hora, agora)
+                if posicao is None:
+                    continue
+                for chave, contagens in series.items():
+                    if contagens[posicao_salva]:
+                        _coluna(chave)[posicao] += contagens[posicao_salva]
+        _alterado = True
+    threading.Thread(target=_laco_gravacao, name="analise-gravacao", daemon=True).start()
+    atexit.register(_gravar_na_saida)
+    print(f"✅ Análise deste worker em {caminho}" + (f" ({len(salvo[1])} séries restauradas)" if salvo else ""))
+
+def _gravar_na_saida():
+    if _pid_iniciado == os.getpid():
+        try:
+            _gravar()
+        except OSError as e:
+            print(f"❌ Erro ao gravar a análise em {_arquivo}: {e}")
+
+def _fontes():
+    """Contadores gravados pelos outros workers em ANALISE_DIR (o deste processo vem da memória)."""
+    if not ANALISE_DIR or not os.path.isdir(ANALISE_DIR):
+        return []
+    fontes = []
+    for nome in os.listdir(ANALISE_DIR):
+        caminho = os.path.join(ANALISE_DIR, nome)
+        if not (nome.startswith("analise_") and nome.endswith(".json")) or caminho == _arquivo:
+            continue
+        dados = _ler(caminho)
+        if dados:
+            fontes.append(dados)
+    return fontes
+
+def _reiniciar_travas_no_filho():
+    # Uma thread do processo pai pode estar com a trava no momento do fork
+    global _trava, _trava_gravacao
+    _trava = threading.Lock()
+    _trava_gravacao = threading.Lock()
+
+os.register_at_fork(after_in_child=_reiniciar_travas_no_filho)
+
+def _para_epoch(valor, padrao):
+    """Aceita None, epoch (número) ou data ISO ("2025-01-31T14"). Levanta ValueError."""
+    if valor in (None, ''):
+        return padrao
+    try:
+        epoch = float(valor)
+    except ValueError:
+        return datetime.datetime.fromisoformat(valor).timestamp()
+    # "inf", "nan" e epochs fora do que datetime representa são inválidos como datas ISO
+    if not math.isfinite(epoch):
+        raise ValueError(f"data inválida: {valor}")
+    try:
+        datetime.datetime.fromtimestamp(epoch)
+    except (OverflowError, OSError) as e:
+        raise ValueError(f"data inválida: {valor}") from e
+    return epoch
+
+def consultar(desde=None, ate=None, eventos=None, por_hora=False, agora=None):
+    """
+    Soma os eventos das horas em [desde, ate) (padrão: últimas 24h).
+    Retorna {"desde", "ate", "totais": {evento: {rótulo: n}}} e, com
+    por_hora=True, também "horas" e "series" {evento: {rótulo: [n por hora]}}.
+    Levanta ValueError se as datas forem inválidas.
+    """
+    agora = agora if agora is not None else time.time()
+    inicio = _para_epoch(desde, agora - 24 * 3600)
+    fim = _para_epoch(ate, agora + 3600)
+    eventos = set(eventos) if eventos else None
+    totais = {}
+    por_serie = {}   # (evento, rótulo) -> {hora: n}
+    horas = set()
+
+    def somar(horas_fonte, colunas_fonte):
+        a = bisect.bisect_left(horas_fonte, int(inicio // 3600) * 3600)
+        b = bisect.bisect_left(horas_fonte, fim)
+        horas.update(horas_fonte[a:b])
+        for (evento, rotulo), coluna in colunas_fonte.items():
+            if eventos is not None and evento not in eventos:
+                continue
+            fatia = coluna[a:b]
+            total = sum(fatia)
+            if not total:
+                continue
+            rotulos = totais.setdefault(evento, {})
+            rotulos[rotulo] = rotulos.get(rotulo, 0) + total
+            if por_hora:
+                serie = por_serie.setdefault((evento, rotulo), {})
+                for hora, n in zip(horas_fonte[a:b], fatia):
+                    serie[hora] = serie.get(hora, 0) + n
+
+    for horas_fonte, colunas_fonte in _fontes():
+        somar(horas_fonte, colunas_fonte)
+    with _trava:
+        somar(_horas, _colunas)
+
+    horas = sorted(horas)
+    series = {}
+    for (evento, rotulo), serie in por_serie.items():
+        series.setdefault(evento, {})[rotulo] = [serie.get(hora, 0) for hora in horas]
+
+    # Rótulos do mais frequente para o menos frequente
+    totais = {evento: dict(sorted(r.items(), key=lambda item: -item[1])) for evento, r in sorted(totais.items())}
+    resultado = {
+        'desde': datetime.datetime.fromtimestamp(inicio).isoformat(timespec='seconds'),
+        'ate': datetime.datetime.fromtimestamp(fim).isoformat(timespec='seconds'),
+        'totais': totais,
+    }
+    if por_hora:
+        resultado['horas'] = [datetime.datetime.fromtimestamp(h).isoformat(timespec='minutes') for h in horas]
+        resultado['series'] = series
+    return resultado
+
+def limpar():
+    """Apaga todos os agregados deste processo (e, na próxima gravação, o arquivo dele)."""
+    global _alterado
+    with _trava:
+        _horas.clear()
+        _colunas.clear()
+        _alterado = True
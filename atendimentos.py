@@ -0,0 +1,113 @@
+# atendimentos.py - Fila de atendimentos humanos em aberto
+# -------------------------------------------------
+# Índice ordenado (bisect) das conversas encaminhadas para um atendente,
+# usado pelo painel /admin/atendimentos. A ordem é:
+#   1. conversas em que o cliente está esperando resposta do atendente,
+#      da espera mais antiga para a mais recente;
+#   2. conversas já respondidas pelo atendente, da última resposta mais
+#      antiga para a mais recente.
+# Inserir/remover custa O(log n) na busca (+ deslocamento da lista) e uma
+# página custa O(log n + tamanho da página), sem percorrer as sessões.
+#
+# O estado fica nos campos da própria sessão (ATENDIMENTO_HUMANO_ATIVO,
+# AGUARDANDO_ATENDENTE_DESDE, ...); este módulo só mantém o índice, que
+# bot_logic atualiza (atualizar) sempre que uma sessão muda. Como o
+# SESSAO_ESTADOS, o índice é do processo (worker).
+# -------------------------------------------------
+
+import bisect
+import datetime
+import threading
+
+_trava = threading.Lock()
+_indice = []        # chaves ordenadas: (respondido, desde_epoch, sessao_id)
+_chaves = {}        # sessao_id -> chave atual no _indice
+_sessoes = {}       # sessao_id -> dict da sessão (para montar a listagem)
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+def _chave(sessao_id, sessao):
+    """Chave de ordenação da sessão, ou None se ela não está com um atendente."""
+    if not sessao['ATENDIMENTO_HUMANO_ATIVO']:
+        return None
+    aguardando = sessao.get('AGUARDANDO_ATENDENTE_DESDE')
+    if aguardando:
+        return (False, aguardando.timestamp(), sessao_id)
+    desde = (sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO'] or sessao.get('ENCAMINHADO_EM')
+             or datetime.datetime.now())
+    return (True, desde.timestamp(), sessao_id)
+
+def _remover(sessao_id):
+    """Tira a sessão do índice (chamar com _trava)."""
+    chave = _chaves.pop(sessao_id, None)
+    if chave is None:
+        return
+    del _sessoes[sessao_id]
+    posicao = bisect.bisect_left(_indice, chave)
+    del _indice[posicao]
+
+def remover(sessao_id):
+    """Tira a sessão do índice (ela saiu deste processo)."""
+    with _trava:
+        _remover(sessao_id)
+
+def atualizar(sessao_id, sessao):
+    """Reposiciona (ou tira) a sessão no índice de acordo com o estado atual dela."""
+    chave = _chave(sessao_id, sessao)
+    with _trava:
+        if _chaves.get(sessao_id) == chave and _sessoes.get(sessao_id) is sessao:
+            return
+        _remover(sessao_id)
+        if chave is not None:
+            bisect.insort(_indice, chave)
+            _chaves[sessao_id] = chave
+            _sessoes[sessao_id] = sessao
+
+def abertos():
+    """Quantidade de atendimentos humanos em aberto."""
+    return len(_indice)
+
+def _para_iso(data):
+    return data.isoformat(timespec='seconds') if data else None
+
+def _codificar_cursor(chave):
+    respondido, desde, sessao_id = chave
+    return f"{int(respondido)}:{desde!r}:{sessao_id}"
+
+def _decodificar_cursor(cursor):
+    """Converte o cursor da página anterior em chave. Levanta ValueError se for inválido."""
+    respondido, desde, sessao_id = cursor.split(':', 2)
+    if respondido not in ('0', '1'):
+        raise ValueError(cursor)
+    return (respondido == '1', float(desde), sessao_id)
+
+def listar(limite=LIMITE_PADRAO, cursor=None, agora=None):
+    """
+    Retorna uma página da fila: {"total", "itens", "proximo_cursor"}.
+    `cursor` é o "proximo_cursor" da página anterior (None para a primeira).
+    Levanta ValueError se o cursor for inválido.
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    agora = agora or datetime.datetime.now()
+    with _trava:
+        inicio = bisect.bisect_right(_indice, _decodificar_cursor(cursor)) if cursor else 0
+        pagina = _indice[inicio:inicio + limite]
+        total = len(_indice)
+        itens = []
+        for chave in pagina:
+            respondido, _, sessao_id = chave
+            sessao = _sessoes[sessao_id]
+            aguardando = sessao.get('AGUARDANDO_ATENDENTE_DESDE')
+            itens.append({
+                'conversa': sessao_id,
+                'aguardando_atendente': not respondido,
+                'aguardando_desde': _para_iso(aguardando),
+                'espera_segundos': int((agora - aguardando).total_seconds()) if aguardando else 0,
+                'encaminhado_em': _para_iso(sessao.get('ENCAMINHADO_EM')),
+                'ultima_interacao_atendente': _para_iso(sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO']),
+                'ultima_mensagem_cliente': _para_iso(sessao.get('ULTIMA_MENSAGEM_CLIENTE')),
+            })
+        fim = inicio + len(pagina)
+        proximo = _codificar_cursor(pagina[-1]) if pagina and fim < total else None
+    return {'total': total, 'itens': itens, 'proximo_cursor': proximo}
@@ -0,0 +1,246 @@
+# bench_conversas.py - Benchmark de vazão com replay de conversas sintéticas
+# -------------------------------------------------
+# Reproduz conversas geradas por conversas_sinteticas.py:
+#   - modo "direto": chama processar_mensagem_shopee no próprio processo;
+#   - modo "http": envia os webhooks para o server.py (gunicorn) com a
+#     Shopee API substituída pelo stub de bench_servidor.py.
+# Mostra mensagens/s, latências p50/p95/p99 e memória por sessão.
+#
+# No modo direto, --transcricoes usa conversas reais gravadas pelo
+# gravador.py (GRAVADOR_DIR) no lugar das sintéticas.
+#
+# Para pegar regressões:
+#     python bench_conversas.py --salvar-baseline baseline.json
+#     python bench_conversas.py --comparar baseline.json --tolerancia 0.15
+# O segundo comando sai com código 1 se a vazão cair ou o p99 subir mais
+# que a tolerância em algum modo.
+# -------------------------------------------------
+
+import os
+import gc
+import glob
+import sys
+import json
+import time
+import asyncio
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+
+import bot_logic
+import gravador
+import cache_respostas
+from conversas_sinteticas import gerar_conversas, intercalar
+from bench_servidor import (
+    DIRETORIO_REPO,
+    porta_livre,
+    esperar_porta,
+    rss_arvore_kb,
+    payload_webhook,
+    percentil,
+)
+
+def _resumo(latencias, duracao, mensagens, sessoes, bytes_memoria):
+    latencias.sort()
+    return {
+        'mensagens': mensagens,
+        'sessoes': sessoes,
+        'mensagens_s': round(mensagens / duracao, 1) if duracao else 0.0,
+        'p50_us': round(percentil(latencias, 50) * 1e6, 1),
+        'p95_us': round(percentil(latencias, 95) * 1e6, 1),
+        'p99_us': round(percentil(latencias, 99) * 1e6, 1),
+        'bytes_por_sessao': round(bytes_memoria / sessoes) if sessoes else 0,
+    }
+
+# -------------------------------------------------
+# Modo direto (processar_mensagem_shopee no mesmo processo)
+# -------------------------------------------------
+def _eventos_transcricoes(caminhos):
+    """Mensagens gravadas, na ordem original, e o estado inicial de cada sessão."""
+    eventos = []
+    estados_iniciais = {}
+    for registro in gravador.ler_transcricoes(caminhos):
+        estados_iniciais.setdefault(registro['s'], registro['e'])
+        eventos.append((registro['s'], registro['m']))
+    return eventos, estados_iniciais
+
+def _restaurar_sessoes(estados_iniciais):
+    bot_logic.SESSAO_ESTADOS.clear()
+    for sessao_id, estado in estados_iniciais.items():
+        bot_logic.SESSAO_ESTADOS[sessao_id] = gravador.estado_de_json(estado)
+
+def medir_direto(args):
+    if args.transcricoes:
+        eventos, estados_iniciais = _eventos_transcricoes(args.transcricoes)
+    else:
+        conversas = list(gerar_conversas(args.conversas, args.semente))
+        eventos = list(intercalar(conversas, args.simultaneas))
+        estados_iniciais = {}
+    processar = bot_logic.processar_mensagem_shopee
+
+    # 1ª passada: só tempo (tracemalloc distorce as latências)
+    _restaurar_sessoes(estados_iniciais)
+    cache_respostas.limpar()
+    acertos, falhas = cache_respostas.acertos, cache_respostas.falhas
+    latencias = []
+    inicio_total = time.perf_counter()
+    for sessao_id, mensagem in eventos:
+        inicio = time.perf_counter()
+        processar(sessao_id, mensagem)
+        latencias.append(time.perf_counter() - inicio)
+    duracao = time.perf_counter() - inicio_total
+    acertos = cache_respostas.acertos - acertos
+    consultas = acertos + cache_respostas.falhas - falhas
+
+    # 2ª passada: memória retida pelas sessões
+    bot_logic.SESSAO_ESTADOS.clear()
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    _restaurar_sessoes(estados_iniciais)
+    for sessao_id, mensagem in eventos:
+        processar(sessao_id, mensagem)
+    gc.collect()
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    resumo = _resumo(latencias, duracao, len(eventos), len(bot_logic.SESSAO_ESTADOS), depois - antes)
+    resumo['cache_taxa_acerto'] = round(acertos / consultas, 3) if consultas else 0.0
+    return resumo
+
+# -------------------------------------------------
+# Modo HTTP (webhook do server.py + stub da Shopee API)
+# -------------------------------------------------
+async def _enviar_conversas(porta, conversas, simultaneas):
+    from aiohttp import ClientSession, TCPConnector
+
+    url = f"http://127.0.0.1:{porta}/shopee/webhook"
+    latencias = []
+    fila = iter(enumerate(conversas))
+
+    async with ClientSession(connector=TCPConnector(limit=simultaneas)) as cliente:
+        async def trabalhador():
+            # Cada trabalhador envia uma conversa inteira em ordem, como um cliente real
+            for numero, (_, _, mensagens) in fila:
+                for mensagem in mensagens:
+                    inicio = time.perf_counter()
+                    async with cliente.post(url, json=payload_webhook(numero, mensagem)) as resp:
+                        await resp.read()
+                    latencias.append(time.perf_counter() - inicio)
+
+        inicio_total = time.perf_counter()
+        await asyncio.gather(*(trabalhador() for _ in range(simultaneas)))
+        duracao = time.perf_counter() - inicio_total
+    return latencias, duracao
+
+def medir_http(args):
+    conversas = list(gerar_conversas(args.conversas, args.semente))
+    porta_stub = porta_livre()
+    porta = porta_livre()
+    # O servidor roda em um diretório temporário (arquivos de pedido) com uma cópia das regras
+    diretorio_trabalho = tempfile.mkdtemp(prefix="bench_conversas_")
+    for arquivo in glob.glob(os.path.join(DIRETORIO_REPO, "RegrasLoja_v2*.txt")):   # com as traduções
+        shutil.copy(arquivo, diretorio_trabalho)
+    env = dict(os.environ)
+    env.update({
+        'SHOPEE_PARTNER_ID': env.get('SHOPEE_PARTNER_ID', '1'),
+        'SHOPEE_API_KEY': env.get('SHOPEE_API_KEY', 'bench'),
+        'SHOPEE_API_SECRET': env.get('SHOPEE_API_SECRET', 'bench'),
+        'SHOPEE_SHOP_ID': env.get('SHOPEE_SHOP_ID', '1'),
+        'SHOPEE_ACCESS_TOKEN_PLACEHOLDER': 'token-bench',
+        'SHOPEE_BASE_URL': f"http://127.0.0.1:{porta_stub}",
+        'PYTHONPATH': DIRETORIO_REPO,
+    })
+
+    stub = subprocess.Popen([sys.executable, os.path.join(DIRETORIO_REPO, "bench_servidor.py"),
+                             "--stub", str(porta_stub), "--latencia-shopee-ms", str(args.latencia_shopee_ms)])
+    # Um worker só: as sessões ficam na memória do processo
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", "1", "--threads", str(args.simultaneas),
+         "-b", f"127.0.0.1:{porta}", "server:app"],
+        cwd=diretorio_trabalho, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        esperar_porta(porta_stub)
+        esperar_porta(porta)
+        time.sleep(1)
+        rss_antes = rss_arvore_kb(servidor.pid)
+        latencias, duracao = asyncio.run(_enviar_conversas(porta, conversas, args.simultaneas))
+        rss_depois = rss_arvore_kb(servidor.pid)
+    finally:
+        servidor.terminate()
+        stub.terminate()
+        servidor.wait(timeout=30)
+        stub.wait(timeout=30)
+
+    return _resumo(latencias, duracao, len(latencias), len(conversas), (rss_depois - rss_antes) * 1024)
+
+# -------------------------------------------------
+# Comparação com baseline
+# -------------------------------------------------
+def comparar(resultados, baseline, tolerancia):
+    """Retorna a lista de regressões (texto) em relação ao baseline."""
+    regressoes = []
+    for modo, atual in resultados.items():
+        anterior = baseline.get(modo)
+        if not anterior:
+            continue
+        if atual['mensagens_s'] < anterior['mensagens_s'] * (1 - tolerancia):
+            regressoes.append(f"{modo}: vazão caiu de {anterior['mensagens_s']} para {atual['mensagens_s']} msg/s")
+        if atual['p99_us'] > anterior['p99_us'] * (1 + tolerancia):
+            regressoes.append(f"{modo}: p99 subiu de {anterior['p99_us']} para {atual['p99_us']} µs")
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de conversas sintéticas (vazão, latência e memória).")
+    parser.add_argument('--modos', default='direto', help="Modos separados por vírgula: direto, http")
+    parser.add_argument('--conversas', type=int, default=5000)
+    parser.add_argument('--simultaneas', type=int, default=50, help="Conversas abertas ao mesmo tempo")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--latencia-shopee-ms', type=int, default=0)
+    parser.add_argument('--transcricoes', nargs='+', metavar='ARQUIVO',
+                        help="Transcrições .jsonl do gravador.py (só no modo direto)")
+    parser.add_argument('--salvar-baseline', metavar='ARQUIVO')
+    parser.add_argument('--comparar', metavar='ARQUIVO')
+    parser.add_argument('--tolerancia', type=float, default=0.15)
+    args = parser.parse_args()
+    for caminho in ('salvar_baseline', 'comparar'):
+        if getattr(args, caminho):
+            setattr(args, caminho, os.path.abspath(getattr(args, caminho)))
+    if args.transcricoes:
+        args.transcricoes = [os.path.abspath(c) for c in args.transcricoes]
+
+    # As confirmações de pedido gravam arquivos .txt: roda tudo em um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix="bench_conversas_"))
+
+    medidores = {'direto': medir_direto, 'http': medir_http}
+    saida_original = sys.stdout
+    resultados = {}
+    for modo in (m.strip() for m in args.modos.split(',') if m.strip()):
+        # Os prints do bot atrapalham a medição e a leitura do resultado
+        sys.stdout = open(os.devnull, "w")
+        try:
+            resultados[modo] = medidores[modo](args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = saida_original
+
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultados, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"❌ Regressão: {r}")
+        if regressoes:
+            sys.exit(1)
+        print("✅ Sem regressões em relação ao baseline.")
+
+if __name__ == "__main__":
+    main()
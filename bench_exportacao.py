@@ -0,0 +1,121 @@
+# bench_exportacao.py - Benchmark da exportação de pedidos (exportacao.py)
+# -------------------------------------------------
+# Gera um pedidos.jsonl sintético (padrão 1 milhão de capinhas, espalhadas
+# em 30 dias e nos modelos do catálogo) e mede:
+#   - exportação completa de uma fração do arquivo e do arquivo inteiro
+#     (pedidos/s, MB/s e RSS máximo do processo, que deve ficar igual nos
+#     dois casos: a memória não cresce com o tamanho do arquivo);
+#   - exportação incremental depois de acrescentar mais pedidos (cursor).
+#
+# Uso:
+#     python bench_exportacao.py --pedidos 1000000 --incremento 10000
+# -------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import tempfile
+
+import catalogo
+import exportacao
+from conversas_sinteticas import NOMES, TEMAS, ARQUIVOS_FOTO
+
+def _modelos_catalogo():
+    with open(catalogo.ARQUIVO_CATALOGO or catalogo.ARQUIVO_EXEMPLO, encoding="utf-8") as f:
+        return [l.lstrip('!').split('|')[0].strip() for l in f
+                if l.strip() and not l.startswith('#')]
+
+def gerar_pedidos(caminho, quantidade, semente=42, inicio_id=0):
+    """Acrescenta `quantidade` pedidos sintéticos em `caminho` (no formato de pedidos.py)."""
+    rnd = random.Random(semente)
+    modelos = _modelos_catalogo()
+    primeiro_dia = datetime.datetime(2025, 1, 1)
+    with open(caminho, "a", encoding="utf-8") as f:
+        for i in range(inicio_id, inicio_id + quantidade):
+            criado_em = primeiro_dia + datetime.timedelta(seconds=i * 30 * 86400 // max(quantidade, 1))
+            if rnd.random() < 0.7:
+                registro = {'pedido': f"{criado_em:%Y%m%d-%H%M}-{1000 + i}", 'tipo': 'nome',
+                            'modelo': rnd.choice(modelos), 'nome': rnd.choice(NOMES), 'foto': None}
+            else:
+                registro = {'pedido': f"{criado_em:%Y%m%d-%H%M}-{1000 + i}", 'tipo': 'foto',
+                            'modelo': rnd.choice(modelos + TEMAS), 'nome': None, 'foto': rnd.choice(ARQUIVOS_FOTO)}
+            registro['criado_em'] = criado_em.isoformat(timespec='seconds')
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+def _rss_maximo_mb():
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def medir_exportacao(destino, arquivo, desde=None):
+    inicio = time.perf_counter()
+    resumo = exportacao.exportar(destino, desde=desde, arquivo_pedidos=arquivo)
+    duracao = time.perf_counter() - inicio
+    lidos = resumo['cursor'] - resumo['desde']
+    return {
+        'pedidos': resumo['pedidos'],
+        'segundos': round(duracao, 2),
+        'pedidos_por_segundo': round(resumo['pedidos'] / duracao) if duracao else 0,
+        'mb_por_segundo': round(lidos / duracao / 1e6, 1) if duracao else 0.0,
+        'arquivos_criados': resumo['arquivos_criados'],
+        'rss_maximo_mb': _rss_maximo_mb(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da exportação de pedidos.")
+    parser.add_argument('--pedidos', type=int, default=1_000_000)
+    parser.add_argument('--incremento', type=int, default=10_000, help="Pedidos acrescentados antes da exportação incremental")
+    parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix="bench_exportacao_")
+    arquivo = os.path.join(diretorio, "pedidos.jsonl")
+    try:
+        inicio = time.perf_counter()
+        gerar_pedidos(arquivo, args.pedidos)
+        geracao = time.perf_counter() - inicio
+        tamanho_mb = os.path.getsize(arquivo) / 1e6
+
+        # Primeiro só 10% do arquivo: o RSS máximo não deve mudar ao exportar o arquivo inteiro
+        fracao = args.pedidos // 10
+        with open(arquivo, "rb") as f:
+            for _ in range(fracao):
+                f.readline()
+            limite_fracao = f.tell()
+        shutil.copyfile(arquivo, arquivo + ".fracao")
+        with open(arquivo + ".fracao", "r+b") as f:
+            f.truncate(limite_fracao)
+        parcial = medir_exportacao(os.path.join(diretorio, "saida_fracao"), arquivo + ".fracao")
+        completa = medir_exportacao(os.path.join(diretorio, "saida"), arquivo)
+
+        gerar_pedidos(arquivo, args.incremento, semente=7, inicio_id=args.pedidos)
+        incremental = medir_exportacao(os.path.join(diretorio, "saida"), arquivo)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    resultado = {
+        'pedidos_gerados': args.pedidos,
+        'arquivo_mb': round(tamanho_mb, 1),
+        'geracao_segundos': round(geracao, 2),
+        'exportacao_10_por_cento': parcial,
+        'exportacao_completa': completa,
+        'exportacao_incremental': incremental,
+    }
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return 0
+
+    print(f"pedidos.jsonl: {args.pedidos} pedidos, {tamanho_mb:.1f} MB (gerado em {geracao:.1f}s)")
+    for rotulo, r in (("10% do arquivo", parcial), ("arquivo inteiro", completa),
+                      (f"incremental (+{args.incremento})", incremental)):
+        print(f"  {rotulo:<22} {r['pedidos']:>9} pedidos  {r['segundos']:>7.2f}s  "
+              f"{r['pedidos_por_segundo']:>8} pedidos/s  {r['mb_por_segundo']:>6.1f} MB/s  "
+              f"RSS máx {r['rss_maximo_mb']:>6.1f} MB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# bench_inicializacao.py - Benchmark de partida a frio (import e boot do gunicorn)
+# -------------------------------------------------
+# Mede:
+#   - tempo de import de bot_logic, server e server_async em um
+#     interpretador novo (mediana de várias execuções);
+#   - tempo até a primeira resposta do gunicorn (gunicorn.conf.py) com e
+#     sem --preload, e a memória dos workers depois da subida: RSS, PSS
+#     (páginas compartilhadas divididas entre os processos) e memória
+#     privada por worker.
+#
+# Uso:
+#     python bench_inicializacao.py --workers 4 --repeticoes 5
+# -------------------------------------------------
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+
+from bench_servidor import DIRETORIO_REPO, porta_livre
+
+CODIGO_IMPORT = (
+    "import time; inicio = time.perf_counter(); import {modulo}; "
+    "print(time.perf_counter() - inicio)"
+)
+
+def _ambiente(diretorio_trabalho):
+    env = dict(os.environ)
+    env.update({
+        'SHOPEE_PARTNER_ID': env.get('SHOPEE_PARTNER_ID', '1'),
+        'SHOPEE_API_KEY': env.get('SHOPEE_API_KEY', 'bench'),
+        'SHOPEE_API_SECRET': env.get('SHOPEE_API_SECRET', 'bench'),
+        'SHOPEE_SHOP_ID': env.get('SHOPEE_SHOP_ID', '1'),
+        'PYTHONPATH': DIRETORIO_REPO,
+    })
+    return env
+
+# -------------------------------------------------
+# Import a frio
+# -------------------------------------------------
+def medir_import(modulo, repeticoes, diretorio_trabalho):
+    """Mediana (ms) do tempo de import e do tempo total do processo python."""
+    tempos_import = []
+    tempos_processo = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = subprocess.run([sys.executable, "-c", CODIGO_IMPORT.format(modulo=modulo)],
+                               cwd=diretorio_trabalho, env=_ambiente(diretorio_trabalho),
+                               capture_output=True, text=True, check=True).stdout
+        tempos_processo.append(time.perf_counter() - inicio)
+        tempos_import.append(float(saida.strip().splitlines()[-1]))
+    return {
+        'import_ms': round(statistics.median(tempos_import) * 1000, 1),
+        'processo_ms': round(statistics.median(tempos_processo) * 1000, 1),
+    }
+
+# -------------------------------------------------
+# Boot do gunicorn
+# -------------------------------------------------
+def _filhos(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+def _memoria_kb(pid):
+    """(RSS, PSS, privada) em kB, de /proc/<pid>/smaps_rollup (Linux)."""
+    valores = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linha in f:
+            partes = linha.split()
+            if len(partes) >= 2 and partes[1].isdigit():
+                valores[partes[0].rstrip(':')] = int(partes[1])
+    privada = valores.get('Private_Clean', 0) + valores.get('Private_Dirty', 0)
+    return valores.get('Rss', 0), valores.get('Pss', 0), privada
+
+def _esperar_resposta(porta, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{porta}/", timeout=1) as resposta:
+                if resposta.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.005)
+    raise RuntimeError(f"gunicorn não respondeu na porta {porta} em {timeout}s")
+
+def medir_gunicorn(preload, workers, diretorio_trabalho):
+    porta = porta_livre()
+    env = _ambiente(diretorio_trabalho)
+    env['GUNICORN_PRELOAD'] = '1' if preload else '0'
+    inicio = time.perf_counter()
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(DIRETORIO_REPO, "gunicorn.conf.py"),
+         "-w", str(workers), "-b", f"127.0.0.1:{porta}"],
+        cwd=diretorio_trabalho, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _esperar_resposta(porta)
+        primeira_resposta = time.perf_counter() - inicio
+        # Espera todos os workers subirem antes de medir a memória
+        limite = time.time() + 30
+        while len(_filhos(servidor.pid)) < workers and time.time() < limite:
+            time.sleep(0.05)
+        time.sleep(1)
+        processos = [servidor.pid] + _filhos(servidor.pid)
+        memorias = [_memoria_kb(pid) for pid in processos]
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+    privada_workers = [m[2] for m in memorias[1:]]
+    return {
+        'preload': preload,
+        'workers': workers,
+        'primeira_resposta_ms': round(primeira_resposta * 1000, 1),
+        'rss_total_mb': round(sum(m[0] for m in memorias) / 1024, 1),
+        'pss_total_mb': round(sum(m[1] for m in memorias) / 1024, 1),
+        'privada_por_worker_mb': round(statistics.mean(privada_workers) / 1024, 1) if privada_workers else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de partida a frio (import e boot do gunicorn).")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--modulos', default='bot_logic,server,server_async')
+    parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    # Roda em um diretório temporário com uma cópia das regras (como nos outros benchmarks)
+    diretorio_trabalho = tempfile.mkdtemp(prefix="bench_inicializacao_")
+    for arquivo in glob.glob(os.path.join(DIRETORIO_REPO, "RegrasLoja_v2*.txt")):   # com as traduções
+        shutil.copy(arquivo, diretorio_trabalho)
+    try:
+        imports = {modulo: medir_import(modulo, args.repeticoes, diretorio_trabalho)
+                   for modulo in args.modulos.split(',')}
+        boots = [medir_gunicorn(preload, args.workers, diretorio_trabalho) for preload in (False, True)]
+    finally:
+        shutil.rmtree(diretorio_trabalho, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'imports': imports, 'gunicorn': boots}, indent=2))
+        return 0
+
+    print(f"Import a frio (mediana de {args.repeticoes}):")
+    for modulo, r in imports.items():
+        print(f"  {modulo:<14} import {r['import_ms']:>7.1f} ms   processo {r['processo_ms']:>7.1f} ms")
+    print(f"gunicorn com {args.workers} workers:")
+    for r in boots:
+        print(f"  preload={'sim' if r['preload'] else 'não':<4} primeira resposta {r['primeira_resposta_ms']:>7.1f} ms   "
+              f"RSS {r['rss_total_mb']:>6.1f} MB   PSS {r['pss_total_mb']:>6.1f} MB   "
+              f"privada/worker {r['privada_por_worker_mb']:>5.1f} MB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
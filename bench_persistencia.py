@@ -0,0 +1,120 @@
+# bench_persistencia.py - Benchmark do snapshot + WAL das sessões
+# -------------------------------------------------
+# Mede, para N sessões (padrão 1 milhão):
+#   - tempo para gravar o snapshot e a maior espera pela TRAVA_SESSOES
+#     (a pausa que uma mensagem sentiria) enquanto ele roda;
+#   - custo de acrescentar um registro no WAL (p50/p99);
+#   - custo por mensagem do processar_mensagem_shopee sem e com WAL;
+#   - tempo de restauração (snapshot + WAL) na subida.
+#
+# Uso:
+#     python bench_persistencia.py --sessoes 1000000 --registros-wal 100000
+# -------------------------------------------------
+
+import os
+import sys
+import time
+import pickle
+import threading
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+import bot_logic
+import persistencia
+from conversas_sinteticas import gerar_conversas, intercalar
+from bench_servidor import percentil
+
+def _estados_modelo(quantidade):
+    """Estados de sessão realistas, tirados de conversas sintéticas em andamento."""
+    eventos = list(intercalar(gerar_conversas(quantidade, semente=7), 50))
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        # Para no meio das conversas, para ter sessões em vários pontos dos fluxos
+        for sessao_id, mensagem in eventos[:len(eventos) * 2 // 3]:
+            bot_logic.processar_mensagem_shopee(sessao_id, mensagem)
+    modelos = [pickle.dumps(e, protocol=pickle.HIGHEST_PROTOCOL) for e in bot_logic.SESSAO_ESTADOS.values()]
+    bot_logic.SESSAO_ESTADOS.clear()
+    return modelos
+
+def _medir_mensagens(eventos):
+    latencias = []
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        for sessao_id, mensagem in eventos:
+            inicio = time.perf_counter()
+            bot_logic.processar_mensagem_shopee(sessao_id, mensagem)
+            latencias.append(time.perf_counter() - inicio)
+    latencias.sort()
+    return latencias
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do snapshot + WAL das sessões.")
+    parser.add_argument('--sessoes', type=int, default=1_000_000)
+    parser.add_argument('--registros-wal', type=int, default=100_000)
+    parser.add_argument('--mensagens', type=int, default=3000, help="Conversas usadas para medir o custo por mensagem")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix="bench_persistencia_")
+    os.chdir(diretorio)   # arquivos de pedido das conversas sintéticas
+    dados = os.path.join(diretorio, "dados")
+    try:
+        modelos = _estados_modelo(2000)
+        sessoes = {f"conversa-{i}": pickle.loads(modelos[i % len(modelos)]) for i in range(args.sessoes)}
+        print(f"{len(sessoes)} sessões geradas ({len(modelos)} estados diferentes).")
+
+        # Custo por mensagem sem persistência
+        eventos = list(intercalar(gerar_conversas(args.mensagens, semente=11), 50))
+        sem_wal = _medir_mensagens(eventos)
+        bot_logic.SESSAO_ESTADOS.clear()
+
+        # Liga a persistência (diretório vazio) e mede o snapshot
+        persistencia.PERSISTENCIA_DIR = dados
+        persistencia.SNAPSHOT_A_CADA = 10 ** 12   # snapshots só quando o benchmark pedir
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            persistencia.iniciar(bot_logic.SESSAO_ESTADOS, lambda: bot_logic.PEDIDO_ID_COUNTER,
+                                 bot_logic.TRAVA_SESSOES)
+        bot_logic.SESSAO_ESTADOS.update(sessoes)
+        inicio = time.perf_counter()
+        snapshot = threading.Thread(target=persistencia.snapshot_agora)
+        snapshot.start()
+        maior_espera = 0.0
+        while snapshot.is_alive():
+            antes = time.perf_counter()
+            with bot_logic.TRAVA_SESSOES:
+                maior_espera = max(maior_espera, time.perf_counter() - antes)
+            time.sleep(0.001)
+        snapshot.join()
+        tempo_snapshot = time.perf_counter() - inicio
+        tamanho_snapshot = os.path.getsize(os.path.join(dados, "snapshot"))
+
+        # Custo de acrescentar no WAL
+        chaves = list(sessoes)
+        latencias_wal = []
+        for i in range(args.registros_wal):
+            sessao_id = chaves[(i * 7919) % len(chaves)]
+            inicio = time.perf_counter()
+            persistencia.registrar_sessao(sessao_id, sessoes[sessao_id])
+            latencias_wal.append(time.perf_counter() - inicio)
+        latencias_wal.sort()
+
+        # Custo por mensagem com WAL
+        com_wal = _medir_mensagens(eventos)
+
+        # Restauração
+        inicio = time.perf_counter()
+        restauradas, _, _ = persistencia.carregar(dados)
+        tempo_restauracao = time.perf_counter() - inicio
+
+        print(f"Snapshot: {tempo_snapshot:.2f}s, {tamanho_snapshot / 1024 / 1024:.1f} MB, "
+              f"maior espera pela TRAVA_SESSOES {maior_espera * 1000:.1f} ms")
+        print(f"Append no WAL: p50 {percentil(latencias_wal, 50) * 1e6:.1f} µs, "
+              f"p99 {percentil(latencias_wal, 99) * 1e6:.1f} µs")
+        print(f"Mensagem sem WAL: p50 {percentil(sem_wal, 50) * 1e6:.1f} µs, p99 {percentil(sem_wal, 99) * 1e6:.1f} µs")
+        print(f"Mensagem com WAL: p50 {percentil(com_wal, 50) * 1e6:.1f} µs, p99 {percentil(com_wal, 99) * 1e6:.1f} µs")
+        print(f"Restauração: {len(restauradas)} sessões em {tempo_restauracao:.2f}s "
+              f"(snapshot + {args.registros_wal + len(com_wal)} registros de WAL)")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# bench_servidor.py - Benchmark de carga: Flask+gunicorn x aiohttp
+# -------------------------------------------------
+# Sobe um stub da Shopee API (com latência artificial), sobe o servidor
+# alvo com gunicorn e dispara webhooks concorrentes contra ele.
+# Para cada modo mostra requisições/s, latências p50/p95/p99, o pico de
+# chamadas simultâneas à Shopee por worker (medido no stub) e a memória
+# total (RSS) do gunicorn e seus workers.
+#
+# Uso:
+#     python bench_servidor.py --concorrencia 200 --requisicoes 4000
+#     python bench_servidor.py --modos async --latencia-shopee-ms 200
+# -------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+DIRETORIO_REPO = os.path.dirname(os.path.abspath(__file__))
+
+COMANDOS_SERVIDOR = {
+    'flask': ["server:app", "--threads", "8"],   # como no gunicorn.conf.py
+    'async': ["server_async:criar_app()", "--worker-class", "aiohttp.GunicornWebWorker"],
+}
+
+# -------------------------------------------------
+# Stub da Shopee API (roda em um processo separado)
+# -------------------------------------------------
+def rodar_stub_shopee(porta, latencia_ms):
+    """Servidor que responde como a Shopee API após `latencia_ms` milissegundos."""
+    from aiohttp import web
+
+    estatisticas = {'em_andamento': 0, 'pico': 0}
+
+    async def responder(request):
+        await request.read()
+        estatisticas['em_andamento'] += 1
+        estatisticas['pico'] = max(estatisticas['pico'], estatisticas['em_andamento'])
+        try:
+            await asyncio.sleep(latencia_ms / 1000)
+        finally:
+            estatisticas['em_andamento'] -= 1
+        return web.json_response({"request_id": "bench", "response": {}})
+
+    async def ler_e_zerar_estatisticas(request):
+        pico = estatisticas['pico']
+        estatisticas['pico'] = 0
+        return web.json_response({"pico": pico})
+
+    app = web.Application()
+    app.router.add_get('/_bench/estatisticas', ler_e_zerar_estatisticas)
+    app.router.add_post('/{caminho:.*}', responder)
+    web.run_app(app, host='127.0.0.1', port=porta, print=None, access_log=None)
+
+# -------------------------------------------------
+# Utilitários de processo
+# -------------------------------------------------
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def esperar_porta(porta, timeout=20):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        with socket.socket() as s:
+            if s.connect_ex(('127.0.0.1', porta)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Porta {porta} não abriu em {timeout}s")
+
+def rss_arvore_kb(pid):
+    """Soma o VmRSS (kB) do processo e de todos os seus filhos (Linux /proc)."""
+    total = 0
+    pendentes = [pid]
+    while pendentes:
+        atual = pendentes.pop()
+        try:
+            with open(f"/proc/{atual}/status") as f:
+                for linha in f:
+                    if linha.startswith("VmRSS:"):
+                        total += int(linha.split()[1])
+            with open(f"/proc/{atual}/task/{atual}/children") as f:
+                pendentes.extend(int(p) for p in f.read().split())
+        except FileNotFoundError:
+            continue
+    return total
+
+# -------------------------------------------------
+# Gerador de carga
+# -------------------------------------------------
+MENSAGENS_CONVERSA = ["oi", "5", "3", "2", "1", "11"]
+
+def payload_webhook(conversation_id, texto):
+    return {
+        "shop_id": 1,
+        "code": 10,
+        "data": {
+            "message": {
+                "conversation_id": conversation_id + 1,   # a Shopee não usa id 0
+                "from_user_id": 900000 + conversation_id,
+                "content": {"text": texto},
+            }
+        },
+    }
+
+async def disparar_carga(porta, concorrencia, total):
+    """Envia `total` webhooks com `concorrencia` requisições simultâneas. Retorna latências e erros."""
+    from aiohttp import ClientSession, TCPConnector
+
+    url = f"http://127.0.0.1:{porta}/shopee/webhook"
+    latencias = []
+    erros = 0
+    proximo = 0
+
+    async with ClientSession(connector=TCPConnector(limit=concorrencia)) as cliente:
+        async def trabalhador():
+            nonlocal proximo, erros
+            while proximo < total:
+                i = proximo
+                proximo += 1
+                conversa = i % max(1, total // len(MENSAGENS_CONVERSA))
+                texto = MENSAGENS_CONVERSA[(i // max(1, total // len(MENSAGENS_CONVERSA))) % len(MENSAGENS_CONVERSA)]
+                inicio = time.perf_counter()
+                try:
+                    async with cliente.post(url, json=payload_webhook(conversa, texto)) as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            erros += 1
+                except Exception:
+                    erros += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio_total = time.perf_counter()
+        await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio_total
+
+    return latencias, erros, duracao
+
+def pico_chamadas_stub(porta_stub):
+    """Lê (e zera) o pico de chamadas simultâneas recebidas pelo stub."""
+    from urllib.request import urlopen
+    with urlopen(f"http://127.0.0.1:{porta_stub}/_bench/estatisticas") as resp:
+        return json.loads(resp.read())['pico']
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    idx = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[idx]
+
+# -------------------------------------------------
+# Execução de um modo
+# -------------------------------------------------
+def medir_modo(modo, args, porta_stub):
+    porta = porta_livre()
+    env = dict(os.environ)
+    env.update({
+        'SHOPEE_PARTNER_ID': env.get('SHOPEE_PARTNER_ID', '1'),
+        'SHOPEE_API_KEY': env.get('SHOPEE_API_KEY', 'bench'),
+        'SHOPEE_API_SECRET': env.get('SHOPEE_API_SECRET', 'bench'),
+        'SHOPEE_SHOP_ID': env.get('SHOPEE_SHOP_ID', '1'),
+        'SHOPEE_ACCESS_TOKEN_PLACEHOLDER': 'token-bench',
+        'SHOPEE_BASE_URL': f"http://127.0.0.1:{porta_stub}",
+    })
+    comando = [sys.executable, "-m", "gunicorn", "-w", str(args.workers),
+               "-b", f"127.0.0.1:{porta}", "--timeout", "120"] + COMANDOS_SERVIDOR[modo]
+    servidor = subprocess.Popen(comando, cwd=DIRETORIO_REPO, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        esperar_porta(porta)
+        time.sleep(1)   # dá tempo de todos os workers subirem
+        rss_ocioso = rss_arvore_kb(servidor.pid)
+        pico_chamadas_stub(porta_stub)
+        latencias, erros, duracao = asyncio.run(disparar_carga(porta, args.concorrencia, args.requisicoes))
+        rss_carga = rss_arvore_kb(servidor.pid)
+        pico_chamadas = pico_chamadas_stub(porta_stub)
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+    latencias.sort()
+    vazao = len(latencias) / duracao if duracao else 0.0
+    return {
+        'modo': modo,
+        'workers': args.workers,
+        'requisicoes_s': round(vazao, 1),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 1),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 1),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 1),
+        'chamadas_simultaneas_por_worker': round(pico_chamadas / args.workers, 1),
+        'erros': erros,
+        'rss_ocioso_mb': round(rss_ocioso / 1024, 1),
+        'rss_carga_mb': round(rss_carga / 1024, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga do webhook (Flask x aiohttp).")
+    parser.add_argument('--modos', default='flask,async', help="Modos separados por vírgula: flask, async")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--concorrencia', type=int, default=100)
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    parser.add_argument('--latencia-shopee-ms', type=int, default=100)
+    parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON")
+    parser.add_argument('--stub', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub:
+        rodar_stub_shopee(args.stub, args.latencia_shopee_ms)
+        return
+
+    porta_stub = porta_livre()
+    stub = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--stub", str(porta_stub),
+                             "--latencia-shopee-ms", str(args.latencia_shopee_ms)])
+    try:
+        esperar_porta(porta_stub)
+        resultados = [medir_modo(modo.strip(), args, porta_stub) for modo in args.modos.split(',') if modo.strip()]
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    colunas = list(resultados[0].keys()) if resultados else []
+    print(" | ".join(colunas))
+    for r in resultados:
+        print(" | ".join(str(r[c]) for c in colunas))
+
+if __name__ == "__main__":
+    main()
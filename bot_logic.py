@@ -2,16 +2,38 @@ import datetime
 import random
 import re
 import os
+import time
+import threading
+
+import metricas
+import perfil
+import gravador
+import persistencia
+import agendador
+import atendimentos
+import cache_respostas
+import catalogo
+import pedidos
+import analise
+import idioma
 
 # --- Variáveis Globais (agora para armazenar estados por sessão) ---
 # Dicionário para armazenar o estado de cada sessão (conversation_id da Shopee)
 # Ex: { 'conversation_id_1': { 'ATENDIMENTO_HUMANO_ATIVO': False, 'MEMORIA_USUARIO': {}, ... },
 #       'conversation_id_2': { ... } }
 SESSAO_ESTADOS = {}
+metricas.SESSOES_ATIVAS.funcao = lambda: len(SESSAO_ESTADOS)
+# As expirações agendadas rodam em outra thread: mensagens e expirações alteram sessões sob esta trava
+TRAVA_SESSOES = threading.RLock()
 
 PEDIDO_ID_COUNTER = 1000 # Contador para gerar IDs de pedido (pode ser global, ou por loja)
 FINALIZACAO_ATENDENTE_HUMANO_FRASE = "Estou finalizando meu atendimento por aqui, se precisar de mais alguma coisa é só chamar"
 
+# Prazos das expirações agendadas (em horas)
+TIMEOUT_ATENDIMENTO_HUMANO_HORAS = float(os.getenv('TIMEOUT_ATENDIMENTO_HUMANO_HORAS', '24'))  # atendente nunca finalizou
+TIMEOUT_FLUXO_OCIOSO_HORAS = float(os.getenv('TIMEOUT_FLUXO_OCIOSO_HORAS', '2'))              # cliente parou no meio de um fluxo
+TIMEOUT_CARRINHO_HORAS = float(os.getenv('TIMEOUT_CARRINHO_HORAS', '24'))                     # personalização não confirmada
+
 # --- Funções Auxiliares ---
 
 def get_sessao_estado(sessao_id):
@@ -23,14 +45,33 @@ def get_sessao_estado(sessao_id):
             'ULTIMA_INTERACAO_ATENDENTE_HUMANO': None,
             'CONVERSA_ENCAMINHADA_HUMANO': False,
             'PRIMEIRA_MENSAGEM_RECEBIDA': False,
+            'IDIOMA': None,   # None até a detecção ter certeza (ver processar_mensagem_shopee)
         }
     return SESSAO_ESTADOS[sessao_id]
 
+def encaminhar_para_humano(sessao):
+    """Passa a conversa para o atendente humano (a assistente fica em silêncio)."""
+    if not sessao['CONVERSA_ENCAMINHADA_HUMANO']:
+        metricas.ENCAMINHAMENTOS_HUMANO.inc()
+    sessao['ATENDIMENTO_HUMANO_ATIVO'] = True
+    sessao['CONVERSA_ENCAMINHADA_HUMANO'] = True
+    sessao['ENCAMINHADO_EM'] = datetime.datetime.now()
+    sessao['AGUARDANDO_ATENDENTE_DESDE'] = sessao['ENCAMINHADO_EM']
+
+def encerrar_atendimento_humano(sessao):
+    """Devolve a conversa para a assistente virtual, descartando o fluxo que estava em andamento."""
+    sessao['ATENDIMENTO_HUMANO_ATIVO'] = False
+    sessao['CONVERSA_ENCAMINHADA_HUMANO'] = False
+    sessao['ENCAMINHADO_EM'] = None
+    sessao['AGUARDANDO_ATENDENTE_DESDE'] = None
+    sessao['MEMORIA_USUARIO'] = {}
+
 def gerar_id_pedido():
     """Gera um ID de pedido único."""
     global PEDIDO_ID_COUNTER
     data_hora = datetime.datetime.now().strftime("%Y%m%d-%H%M")
     PEDIDO_ID_COUNTER += 1
+    persistencia.registrar_contador(PEDIDO_ID_COUNTER)
     return f"{data_hora}-{PEDIDO_ID_COUNTER}"
 
 def salvar_personalizacao_nome_txt(nome_gravado, pedido_id, modelo_celular):
@@ -46,10 +87,11 @@ def salvar_personalizacao_nome_txt(nome_gravado, pedido_id, modelo_celular):
     nome_arquivo_limpo = re.sub(r'[\\/*?:"<>|]', "", nome_gravado)
     filename = os.path.join(diretorio, f"{nome_arquivo_limpo}_{pedido_id}.txt")
 
-    with open(filename, "w", encoding="utf-8") as f:
+    with perfil.fase('arquivo'), open(filename, "w", encoding="utf-8") as f:
         f.write(f"ID_Pedido: {pedido_id}\n")
         f.write(f"Nome Gravado: {nome_gravado}\n")
         f.write(f"Modelo do Celular: {modelo_celular}\n")
+    pedidos.registrar_pedido(pedido_id, 'nome', modelo_celular, nome=nome_gravado)
     return filename
 
 def salvar_personalizacao_foto_txt(modelo_tema, nome_arquivo_foto, pedido_id):
@@ -65,13 +107,28 @@ def salvar_personalizacao_foto_txt(modelo_tema, nome_arquivo_foto, pedido_id):
     nome_arquivo_limpo = re.sub(r'[\\/*?:"<>|]', "", modelo_tema)
     filename = os.path.join(diretorio, f"{nome_arquivo_limpo}_{pedido_id}.txt")
 
-    with open(filename, "w", encoding="utf-8") as f:
+    with perfil.fase('arquivo'), open(filename, "w", encoding="utf-8") as f:
         f.write(f"ID_Pedido: {pedido_id}\n")
         f.write(f"Modelo/Tema: {modelo_tema}\n")
         f.write(f"Nome do Arquivo da Foto: {nome_arquivo_foto}\n")
+    pedidos.registrar_pedido(pedido_id, 'foto', modelo_tema, foto=nome_arquivo_foto)
     return filename
 
-def carregar_regras_loja(filepath="RegrasLoja_v2.txt"):
+# Regras da loja e textos fixos dos fluxos, por idioma. O português é o arquivo base
+# (RegrasLoja_v2.txt, TextosBot.txt) e cada tradução fica ao lado dele com o código do
+# idioma no nome (RegrasLoja_v2.es.txt, TextosBot.en.txt...). Os textos fixos são da
+# assistente, não da loja, e ficam na pasta deste módulo.
+ARQUIVO_REGRAS = "RegrasLoja_v2.txt"
+ARQUIVO_TEXTOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TextosBot.txt")
+
+def arquivo_idioma(filepath, codigo):
+    """Arquivo de um idioma: RegrasLoja_v2.txt -> RegrasLoja_v2.es.txt (o idioma padrão usa o próprio arquivo)."""
+    if codigo == idioma.IDIOMA_PADRAO:
+        return filepath
+    base, extensao = os.path.splitext(filepath)
+    return f"{base}.{codigo}{extensao}"
+
+def carregar_regras_loja(filepath=ARQUIVO_REGRAS):
     """Carrega as regras da loja de um arquivo de texto."""
     try:
         with open(filepath, "r", encoding="utf-8") as f:
@@ -96,16 +153,118 @@ RESPOSTA: Olá! Eu sou sua assistente virtual. Como posso te auxiliar hoje?
 RESPOSTA: Seu pedido de personalização com nome já foi registrado. Para alterar um nome já enviado, é necessário falar com um atendente humano. Se deseja prosseguir com o atendimento humano, digite "Falar com atendimento humano". Caso contrário, por favor, escolha outra opção do menu principal.
 """
 
-REGRAS_LOJA = carregar_regras_loja()
+# Ajuste para garantir que não capture "Frases-exemplo para treinamento:" se existir
+PADRAO_REGRA = re.compile(r"✔ (\S+)\n(?:Frases-exemplo para treinamento:.*?\n)?RESPOSTA:\n(.*?)(?=\n----------------------------------------------------------------------|\Z)", re.DOTALL)
+
+def indexar_regras(regras_loja):
+    """Separa o texto das regras em um dicionário {chave: resposta} (vale a primeira ocorrência)."""
+    indice = {}
+    for match in PADRAO_REGRA.finditer(regras_loja):
+        indice.setdefault(match.group(1), match.group(2).strip())
+    return indice
+
+def _carregar_traducao(filepath):
+    """Texto de um arquivo traduzido; se ele não existir, as chaves desse idioma usam o português."""
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"⚠️ AVISO: Arquivo '{filepath}' não encontrado. Esse idioma usará as respostas em português.")
+        return ""
+
+def carregar_idiomas(filepath=ARQUIVO_REGRAS):
+    """Lê as regras e os textos dos fluxos de todos os idiomas: {idioma: (regras, textos)}."""
+    arquivos = {}
+    for codigo in idioma.IDIOMAS:
+        if codigo == idioma.IDIOMA_PADRAO:
+            regras = carregar_regras_loja(filepath)
+        else:
+            regras = _carregar_traducao(arquivo_idioma(filepath, codigo))
+        arquivos[codigo] = (regras, _carregar_traducao(arquivo_idioma(ARQUIVO_TEXTOS, codigo)))
+    return arquivos
+
+def indexar_idiomas(arquivos):
+    """Índice único de regras e textos de todos os idiomas: {(idioma, chave): resposta}."""
+    indice = {}
+    for codigo, textos in arquivos.items():
+        for texto in textos:
+            for chave, resposta in indexar_regras(texto).items():
+                indice.setdefault((codigo, chave), resposta)
+    return indice
+
+REGRAS_LOJA = carregar_idiomas()
+REGRAS_INDICE = indexar_idiomas(REGRAS_LOJA)
+# O detector de idioma aprende os trigramas de cada idioma com os próprios textos da assistente
+idioma.treinar({codigo: "\n".join(textos) for codigo, textos in REGRAS_LOJA.items()})
+
+def recarregar_regras(filepath=ARQUIVO_REGRAS):
+    """
+    Relê os arquivos de regras (e textos) de todos os idiomas sem reiniciar o processo
+    e descarta do cache de respostas só o que dependia das chaves alteradas.
+    Retorna as chaves alteradas ("idioma:CHAVE").
+    """
+    global REGRAS_LOJA, REGRAS_INDICE
+    with TRAVA_SESSOES:
+        novos_arquivos = carregar_idiomas(filepath)
+        novo_indice = indexar_idiomas(novos_arquivos)
+        alteradas = {chave for chave in REGRAS_INDICE.keys() | novo_indice.keys()
+                     if REGRAS_INDICE.get(chave) != novo_indice.get(chave)}
+        REGRAS_LOJA = novos_arquivos
+        REGRAS_INDICE = novo_indice
+        idioma.treinar({codigo: "\n".join(textos) for codigo, textos in REGRAS_LOJA.items()})
+        descartadas = cache_respostas.invalidar_regras(alteradas)
+    print(f"✅ Regras recarregadas de {filepath} (e traduções): {len(alteradas)} alteradas, "
+          f"{descartadas} respostas descartadas do cache.")
+    return sorted(f"{codigo}:{chave}" for codigo, chave in alteradas)
+
+# Regras consultadas e fallback durante a transição que está sendo memoizada (ver _processar_mensagem_shopee)
+_regras_consultadas = None
+_fallback_contado = False
+# Intenções respondidas e fallback da mensagem atual, para a análise (ver processar_mensagem_shopee)
+_intencoes_mensagem = []
+_fallback_mensagem = False
+# Idioma da conversa da mensagem atual (definido em processar_mensagem_shopee, sob TRAVA_SESSOES)
+_idioma_atual = idioma.IDIOMA_PADRAO
+
+def contar_intencao(chave):
+    """Conta uma resposta servida pela regra `chave` (também quando ela vem do cache)."""
+    metricas.INTENCOES.inc(chave)
+    _intencoes_mensagem.append(chave)
+
+def contar_fallback():
+    """Conta uma resposta RESPOSTA_FORA_MENU (também quando ela vem do cache)."""
+    global _fallback_contado, _fallback_mensagem
+    _fallback_contado = True
+    _fallback_mensagem = True
+    metricas.FALLBACKS.inc()
+
+def _buscar_texto(chave):
+    """Resposta da `chave` no idioma da conversa (ou no português, se faltar a tradução), ou None."""
+    if _regras_consultadas is not None:
+        _regras_consultadas.append((_idioma_atual, chave))
+    resposta = REGRAS_INDICE.get((_idioma_atual, chave))
+    if resposta is None and _idioma_atual != idioma.IDIOMA_PADRAO:
+        if _regras_consultadas is not None:
+            _regras_consultadas.append((idioma.IDIOMA_PADRAO, chave))
+        resposta = REGRAS_INDICE.get((idioma.IDIOMA_PADRAO, chave))
+    return resposta
 
 def get_resposta_regra(chave):
-    """Extrai a resposta de uma chave específica do REGRAS_LOJA."""
-    # Ajuste para garantir que não capture "Frases-exemplo para treinamento:" se existir
-    padrao = re.compile(rf"✔ {re.escape(chave)}\n(?:Frases-exemplo para treinamento:.*?\n)?RESPOSTA:\n(.*?)(?=\n----------------------------------------------------------------------|\Z)", re.DOTALL)
-    match = padrao.search(REGRAS_LOJA)
-    if match:
-        return match.group(1).strip()
-    return "Desculpe, não encontrei informações sobre isso no momento. Por favor, digite 'Falar com atendimento humano' para obter ajuda."
+    """Extrai a resposta de uma chave específica das regras da loja, no idioma da conversa."""
+    with perfil.fase('regra'):
+        resposta = _buscar_texto(chave)
+    if resposta is not None:
+        contar_intencao(chave)
+        return resposta
+    return texto_fluxo("REGRA_NAO_ENCONTRADA")
+
+def texto_fluxo(chave, **campos):
+    """Texto fixo de um fluxo (TextosBot) no idioma da conversa, com os {campos} preenchidos."""
+    modelo = _buscar_texto(chave)
+    if modelo is None:
+        print(f"⚠️ AVISO: Texto '{chave}' não encontrado em TextosBot.")
+        return chave
+    return modelo.format(**campos) if campos else modelo
 
 def exibir_saudacao_inicial():
     """Retorna a saudação inicial."""
@@ -121,6 +280,147 @@ def exibir_submenu_duvidas():
 
 # --- Funções de Processamento de Fluxos ---
 
+# Comandos que o cliente digita, aceitos em qualquer idioma (cada idioma ensina a sua forma nos textos)
+COMANDOS_VOLTAR = ('voltar', 'volver', 'back')
+RESPOSTAS_SIM = ('sim', 'sí', 'si', 'yes')
+RESPOSTAS_NAO = ('não', 'nao', 'no')
+COMANDOS_SAIR = ('sair', 'salir', 'exit')
+COMANDOS_MENU = ('menu', 'menu principal', 'menú', 'menú principal', 'main menu')
+SAUDACOES = ('olá', 'oi', 'tudo bem', 'hola', 'hello', 'hi')
+AGRADECIMENTOS = ('obrigado', 'obrigada', 'gracias', 'thanks', 'thank you')
+COMANDOS_FALAR_HUMANO = ('falar com atendimento humano', 'falar com atendente', 'hablar con un agente', 'talk to an agent')
+COMANDOS_CANCELAR_HUMANO = ('cancelar atendimento humano', 'cancelar atención humana', 'cancel agent')
+PALAVRAS_DEVOLUCAO = ("reembolso", "devolução", "dinheiro de volta", "devolución", "refund")
+PALAVRAS_CAPINHA = ('capinha', 'funda', 'case')   # "Capinha 1, ..." nas correções
+PADRAO_CORRECAO_NOME = re.compile(r'^(?:(?:capinha|funda|case)\s*(\d+),\s*)?(.*)$', re.IGNORECASE)
+
+# Pedidos com várias capinhas podem vir numa mensagem só: um item por linha ou separados por ';'
+PADRAO_SEPARADOR_ITENS = re.compile(r"[\n;]")
+PADRAO_ARQUIVO_FOTO = re.compile(r"\.(jpg|jpeg|png|gif)$", re.IGNORECASE)
+
+def separar_itens(texto):
+    """Divide uma mensagem em itens (um por linha ou separados por ';'), ignorando os vazios."""
+    return [item.strip() for item in PADRAO_SEPARADOR_ITENS.split(texto) if item.strip()]
+
+def interpretar_item_nome(texto):
+    """'modelo, nome' -> ({'modelo', 'nome'}, None) ou (None, motivo do erro)."""
+    partes = [p.strip() for p in texto.split(',', 1)]
+    if len(partes) < 2 or not partes[0]:
+        return None, texto_fluxo("NOME_ITEM_SEM_VIRGULA")
+    modelo = catalogo.canonizar_modelo(partes[0]) or partes[0]
+    nome_gravado = re.sub(r'^(nome\s*)', '', partes[1], flags=re.IGNORECASE).strip()
+    if len(nome_gravado) > 20 or not re.match(r'^[a-zA-ZÀ-ÿ\s]+$', nome_gravado):
+        return None, texto_fluxo("NOME_ITEM_INVALIDO", nome=nome_gravado)
+    return {'modelo': modelo, 'nome': nome_gravado}, None
+
+def interpretar_item_foto(texto):
+    """'modelo ou tema, arquivo da foto' -> ({'tema', 'nome_arquivo_foto'}, None) ou (None, motivo do erro)."""
+    partes = [p.strip() for p in texto.rsplit(',', 1)]   # o tema pode ter vírgula, o arquivo é o último campo
+    if len(partes) < 2 or not partes[0]:
+        return None, texto_fluxo("FOTO_ITEM_SEM_VIRGULA")
+    if not PADRAO_ARQUIVO_FOTO.search(partes[1]):
+        return None, texto_fluxo("FOTO_ITEM_ARQUIVO_INVALIDO", arquivo=partes[1])
+    tema = catalogo.canonizar_modelo(partes[0]) or partes[0]
+    return {'tema': tema, 'nome_arquivo_foto': partes[1]}, None
+
+def chave_item(item):
+    """Identifica uma capinha do pedido, sem diferenciar maiúsculas ('iPhone 13, Ana' == 'iphone 13, ana')."""
+    return tuple(str(valor).casefold() for _, valor in sorted(item.items()))
+
+def adicionar_itens(MEMORIA_USUARIO, tipo, itens, interpretar):
+    """
+    Valida todos os itens de uma vez e guarda os válidos em detalhes_personalizacao_<tipo>.
+    A quantidade informada pelo cliente é o limite do pedido: cada linha aceita ou com erro
+    (que o cliente vai reenviar) ocupa uma capinha e as linhas além dela são descartadas.
+    Se o cliente pulou a quantidade, ela passa a ser o número de linhas desta mensagem.
+    Um item igual a um já anotado antes desta mensagem não é anotado de novo (o cliente
+    reenviou a lista inteira depois de um erro).
+    Retorna (quantidade de itens aceitos, lista de erros por linha, linhas descartadas,
+    números das linhas que já estavam no pedido).
+    """
+    detalhes = MEMORIA_USUARIO[f'detalhes_personalizacao_{tipo}']
+    MEMORIA_USUARIO.setdefault(f'quantidade_capinhas_{tipo}', len(detalhes) + len(itens))
+    livres = MEMORIA_USUARIO[f'quantidade_capinhas_{tipo}'] - len(detalhes)
+    ja_anotados = {}
+    for anotado in detalhes:
+        chave = chave_item(anotado)
+        ja_anotados[chave] = ja_anotados.get(chave, 0) + 1
+    aceitos = 0
+    erros = []
+    descartados = 0
+    repetidas = []
+    for numero, texto in enumerate(itens, 1):
+        item, erro = interpretar(texto)
+        if item is not None and ja_anotados.get(chave_item(item)):
+            ja_anotados[chave_item(item)] -= 1
+            repetidas.append(numero)
+            continue
+        if livres <= 0:
+            descartados += 1
+            continue
+        livres -= 1
+        if erro:
+            erros.append(texto_fluxo("ERRO_LINHA", numero=numero, texto=texto, erro=erro))
+        else:
+            detalhes.append(item)
+            aceitos += 1
+    MEMORIA_USUARIO[f'capinha_atual_{tipo}'] = len(detalhes) + 1
+    return aceitos, erros, descartados, repetidas
+
+def aviso_ignorados(MEMORIA_USUARIO, tipo, descartados, repetidas):
+    """
+    Aviso (com quebra de linha) sobre as linhas não anotadas: as que já estavam no pedido
+    e as que passaram da quantidade. '' se todas foram consideradas.
+    """
+    aviso = ""
+    if repetidas:
+        aviso += texto_fluxo("ITENS_JA_ANOTADOS", linhas=", ".join(map(str, repetidas))) + "\n"
+    if descartados:
+        aviso += texto_fluxo("ITENS_ALEM_QUANTIDADE", descartados=descartados,
+                             quantidade=MEMORIA_USUARIO[f'quantidade_capinhas_{tipo}']) + "\n"
+    return aviso
+
+def responder_erros_itens(aceitos, erros, formato):
+    """Resposta para um lote com linhas inválidas: o que foi anotado e o que reenviar."""
+    return texto_fluxo("ITENS_COM_ERROS", aceitos=aceitos, erros="\n".join(erros), formato=formato)
+
+def detalhes_nome(MEMORIA_USUARIO, numerado=False):
+    """Lista das capinhas com nome do pedido, uma por linha."""
+    chave = "NOME_DETALHE_NUMERADO" if numerado else "NOME_DETALHE"
+    return "\n".join(texto_fluxo(chave, capinha=i + 1, modelo=d['modelo'], nome=d['nome'])
+                     for i, d in enumerate(MEMORIA_USUARIO['detalhes_personalizacao_nome']))
+
+def detalhes_foto(MEMORIA_USUARIO):
+    """Lista das capinhas com foto do pedido, uma por linha."""
+    return "\n".join(texto_fluxo("FOTO_DETALHE", capinha=i + 1, tema=d['tema'], foto=d['nome_arquivo_foto'])
+                     for i, d in enumerate(MEMORIA_USUARIO['detalhes_personalizacao_foto']))
+
+def processar_itens_nome(MEMORIA_USUARIO, itens):
+    """Recebe várias capinhas com nome numa mensagem só ('modelo, nome' por linha)."""
+    aceitos, erros, descartados, repetidas = adicionar_itens(MEMORIA_USUARIO, 'nome', itens, interpretar_item_nome)
+    aviso = aviso_ignorados(MEMORIA_USUARIO, 'nome', descartados, repetidas)
+    if erros:
+        MEMORIA_USUARIO['personalizacao_nome_estado'] = 'aguardando_modelo_nome'
+        return aviso + responder_erros_itens(aceitos, erros, texto_fluxo("NOME_ITEM_FORMATO"))
+    if MEMORIA_USUARIO['capinha_atual_nome'] <= MEMORIA_USUARIO['quantidade_capinhas_nome']:
+        MEMORIA_USUARIO['personalizacao_nome_estado'] = 'aguardando_modelo_nome'
+        return aviso + texto_fluxo("NOME_ITENS_PROXIMA", aceitos=aceitos, capinha=MEMORIA_USUARIO['capinha_atual_nome'])
+    MEMORIA_USUARIO['personalizacao_nome_estado'] = 'confirmacao_final'
+    return aviso + texto_fluxo("NOME_CONFIRMAR", detalhes=detalhes_nome(MEMORIA_USUARIO))
+
+def processar_itens_foto(MEMORIA_USUARIO, itens):
+    """Recebe várias capinhas com foto numa mensagem só ('modelo ou tema, arquivo' por linha)."""
+    aceitos, erros, descartados, repetidas = adicionar_itens(MEMORIA_USUARIO, 'foto', itens, interpretar_item_foto)
+    aviso = aviso_ignorados(MEMORIA_USUARIO, 'foto', descartados, repetidas)
+    if erros:
+        MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_modelo_foto'
+        return aviso + responder_erros_itens(aceitos, erros, texto_fluxo("FOTO_ITEM_FORMATO"))
+    if MEMORIA_USUARIO['capinha_atual_foto'] <= MEMORIA_USUARIO['quantidade_capinhas_foto']:
+        MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_modelo_foto'
+        return aviso + texto_fluxo("FOTO_ITENS_PROXIMA", aceitos=aceitos, capinha=MEMORIA_USUARIO['capinha_atual_foto'])
+    MEMORIA_USUARIO['personalizacao_foto_estado'] = 'confirmacao_final'
+    return aviso + texto_fluxo("FOTO_CONFIRMAR", detalhes=detalhes_foto(MEMORIA_USUARIO))
+
 def processar_personalizacao_nome(sessao_id, user_input):
     """Gerencia o fluxo de personalização de capinha com nome."""
     sessao = get_sessao_estado(sessao_id)
@@ -128,41 +428,47 @@ def processar_personalizacao_nome(sessao_id, user_input):
 
     user_input_lower = user_input.lower().strip()
 
-    if user_input_lower == 'voltar':
+    if user_input_lower in COMANDOS_VOLTAR:
         sessao['MEMORIA_USUARIO'] = {} # Limpa a memória da sessão
-        return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+        return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
 
     estado = MEMORIA_USUARIO.get('personalizacao_nome_estado', 'inicio')
 
     if estado == 'inicio':
         MEMORIA_USUARIO['personalizacao_nome_estado'] = 'aguardando_quantidade'
         MEMORIA_USUARIO['detalhes_personalizacao_nome'] = []
+        MEMORIA_USUARIO.pop('quantidade_capinhas_nome', None)
         # Resetar a flag de pedido concluído ao iniciar um novo fluxo
         MEMORIA_USUARIO['personalizacao_nome_concluida_recentemente'] = False
-        return "Certo! Quantas capinhas você gostaria de personalizar com nome? (Ou digite 'Voltar' para o menu principal)"
+        return texto_fluxo("NOME_QUANTIDADE")
 
     elif estado == 'aguardando_quantidade':
         try:
             quantidade = int(user_input)
             if quantidade <= 0:
-                return "Por favor, digite um número válido de capinhas (maior que zero). (Ou digite 'Voltar' para o menu principal)"
+                return texto_fluxo("QUANTIDADE_MAIOR_ZERO")
             MEMORIA_USUARIO['quantidade_capinhas_nome'] = quantidade
             MEMORIA_USUARIO['capinha_atual_nome'] = 1
             MEMORIA_USUARIO['personalizacao_nome_estado'] = 'aguardando_modelo_nome'
-            return (f"Ok! Para a Capinha {MEMORIA_USUARIO['capinha_atual_nome']}: "
-                    "Qual o **modelo do celular ou estampa** e o **nome** que você gostaria de gravar? Lembre-se de separar por vírgula. "
-                    "(Exemplos: 'iPhone 13, Alex', 'Capa verde, José', 'Estampa BS-056, João') (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("NOME_PRIMEIRA_CAPINHA", capinha=MEMORIA_USUARIO['capinha_atual_nome'])
         except ValueError:
-            return "Por favor, digite um número válido. (Ou digite 'Voltar' para o menu principal)"
+            if ',' in user_input:
+                # O cliente pulou a quantidade e já mandou as capinhas
+                return processar_itens_nome(MEMORIA_USUARIO, separar_itens(user_input))
+            return texto_fluxo("NUMERO_INVALIDO")
 
     elif estado == 'aguardando_modelo_nome':
+        itens = separar_itens(user_input)
+        if len(itens) > 1:
+            return processar_itens_nome(MEMORIA_USUARIO, itens)
+
         # Espera "modelo, nome"
         partes = [p.strip() for p in user_input.split(',', 1)]
         if len(partes) < 2:
-            return ("Por favor, digite o modelo do celular ou estampa e o nome separados por vírgula. "
-                    "(Exemplos: 'iPhone 13, Alex', 'Capa verde, José', 'Estampa BS-056, João') (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("NOME_SEPARAR_VIRGULA")
 
-        modelo = partes[0]
+        # Modelos do catálogo são gravados pelo nome canônico ("iphone13" -> "iPhone 13"); estampas ficam como digitadas
+        modelo = catalogo.canonizar_modelo(partes[0]) or partes[0]
         # Remove a palavra "nome" se ela estiver no início do nome gravado
         nome_gravado = re.sub(r'^(nome\s*)', '', partes[1], flags=re.IGNORECASE).strip()
 
@@ -171,34 +477,27 @@ def processar_personalizacao_nome(sessao_id, user_input):
             MEMORIA_USUARIO['modelo_para_correcao'] = modelo
             MEMORIA_USUARIO['nome_para_correcao'] = nome_gravado
             MEMORIA_USUARIO['personalizacao_nome_estado'] = 'aguardando_correcao_nome'
-            return (f"Para que sua capinha com o nome '{nome_gravado}' fique perfeita, "
-                    "diga um nome menor, até 20 caracteres, sem símbolos ou emojis. "
-                    "Ou digite 'Voltar' para o menu principal.")
+            return texto_fluxo("NOME_CORRIGIR", nome=nome_gravado)
 
         MEMORIA_USUARIO['detalhes_personalizacao_nome'].append({'modelo': modelo, 'nome': nome_gravado})
         MEMORIA_USUARIO['capinha_atual_nome'] += 1
 
         if MEMORIA_USUARIO['capinha_atual_nome'] <= MEMORIA_USUARIO['quantidade_capinhas_nome']:
-            return (f"Certo! Para a Capinha {MEMORIA_USUARIO['capinha_atual_nome']}: "
-                    "Qual o **modelo do celular ou estampa** e o **nome** que você gostaria de gravar? Lembre-se de separar por vírgula. "
-                    "(Exemplos: 'Samsung S21, Maria', 'Capa azul, Pedro', 'Estampa BS-057, Ana') (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("NOME_PROXIMA_CAPINHA", capinha=MEMORIA_USUARIO['capinha_atual_nome'])
         else:
             MEMORIA_USUARIO['personalizacao_nome_estado'] = 'confirmacao_final'
-            detalhes_str = "\n".join([f"- Modelo: {d['modelo']}, Nome: {d['nome']}" for d in MEMORIA_USUARIO['detalhes_personalizacao_nome']])
-            return (f"Perfeito! Suas personalizações são:\n{detalhes_str}\n"
-                    "Está tudo correto? (Sim/Não) (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("NOME_CONFIRMAR", detalhes=detalhes_nome(MEMORIA_USUARIO))
 
     elif estado == 'aguardando_correcao_nome':
         # O usuário está corrigindo o nome de uma capinha específica
-        if user_input_lower == 'voltar':
+        if user_input_lower in COMANDOS_VOLTAR:
             sessao['MEMORIA_USUARIO'] = {}
-            return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+            return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
 
         novo_nome = re.sub(r'^(nome\s*)', '', user_input, flags=re.IGNORECASE).strip() # Assume que o usuário está dando apenas o novo nome
 
         if len(novo_nome) > 20 or not re.match(r'^[a-zA-ZÀ-ÿ\s]+$', novo_nome):
-            return (f"Ainda não consegui entender o nome. Por favor, diga um nome menor, até 20 caracteres, "
-                    "sem símbolos ou emojis. (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("NOME_AINDA_INVALIDO")
 
         # Pega o modelo que estava sendo corrigido (do item que causou o erro)
         modelo_corrigido = MEMORIA_USUARIO.get('modelo_para_correcao', 'Modelo Desconhecido')
@@ -206,30 +505,26 @@ def processar_personalizacao_nome(sessao_id, user_input):
         # Se o erro ocorreu ao adicionar um novo item, remove o inválido e adiciona o corrigido
         if 'nome_para_correcao' in MEMORIA_USUARIO:
             MEMORIA_USUARIO['detalhes_personalizacao_nome'].append({'modelo': modelo_corrigido, 'nome': novo_nome})
-            # Não incrementa capinha_atual_nome aqui, pois já foi incrementado antes do erro
-            # e o erro impediu a transição de estado.
-            # Apenas limpa os dados de correção e volta ao fluxo normal.
+            # O nome inválido não chegou a avançar a contagem: a capinha corrigida conta agora
+            MEMORIA_USUARIO['capinha_atual_nome'] = len(MEMORIA_USUARIO['detalhes_personalizacao_nome']) + 1
+            # Limpa os dados de correção e volta ao fluxo normal.
             del MEMORIA_USUARIO['modelo_para_correcao']
             del MEMORIA_USUARIO['nome_para_correcao']
 
             if MEMORIA_USUARIO['capinha_atual_nome'] <= MEMORIA_USUARIO['quantidade_capinhas_nome']:
                 MEMORIA_USUARIO['personalizacao_nome_estado'] = 'aguardando_modelo_nome'
-                return (f"Certo! Para a Capinha {MEMORIA_USUARIO['capinha_atual_nome']}: "
-                        "Qual o **modelo do celular ou estampa** e o **nome** que você gostaria de gravar? Lembre-se de separar por vírgula. "
-                        "(Exemplos: 'Samsung S21, Maria', 'Capa azul, Pedro', 'Estampa BS-057, Ana') (Ou digite 'Voltar' para o menu principal)")
+                return texto_fluxo("NOME_PROXIMA_CAPINHA", capinha=MEMORIA_USUARIO['capinha_atual_nome'])
             else:
                 MEMORIA_USUARIO['personalizacao_nome_estado'] = 'confirmacao_final'
-                detalhes_str = "\n".join([f"- Modelo: {d['modelo']}, Nome: {d['nome']}" for d in MEMORIA_USUARIO['detalhes_personalizacao_nome']])
-                return (f"Perfeito! Suas personalizações são:\n{detalhes_str}\n"
-                        "Está tudo correto? (Sim/Não) (Ou digite 'Voltar' para o menu principal)")
+                return texto_fluxo("NOME_CONFIRMAR", detalhes=detalhes_nome(MEMORIA_USUARIO))
         else:
             # Este caso não deveria ser atingido se o fluxo for sempre de adicionar um novo item
             # e depois corrigir. Mas como fallback, se não houver 'nome_para_correcao',
             # o bot não sabe qual item corrigir.
-            return "Desculpe, não consegui aplicar a correção. Por favor, tente novamente ou digite 'Voltar'."
+            return texto_fluxo("CORRECAO_NAO_APLICADA")
 
     elif estado == 'confirmacao_final':
-        if user_input_lower == 'sim':
+        if user_input_lower in RESPOSTAS_SIM:
             pedido_id = gerar_id_pedido()
             # Loop para salvar cada capinha em um arquivo separado
             for item in MEMORIA_USUARIO['detalhes_personalizacao_nome']:
@@ -238,28 +533,20 @@ def processar_personalizacao_nome(sessao_id, user_input):
             sessao['MEMORIA_USUARIO'] = {} # Limpa a memória após a conclusão do fluxo
             sessao['MEMORIA_USUARIO']['personalizacao_nome_concluida_recentemente'] = True # Marca que um pedido foi concluído
             sessao['MEMORIA_USUARIO']['last_action_completed'] = 'personalizacao_nome_concluida' # Novo estado para gerenciar as opções pós-confirmação
-            return (f"Ótimo! Seu pedido de personalização com nome (ID: {pedido_id}) foi registrado e será processado. "
-                    "Em breve você receberá mais informações. "
-                    "O que você gostaria de fazer agora?\n"
-                    "1 - Voltar ao menu principal\n"
-                    "2 - Sair do atendimento")
-        elif user_input_lower == 'não' or user_input_lower == 'nao':
+            return texto_fluxo("NOME_PEDIDO_REGISTRADO", pedido_id=pedido_id)
+        elif user_input_lower in RESPOSTAS_NAO:
             MEMORIA_USUARIO['personalizacao_nome_estado'] = 'aguardando_correcao_final'
-            detalhes_str = "\n".join([f"- Capinha {i+1}: Modelo: {d['modelo']}, Nome: {d['nome']}" for i, d in enumerate(MEMORIA_USUARIO['detalhes_personalizacao_nome'])])
-            return (f"Ah, entendi! O que você gostaria de corrigir?\n"
-                    f"Suas personalizações atuais são:\n{detalhes_str}\n"
-                    "Por favor, diga o número da capinha e o novo nome. (Ex: Capinha 1, Novo Nome) "
-                    "Ou digite 'Voltar' para o menu principal para recomeçar.")
+            return texto_fluxo("NOME_O_QUE_CORRIGIR", detalhes=detalhes_nome(MEMORIA_USUARIO, numerado=True))
         else:
-            return "Por favor, responda 'Sim' ou 'Não'. (Ou digite 'Voltar' para o menu principal)"
+            return texto_fluxo("RESPONDA_SIM_NAO")
 
     elif estado == 'aguardando_correcao_final':
-        if user_input_lower == 'voltar':
+        if user_input_lower in COMANDOS_VOLTAR:
             sessao['MEMORIA_USUARIO'] = {}
-            return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+            return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
 
         # Tenta extrair o número da capinha e o nome
-        match_capinha_nome = re.match(r'^(?:capinha\s*(\d+),\s*)?(.*)$', user_input_lower, re.IGNORECASE)
+        match_capinha_nome = PADRAO_CORRECAO_NOME.match(user_input_lower)
 
         capinha_idx = -1
         novo_nome = ""
@@ -276,10 +563,7 @@ def processar_personalizacao_nome(sessao_id, user_input):
                 capinha_idx = 0
             else:
                 # Se há múltiplas capinhas e o número não foi especificado
-                return ("Desculpe, não consegui identificar para qual capinha é o novo nome. "
-                        "Por favor, diga o número da capinha e o novo nome. "
-                        "(Exemplos: 'Capinha 1, Novo Nome') "
-                        "Ou digite 'Voltar' para o menu principal.")
+                return texto_fluxo("NOME_QUAL_CAPINHA")
         else:
             # Se não houver match, pode ser apenas um nome, mas precisamos do índice
             # Aqui, se o usuário digitou apenas um nome, e há apenas uma capinha, aplica a ela.
@@ -287,26 +571,19 @@ def processar_personalizacao_nome(sessao_id, user_input):
                 capinha_idx = 0
                 novo_nome = re.sub(r'^(nome\s*)', '', user_input, flags=re.IGNORECASE).strip()
             else:
-                return ("Desculpe, não consegui identificar para qual capinha é o novo nome. "
-                        "Por favor, diga o número da capinha e o novo nome. "
-                        "(Exemplos: 'Capinha 1, Novo Nome') "
-                        "Ou digite 'Voltar' para o menu principal.")
+                return texto_fluxo("NOME_QUAL_CAPINHA")
 
         if not (0 <= capinha_idx < len(MEMORIA_USUARIO['detalhes_personalizacao_nome'])):
-            return "Número de capinha inválido. Por favor, digite um número de capinha existente. (Ou digite 'Voltar' para o menu principal)"
+            return texto_fluxo("CAPINHA_INEXISTENTE")
 
         if len(novo_nome) > 20 or not re.match(r'^[a-zA-ZÀ-ÿ\s]+$', novo_nome):
-            return (f"O nome '{novo_nome}' é inválido. Por favor, diga um nome menor, até 20 caracteres, "
-                    "sem símbolos ou emojis. (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("NOME_INVALIDO", nome=novo_nome)
 
         MEMORIA_USUARIO['detalhes_personalizacao_nome'][capinha_idx]['nome'] = novo_nome
         MEMORIA_USUARIO['personalizacao_nome_estado'] = 'confirmacao_final' # Volta para a confirmação
-        detalhes_str = "\n".join([f"- Modelo: {d['modelo']}, Nome: {d['nome']}" for d in MEMORIA_USUARIO['detalhes_personalizacao_nome']])
-        return (f"Nome da Capinha {capinha_idx+1} atualizado para '{novo_nome}'.\n"
-                f"Suas personalizações são:\n{detalhes_str}\n"
-                "Está tudo correto agora? (Sim/Não) (Ou digite 'Voltar' para o menu principal)")
+        return texto_fluxo("NOME_ATUALIZADO", capinha=capinha_idx + 1, nome=novo_nome, detalhes=detalhes_nome(MEMORIA_USUARIO))
 
-    return "Desculpe, não entendi. Por favor, digite 'Voltar' para o menu principal."
+    return texto_fluxo("NAO_ENTENDI_VOLTAR")
 
 def processar_personalizacao_foto(sessao_id, user_input):
     """Gerencia o fluxo de personalização de capinha com foto."""
@@ -315,68 +592,73 @@ def processar_personalizacao_foto(sessao_id, user_input):
 
     user_input_lower = user_input.lower().strip()
 
-    if user_input_lower == 'voltar':
+    if user_input_lower in COMANDOS_VOLTAR:
         sessao['MEMORIA_USUARIO'] = {}
-        return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+        return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
 
     estado = MEMORIA_USUARIO.get('personalizacao_foto_estado', 'inicio')
 
     if estado == 'inicio':
         MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_quantidade'
         MEMORIA_USUARIO['detalhes_personalizacao_foto'] = []
-        return "Certo! Quantas capinhas você gostaria de personalizar com foto? (Ou digite 'Voltar' para o menu principal)"
+        MEMORIA_USUARIO.pop('quantidade_capinhas_foto', None)
+        return texto_fluxo("FOTO_QUANTIDADE")
 
     elif estado == 'aguardando_quantidade':
         try:
             quantidade = int(user_input)
             if quantidade <= 0:
-                return "Por favor, digite um número válido de capinhas (maior que zero). (Ou digite 'Voltar' para o menu principal)"
+                return texto_fluxo("QUANTIDADE_MAIOR_ZERO")
             MEMORIA_USUARIO['quantidade_capinhas_foto'] = quantidade
             MEMORIA_USUARIO['capinha_atual_foto'] = 1
             MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_modelo_foto'
-            return (f"Ok! Para a Capinha {MEMORIA_USUARIO['capinha_atual_foto']}: "
-                    "Qual o modelo do celular ou tema da capinha? (Ex: iPhone 13, Tema Flores) (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("FOTO_PRIMEIRA_CAPINHA", capinha=MEMORIA_USUARIO['capinha_atual_foto'])
         except ValueError:
-            return "Por favor, digite um número válido. (Ou digite 'Voltar' para o menu principal)"
+            if ',' in user_input:
+                # O cliente pulou a quantidade e já mandou as capinhas
+                return processar_itens_foto(MEMORIA_USUARIO, separar_itens(user_input))
+            return texto_fluxo("NUMERO_INVALIDO")
 
     elif estado == 'aguardando_modelo_foto':
+        itens = separar_itens(user_input)
+        if len(itens) > 1 or (len(itens) == 1 and ',' in itens[0] and PADRAO_ARQUIVO_FOTO.search(itens[0])):
+            # Várias capinhas, ou modelo/tema e foto juntos na mesma mensagem
+            return processar_itens_foto(MEMORIA_USUARIO, itens)
+
         modelo_tema = user_input.strip()
+        modelo_tema = catalogo.canonizar_modelo(modelo_tema) or modelo_tema
         if not modelo_tema:
-            return ("Por favor, digite o modelo do celular ou tema da capinha. "
-                    "(Ex: iPhone 13, Tema Flores) (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("FOTO_PEDIR_MODELO")
 
         # Armazena o modelo/tema temporariamente para a capinha atual
         MEMORIA_USUARIO['modelo_tema_atual_foto'] = modelo_tema
         MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_upload_foto'
-        return (f"Certo, para a Capinha {MEMORIA_USUARIO['capinha_atual_foto']} ({modelo_tema}): "
-                "Agora, por favor, envie a foto que você gostaria de usar. "
-                "(Você pode digitar o nome do arquivo da foto, ex: minha_foto.jpg) (Ou digite 'Voltar' para o menu principal)")
+        return texto_fluxo("FOTO_PEDIR_ARQUIVO", capinha=MEMORIA_USUARIO['capinha_atual_foto'], modelo=modelo_tema)
 
     elif estado == 'aguardando_upload_foto':
         nome_arquivo_foto = user_input.strip()
         # Validação para reconhecer se é um "envio de imagem" (simulado por nome de arquivo)
         if not re.search(r'\.(jpg|jpeg|png|gif)$', nome_arquivo_foto, re.IGNORECASE):
-            return ("Não consegui identificar um arquivo de imagem. Por favor, envie a foto "
-                    "digitando o nome do arquivo (ex: minha_foto.jpg, foto_do_pet.png). "
-                    "(Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("FOTO_NAO_RECONHECIDA")
 
-        modelo_tema = MEMORIA_USUARIO.pop('modelo_tema_atual_foto') # Pega o modelo/tema salvo
+        modelo_tema = MEMORIA_USUARIO.pop('modelo_tema_atual_foto', None) # Pega o modelo/tema salvo
+        if modelo_tema is None:
+            # Sessão restaurada sem o modelo/tema (ex.: gravada por uma versão antiga): pede de novo
+            MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_modelo_foto'
+            return texto_fluxo("FOTO_PEDIR_MODELO")
         MEMORIA_USUARIO['detalhes_personalizacao_foto'].append({'tema': modelo_tema, 'nome_arquivo_foto': nome_arquivo_foto})
         MEMORIA_USUARIO['capinha_atual_foto'] += 1
 
         if MEMORIA_USUARIO['capinha_atual_foto'] <= MEMORIA_USUARIO['quantidade_capinhas_foto']:
             MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_modelo_foto'
-            return (f"Ótimo! Foto recebida para a Capinha {MEMORIA_USUARIO['capinha_atual_foto']-1}. "
-                    f"Agora, para a Capinha {MEMORIA_USUARIO['capinha_atual_foto']}: "
-                    "Qual o modelo do celular ou tema da capinha? (Ex: Samsung S21, Outro Tema) (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("FOTO_RECEBIDA", anterior=MEMORIA_USUARIO['capinha_atual_foto'] - 1,
+                               capinha=MEMORIA_USUARIO['capinha_atual_foto'])
         else:
             MEMORIA_USUARIO['personalizacao_foto_estado'] = 'confirmacao_final'
-            detalhes_str = "\n".join([f"- Capinha {i+1}: Modelo/Tema: {d['tema']}, Foto: {d['nome_arquivo_foto']}" for i, d in enumerate(MEMORIA_USUARIO['detalhes_personalizacao_foto'])])
-            return (f"Perfeito! Suas personalizações com foto são:\n{detalhes_str}\n"
-                    "Está tudo correto? (Sim/Não) (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("FOTO_CONFIRMAR", detalhes=detalhes_foto(MEMORIA_USUARIO))
 
     elif estado == 'confirmacao_final':
-        if user_input_lower == 'sim':
+        if user_input_lower in RESPOSTAS_SIM:
             pedido_id = gerar_id_pedido()
             # Loop para salvar cada capinha em um arquivo separado
             for item in MEMORIA_USUARIO['detalhes_personalizacao_foto']:
@@ -384,56 +666,43 @@ def processar_personalizacao_foto(sessao_id, user_input):
 
             sessao['MEMORIA_USUARIO'] = {} # Limpa a memória após a conclusão
             sessao['MEMORIA_USUARIO']['last_action_completed'] = 'personalizacao_foto_concluida' # Novo estado para gerenciar as opções pós-confirmação
-            return (f"Ótimo! Seu pedido de personalização com foto (ID: {pedido_id}) foi registrado e será processado. "
-                    "Caso haja alguma irregularidade na foto, um atendente humano entrará em contato para resolver. "
-                    "O que você gostaria de fazer agora?\n"
-                    "1 - Voltar ao menu principal\n"
-                    "2 - Sair do atendimento")
-        elif user_input_lower == 'não' or user_input_lower == 'nao':
+            return texto_fluxo("FOTO_PEDIDO_REGISTRADO", pedido_id=pedido_id)
+        elif user_input_lower in RESPOSTAS_NAO:
             MEMORIA_USUARIO['personalizacao_foto_estado'] = 'aguardando_correcao_final'
-            detalhes_str = "\n".join([f"- Capinha {i+1}: Modelo/Tema: {d['tema']}, Foto: {d['nome_arquivo_foto']}" for i, d in enumerate(MEMORIA_USUARIO['detalhes_personalizacao_foto'])])
-            return (f"Ah, entendi! O que você gostaria de corrigir?\n"
-                    f"Suas personalizações atuais são:\n{detalhes_str}\n"
-                    "Por favor, diga o número da capinha, o novo modelo/tema e o nome do arquivo da foto. "
-                    "(Ex: Capinha 1, iPhone 13, nova_foto.jpg) "
-                    "Ou digite 'Voltar' para o menu principal para recomeçar.")
+            return texto_fluxo("FOTO_O_QUE_CORRIGIR", detalhes=detalhes_foto(MEMORIA_USUARIO))
         else:
-            return "Por favor, responda 'Sim' ou 'Não'. (Ou digite 'Voltar' para o menu principal)"
+            return texto_fluxo("RESPONDA_SIM_NAO")
 
     elif estado == 'aguardando_correcao_final':
-        if user_input_lower == 'voltar':
+        if user_input_lower in COMANDOS_VOLTAR:
             sessao['MEMORIA_USUARIO'] = {}
-            return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+            return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
 
         partes = [p.strip() for p in user_input.split(',', 2)] # Divide em até 3 partes
-        if len(partes) < 3 or not partes[0].lower().startswith('capinha'):
-            return ("Formato inválido. Por favor, diga o número da capinha, o novo modelo/tema e o nome do arquivo da foto. "
-                    "(Ex: Capinha 1, iPhone 13, nova_foto.jpg) (Ou digite 'Voltar' para o menu principal)")
+        if len(partes) < 3 or not partes[0].lower().startswith(PALAVRAS_CAPINHA):
+            return texto_fluxo("FOTO_FORMATO_CORRECAO")
 
         try:
-            capinha_idx = int(partes[0].lower().replace('capinha', '').strip()) - 1
-            novo_modelo_tema = partes[1]
+            capinha_idx = int(re.sub(r'^(?:capinha|funda|case)', '', partes[0].lower()).strip()) - 1
+            novo_modelo_tema = catalogo.canonizar_modelo(partes[1]) or partes[1]
             novo_nome_arquivo_foto = partes[2]
 
             if not (0 <= capinha_idx < len(MEMORIA_USUARIO['detalhes_personalizacao_foto'])):
-                return "Número de capinha inválido. Por favor, digite um número de capinha existente. (Ou digite 'Voltar' para o menu principal)"
+                return texto_fluxo("CAPINHA_INEXISTENTE")
 
             if not re.search(r'\.(jpg|jpeg|png|gif)$', novo_nome_arquivo_foto, re.IGNORECASE):
-                return ("Nome de arquivo de foto inválido. Por favor, certifique-se de que termina com .jpg, .jpeg, .png ou .gif. "
-                        "(Ou digite 'Voltar' para o menu principal)")
+                return texto_fluxo("FOTO_ARQUIVO_INVALIDO")
 
             MEMORIA_USUARIO['detalhes_personalizacao_foto'][capinha_idx]['tema'] = novo_modelo_tema
             MEMORIA_USUARIO['detalhes_personalizacao_foto'][capinha_idx]['nome_arquivo_foto'] = novo_nome_arquivo_foto
             MEMORIA_USUARIO['personalizacao_foto_estado'] = 'confirmacao_final' # Volta para a confirmação
-            detalhes_str = "\n".join([f"- Capinha {i+1}: Modelo/Tema: {d['tema']}, Foto: {d['nome_arquivo_foto']}" for i, d in enumerate(MEMORIA_USUARIO['detalhes_personalizacao_foto'])])
-            return (f"Capinha {capinha_idx+1} atualizada para Modelo/Tema: '{novo_modelo_tema}', Foto: '{novo_nome_arquivo_foto}'.\n"
-                    f"Suas personalizações são:\n{detalhes_str}\n"
-                    "Está tudo correto agora? (Sim/Não) (Ou digite 'Voltar' para o menu principal)")
+            return texto_fluxo("FOTO_ATUALIZADA", capinha=capinha_idx + 1, tema=novo_modelo_tema,
+                               foto=novo_nome_arquivo_foto, detalhes=detalhes_foto(MEMORIA_USUARIO))
 
         except ValueError:
-            return "Número de capinha inválido. Por favor, digite 'Capinha X, Modelo/Tema, Nome_Arquivo_Foto'. (Ou digite 'Voltar' para o menu principal)"
+            return texto_fluxo("FOTO_NUMERO_INVALIDO")
 
-    return "Desculpe, não entendi. Por favor, digite 'Voltar' para o menu principal."
+    return texto_fluxo("NAO_ENTENDI_VOLTAR")
 
 def processar_consulta_capinha(sessao_id, user_input):
     """Gerencia o fluxo de consulta de capinhas."""
@@ -442,26 +711,34 @@ def processar_consulta_capinha(sessao_id, user_input):
 
     user_input_lower = user_input.lower().strip()
 
-    if user_input_lower == 'voltar':
+    if user_input_lower in COMANDOS_VOLTAR:
         sessao['MEMORIA_USUARIO'] = {}
-        return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+        return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
 
     estado = MEMORIA_USUARIO.get('consulta_capinha_estado', 'inicio')
 
     if estado == 'inicio':
         MEMORIA_USUARIO['consulta_capinha_estado'] = 'aguardando_modelo_tema'
-        return ("Certo! Qual o modelo de celular ou tema de desenho específico que você gostaria de consultar? "
-                "(Ou digite 'Voltar' para o menu principal)")
+        return texto_fluxo("CONSULTA_PEDIR_MODELO")
 
     elif estado == 'aguardando_modelo_tema':
-        # Aqui, em um sistema real, você faria uma consulta ao banco de dados.
-        # Por enquanto, vamos simular o encaminhamento para o humano.
+        # Modelos de celular são respondidos pelo catálogo (CATALOGO_MODELOS); temas de
+        # desenho (mesmo junto com um modelo) e modelos fora do catálogo vão para o atendente.
+        modelo = catalogo.consultar_modelo(user_input)
+        if modelo is not None:
+            sessao['MEMORIA_USUARIO'] = {}
+            if modelo.disponivel:
+                metricas.CONSULTAS_CATALOGO.inc('disponivel')
+                return texto_fluxo("CONSULTA_DISPONIVEL", modelo=modelo.nome) + "\n" + exibir_menu_principal()
+            metricas.CONSULTAS_CATALOGO.inc('indisponivel')
+            return texto_fluxo("CONSULTA_INDISPONIVEL", modelo=modelo.nome) + "\n" + exibir_menu_principal()
+
+        metricas.CONSULTAS_CATALOGO.inc('desconhecido')
         modelo_tema_consultado = user_input
         MEMORIA_USUARIO['modelo_tema_consultado'] = modelo_tema_consultado
 
         # Encaminha para atendimento humano
-        sessao['ATENDIMENTO_HUMANO_ATIVO'] = True
-        sessao['CONVERSA_ENCAMINHADA_HUMANO'] = True
+        encaminhar_para_humano(sessao)
         MEMORIA_USUARIO['consulta_capinha_estado'] = 'encaminhado_humano' # Marca o estado para não responder mais
         return get_resposta_regra("TRANSFERENCIA_OFERECER")
 
@@ -470,7 +747,7 @@ def processar_consulta_capinha(sessao_id, user_input):
         # O bot não deve responder, a menos que o usuário cancele o atendimento humano.
         return None # O bot fica em silêncio, esperando o humano ou o cancelamento
 
-    return "Desculpe, não entendi. Por favor, digite 'Voltar' para o menu principal."
+    return texto_fluxo("NAO_ENTENDI_VOLTAR")
 
 def processar_devolucao_reembolso(sessao_id, user_input):
     """Processa a solicitação de devolução/reembolso."""
@@ -478,10 +755,44 @@ def processar_devolucao_reembolso(sessao_id, user_input):
     MEMORIA_USUARIO = sessao['MEMORIA_USUARIO']
     # A limpeza da memória e o retorno ao menu principal/saída serão tratados na assistente_virtual_bot
     # para permitir que 'last_flow_options' seja lido.
-    return (get_resposta_regra("ERRO_LOJA_SCRIPT") + "\n" +
-            "O que você gostaria de fazer agora?\n"
-            "1 - Voltar ao menu principal\n"
-            "2 - Sair do atendimento")
+    return get_resposta_regra("ERRO_LOJA_SCRIPT") + "\n" + texto_fluxo("OPCOES_POS_FLUXO")
+
+# Opções 1 a 10 do submenu de dúvidas -> chave da regra com a resposta
+OPCOES_SUBMENU_DUVIDAS = {
+    '1': "LOGISTICA_ATRASO",
+    '2': "COMPRA_INCORRETA",
+    '3': "PAGAMENTO_COMPLETO",
+    '4': "APROVACAO_VER_CAPINHA",
+    '5': "IMAGENS_ILUSTRATIVAS",
+    '6': "MODELO_DESCONHECIDO",
+    '7': "ALTERAR_FONTE_LETRA",
+    '8': "CAPINHA_PROTECAO",
+    '9': "CAPINHA_AMARELA",
+    '10': "CUPOM_DESCONTO",
+}
+
+# Perguntas livres no menu principal: (trechos procurados na mensagem, chave da regra), na ordem de prioridade
+# (português, depois espanhol e inglês; a resposta sai no idioma da conversa)
+PALAVRAS_CHAVE_FAQ = (
+    (("prazo de envio", "recebimento do pedido", "plazo de envío", "shipping time", "delivery time"), "LOGISTICA_ATRASO"),
+    (("comprei errado", "preciso alterar", "compré mal", "wrong item"), "COMPRA_INCORRETA"),
+    (("formas de pagamento", "pagamento", "formas de pago", "payment"), "PAGAMENTO_COMPLETO"),
+    (("ver minha capinha", "aprovar antes do envio", "ver mi funda", "see my case"), "APROVACAO_VER_CAPINHA"),
+    (("imagens do anuncio", "diferentes do meu modelo", "imágenes del anuncio", "listing images"), "IMAGENS_ILUSTRATIVAS"),
+    (("não sei meu modelo de celular", "nao sei meu modelo", "no sé mi modelo", "don't know my phone model"), "MODELO_DESCONHECIDO"),
+    (("mudar o tipo de letra", "alterar fonte", "cambiar el tipo de letra", "change the font"), "ALTERAR_FONTE_LETRA"),
+    (("capinha possui proteção", "proteção da capinha", "funda tiene protección", "case protection"), "CAPINHA_PROTECAO"),
+    (("capinha amarela", "amarela com o tempo", "funda se pone amarilla", "turn yellow"), "CAPINHA_AMARELA"),
+    (("cupom de desconto", "promoção", "cupón de descuento", "discount coupon"), "CUPOM_DESCONTO"),
+)
+
+def buscar_regra_palavra_chave(user_input_lower):
+    """Retorna a chave da regra da primeira pergunta livre encontrada na mensagem (ou None)."""
+    for trechos, chave in PALAVRAS_CHAVE_FAQ:
+        for trecho in trechos:
+            if trecho in user_input_lower:
+                return chave
+    return None
 
 def processar_duvidas_informacoes(sessao_id, user_input):
     """Gerencia o fluxo do submenu de dúvidas e informações."""
@@ -490,81 +801,350 @@ def processar_duvidas_informacoes(sessao_id, user_input):
 
     user_input_lower = user_input.lower().strip()
 
-    if user_input_lower == 'voltar':
+    if user_input_lower in COMANDOS_VOLTAR:
         sessao['MEMORIA_USUARIO'] = {}
-        return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+        return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
 
     estado = MEMORIA_USUARIO.get('duvidas_estado', 'inicio')
 
     if estado == 'inicio':
         MEMORIA_USUARIO['duvidas_estado'] = 'aguardando_opcao_submenu'
-        return exibir_submenu_duvidas() + " (Ou digite 'Voltar' para o menu principal)"
+        return exibir_submenu_duvidas() + " " + texto_fluxo("LEMBRETE_VOLTAR")
 
     elif estado == 'aguardando_opcao_submenu':
-        if user_input_lower == '1':
-            resposta = get_resposta_regra("LOGISTICA_ATRASO")
-        elif user_input_lower == '2':
-            resposta = get_resposta_regra("COMPRA_INCORRETA")
-        elif user_input_lower == '3':
-            resposta = get_resposta_regra("PAGAMENTO_COMPLETO")
-        elif user_input_lower == '4':
-            resposta = get_resposta_regra("APROVACAO_VER_CAPINHA")
-        elif user_input_lower == '5':
-            resposta = get_resposta_regra("IMAGENS_ILUSTRATIVAS")
-        elif user_input_lower == '6':
-            resposta = get_resposta_regra("MODELO_DESCONHECIDO")
-        elif user_input_lower == '7':
-            resposta = get_resposta_regra("ALTERAR_FONTE_LETRA")
-        elif user_input_lower == '8':
-            resposta = get_resposta_regra("CAPINHA_PROTECAO")
-        elif user_input_lower == '9':
-            resposta = get_resposta_regra("CAPINHA_AMARELA")
-        elif user_input_lower == '10':
-            resposta = get_resposta_regra("CUPOM_DESCONTO")
+        if user_input_lower in OPCOES_SUBMENU_DUVIDAS:
+            resposta = get_resposta_regra(OPCOES_SUBMENU_DUVIDAS[user_input_lower])
         elif user_input_lower == '11': # Voltar ao menu principal
             sessao['MEMORIA_USUARIO'] = {}
-            return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+            return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
         elif user_input_lower == '12': # Falar com atendimento Humano
-            sessao['ATENDIMENTO_HUMANO_ATIVO'] = True
-            sessao['CONVERSA_ENCAMINHADA_HUMANO'] = True
+            encaminhar_para_humano(sessao)
             sessao['MEMORIA_USUARIO'] = {} # Limpa a memória para o atendente humano
             return get_resposta_regra("TRANSFERENCIA_OFERECER")
         else:
+            contar_fallback()
             return get_resposta_regra("RESPOSTA_FORA_MENU") + "\n" + exibir_menu_principal()
 
         MEMORIA_USUARIO['duvidas_estado'] = 'apos_resposta_duvida'
-        return (resposta + "\n\nO que você gostaria de fazer agora?\n"
-                "1 - Voltar ao menu principal\n"
-                "2 - Fazer outra pergunta (voltar ao submenu de dúvidas)\n"
-                "3 - Sair do atendimento")
+        return resposta + "\n\n" + texto_fluxo("OPCOES_APOS_DUVIDA")
 
     elif estado == 'apos_resposta_duvida':
         if user_input_lower == '1': # Voltar ao menu principal
             sessao['MEMORIA_USUARIO'] = {}
-            return "Entendido. Voltando ao menu principal.\n" + exibir_menu_principal()
+            return texto_fluxo("VOLTANDO_MENU") + "\n" + exibir_menu_principal()
         elif user_input_lower == '2': # Fazer outra pergunta (voltar ao submenu de dúvidas)
             MEMORIA_USUARIO['duvidas_estado'] = 'aguardando_opcao_submenu'
-            return exibir_submenu_duvidas() + " (Ou digite 'Voltar' para o menu principal)"
+            return exibir_submenu_duvidas() + " " + texto_fluxo("LEMBRETE_VOLTAR")
         elif user_input_lower == '3': # Sair do atendimento
             sessao['MEMORIA_USUARIO'] = {}
             return get_resposta_regra("SAIR_ATENDIMENTO")
         else:
-            return ("Desculpe, não entendi sua escolha. Por favor, selecione uma das opções numeradas:\n"
-                    "1 - Voltar ao menu principal\n"
-                    "2 - Fazer outra pergunta (voltar ao submenu de dúvidas)\n"
-                    "3 - Sair do atendimento")
+            return texto_fluxo("ESCOLHA_INVALIDA_DUVIDA")
+
+    return texto_fluxo("NAO_ENTENDI_VOLTAR")
 
-    return "Desculpe, não entendi. Por favor, digite 'Voltar' para o menu principal."
+# --- Expirações Agendadas (atendimento humano, fluxos ociosos e carrinhos abandonados) ---
+
+def agendar_expiracoes(sessao_id, sessao):
+    """(Re)agenda as expirações da sessão de acordo com o estado atual dela."""
+    MEMORIA_USUARIO = sessao['MEMORIA_USUARIO']
+
+    if sessao['ATENDIMENTO_HUMANO_ATIVO']:
+        # Conta a partir da última ação do atendente (ou do encaminhamento)
+        referencias = [d for d in (sessao.get('ENCAMINHADO_EM'), sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO']) if d]
+        referencia = max(referencias) if referencias else datetime.datetime.now()
+        agendador.agendar(sessao_id, 'atendimento_humano',
+                          referencia.timestamp() + TIMEOUT_ATENDIMENTO_HUMANO_HORAS * 3600)
+    else:
+        agendador.cancelar(sessao_id, 'atendimento_humano')
+
+    ultima_mensagem = sessao.get('ULTIMA_MENSAGEM_CLIENTE') or datetime.datetime.now()
+    if 'personalizacao_nome_estado' in MEMORIA_USUARIO or 'personalizacao_foto_estado' in MEMORIA_USUARIO:
+        agendador.cancelar(sessao_id, 'fluxo_ocioso')
+        agendador.agendar(sessao_id, 'carrinho_abandonado',
+                          ultima_mensagem.timestamp() + TIMEOUT_CARRINHO_HORAS * 3600)
+    elif not sessao['ATENDIMENTO_HUMANO_ATIVO'] and any(campo in MEMORIA_USUARIO for campo in CAMPO_ESTADO_FLUXO.values()):
+        # Só um fluxo parado no meio expira; a memória de um fluxo já concluído
+        # (last_action_completed etc.) não deve trazer a saudação de volta
+        agendador.cancelar(sessao_id, 'carrinho_abandonado')
+        agendador.agendar(sessao_id, 'fluxo_ocioso',
+                          ultima_mensagem.timestamp() + TIMEOUT_FLUXO_OCIOSO_HORAS * 3600)
+    else:
+        agendador.cancelar(sessao_id, 'carrinho_abandonado')
+        agendador.cancelar(sessao_id, 'fluxo_ocioso')
+
+def _expirar(tipo, sessao_id):
+    """Tratador do agendador: devolve a sessão para o início (a próxima mensagem recebe a saudação)."""
+    with TRAVA_SESSOES:
+        sessao = SESSAO_ESTADOS.get(sessao_id)
+        if sessao is None:
+            return
+        if tipo == 'atendimento_humano':
+            if not sessao['ATENDIMENTO_HUMANO_ATIVO']:
+                return
+            encerrar_atendimento_humano(sessao)
+            sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO'] = None
+        else:
+            if identificar_fluxo(sessao) in CAMPO_ESTADO_FLUXO:
+                analise.registrar('abandono', estado_fluxo(sessao))
+            sessao['MEMORIA_USUARIO'] = {}
+        sessao['PRIMEIRA_MENSAGEM_RECEBIDA'] = False
+        metricas.EXPIRACOES.inc(tipo)
+        print(f"⏰ Sessão {sessao_id}: '{tipo}' expirou. A assistente virtual retoma a conversa.")
+        atendimentos.atualizar(sessao_id, sessao)
+        persistencia.registrar_sessao(sessao_id, sessao)
+
+metricas.EXPIRACOES_PENDENTES.funcao = agendador.pendentes
+TIPOS_EXPIRACAO = ('atendimento_humano', 'fluxo_ocioso', 'carrinho_abandonado')
+for _tipo in TIPOS_EXPIRACAO:
+    agendador.registrar_tratador(_tipo, lambda sessao_id, tipo=_tipo: _expirar(tipo, sessao_id))
+
+metricas.ATENDIMENTOS_ABERTOS.funcao = atendimentos.abertos
+
+# --- Inicialização por Processo ---
+# Regras e tabelas são carregadas no import (com gunicorn --preload, uma vez no master e
+# compartilhadas com os workers). Já o estado que é de cada processo (trava do diretório de
+# persistência, WAL aberto, thread do agendador) só pode ser criado depois do fork.
+_pid_inicializado = None
+
+def inicializar_worker():
+    """
+    Restaura as sessões e o contador de pedidos salvos (só se PERSISTENCIA_DIR estiver definida)
+    e reagenda as expirações e a fila de atendimentos. Roda uma vez por processo: chamada pelo
+    post_fork do gunicorn.conf.py ou, em qualquer outro caso, na primeira mensagem.
+    """
+    global PEDIDO_ID_COUNTER, _pid_inicializado
+    with TRAVA_SESSOES:
+        if _pid_inicializado == os.getpid():
+            return
+        _pid_inicializado = os.getpid()
+        metricas.iniciar_gravacao()
+        analise.iniciar()
+        contador_salvo = persistencia.iniciar(SESSAO_ESTADOS, lambda: PEDIDO_ID_COUNTER, TRAVA_SESSOES)
+        if contador_salvo is not None:
+            PEDIDO_ID_COUNTER = contador_salvo
+        # Sessões restauradas do disco voltam a ter suas expirações agendadas e a entrar na fila de atendimentos
+        for sessao_id, sessao in SESSAO_ESTADOS.items():
+            agendar_expiracoes(sessao_id, sessao)
+            atendimentos.atualizar(sessao_id, sessao)
+
+# --- Migração de Sessões entre Nós (ver cluster.py) ---
+
+def remover_sessao(sessao_id):
+    """Tira a sessão deste processo (ela foi para outro nó) e a devolve, ou None se ela não está aqui."""
+    with TRAVA_SESSOES:
+        sessao = SESSAO_ESTADOS.pop(sessao_id, None)
+        if sessao is None:
+            return None
+        for tipo in TIPOS_EXPIRACAO:
+            agendador.cancelar(sessao_id, tipo)
+        atendimentos.remover(sessao_id)
+        persistencia.remover_sessao(sessao_id)
+        return sessao
+
+def adotar_sessao(sessao_id, sessao):
+    """
+    Recebe uma sessão que veio de outro nó. Se este nó já tem a sessão (ela chegou antes
+    por outro caminho), fica a local e retorna False.
+    """
+    if _pid_inicializado != os.getpid():
+        inicializar_worker()
+    with TRAVA_SESSOES:
+        if sessao_id in SESSAO_ESTADOS:
+            return False
+        SESSAO_ESTADOS[sessao_id] = sessao
+        agendar_expiracoes(sessao_id, sessao)
+        atendimentos.atualizar(sessao_id, sessao)
+        persistencia.registrar_sessao(sessao_id, sessao)
+        return True
+
+def identificar_fluxo(sessao):
+    """Retorna o nome do fluxo em que a sessão está (usado como rótulo de métricas)."""
+    MEMORIA_USUARIO = sessao['MEMORIA_USUARIO']
+    if sessao['ATENDIMENTO_HUMANO_ATIVO']:
+        return 'atendimento_humano'
+    if 'personalizacao_nome_estado' in MEMORIA_USUARIO:
+        return 'personalizacao_nome'
+    if 'personalizacao_foto_estado' in MEMORIA_USUARIO:
+        return 'personalizacao_foto'
+    if 'consulta_capinha_estado' in MEMORIA_USUARIO:
+        return 'consulta_capinha'
+    if 'duvidas_estado' in MEMORIA_USUARIO:
+        return 'duvidas'
+    if MEMORIA_USUARIO.get('last_action_completed') or MEMORIA_USUARIO.get('last_flow_options'):
+        return 'pos_fluxo'
+    return 'menu'
+
+# Campo da MEMORIA_USUARIO com o estado de cada fluxo (rótulos da análise)
+CAMPO_ESTADO_FLUXO = {
+    'personalizacao_nome': 'personalizacao_nome_estado',
+    'personalizacao_foto': 'personalizacao_foto_estado',
+    'consulta_capinha': 'consulta_capinha_estado',
+    'duvidas': 'duvidas_estado',
+}
+FLUXOS_PEDIDO = ('personalizacao_nome', 'personalizacao_foto')
+FLUXOS_DADOS = FLUXOS_PEDIDO + ('consulta_capinha',)   # mensagens que são modelo, nome, tema ou foto
+
+def estado_fluxo(sessao, fluxo=None):
+    """Fluxo e estado dentro dele, ex.: "personalizacao_nome:aguardando_modelo_nome"."""
+    fluxo = fluxo or identificar_fluxo(sessao)
+    campo = CAMPO_ESTADO_FLUXO.get(fluxo)
+    return f"{fluxo}:{sessao['MEMORIA_USUARIO'].get(campo)}" if campo else fluxo
+
+def registrar_eventos(fluxo, estado_antes, sessao, humano_antes):
+    """Envia para a análise os eventos da mensagem que acabou de ser processada."""
+    global _fallback_mensagem
+    fluxo_depois = identificar_fluxo(sessao)
+    estado_depois = estado_fluxo(sessao, fluxo_depois)
+    eventos = [('mensagem', fluxo)]
+    if fluxo_depois != fluxo and fluxo_depois in CAMPO_ESTADO_FLUXO:
+        eventos.append(('fluxo_iniciado', fluxo_depois))
+    if estado_depois != estado_antes:
+        eventos.append(('transicao', f"{estado_antes} -> {estado_depois}"))
+    for regra in _intencoes_mensagem:
+        eventos.append(('intencao', regra))
+    _intencoes_mensagem.clear()
+    if _fallback_mensagem:
+        eventos.append(('fallback', fluxo))
+        _fallback_mensagem = False
+    if sessao['ATENDIMENTO_HUMANO_ATIVO'] and not humano_antes:
+        eventos.append(('encaminhamento', fluxo))
+    if fluxo in FLUXOS_PEDIDO and str(sessao['MEMORIA_USUARIO'].get('last_action_completed', '')).endswith('_concluida'):
+        eventos.append(('pedido', fluxo))
+    analise.registrar_varios(eventos)
 
 def processar_mensagem_shopee(sessao_id, user_input):
     """
     Função principal para processar mensagens da Shopee, gerenciando o estado da sessão.
     Retorna a resposta do bot e um booleano indicando se a conversa foi encaminhada para humano.
     """
+    global _fallback_mensagem, _idioma_atual
+    if _pid_inicializado != os.getpid():
+        inicializar_worker()
+    with TRAVA_SESSOES:
+        sessao = get_sessao_estado(sessao_id)
+        fluxo = identificar_fluxo(sessao)
+        estado_antes = estado_fluxo(sessao, fluxo)
+        humano_antes = sessao['ATENDIMENTO_HUMANO_ATIVO']
+        gravando = gravador.ATIVO
+        if gravando:
+            estado_gravador = gravador.estado_para_json(sessao)
+
+        # Até a detecção ter certeza (ver idioma.py) a conversa segue no idioma padrão e cada
+        # mensagem tenta de novo, menos as que são dados de um fluxo (modelo, nome, tema, foto).
+        # O cliente pode trocar a qualquer momento pedindo o idioma pelo nome ("español").
+        pedido = idioma.idioma_pedido(user_input)
+        if pedido is not None:
+            sessao['IDIOMA'] = pedido
+        elif sessao.get('IDIOMA') is None and fluxo not in FLUXOS_DADOS:
+            sessao['IDIOMA'] = idioma.detectar(user_input)
+            if sessao['IDIOMA'] is not None:
+                metricas.IDIOMAS_DETECTADOS.inc(sessao['IDIOMA'])
+        _idioma_atual = sessao['IDIOMA'] or idioma.IDIOMA_PADRAO
+
+        _intencoes_mensagem.clear()
+        _fallback_mensagem = False
+        inicio = time.perf_counter()
+        with perfil.fase('logica'):
+            resposta_bot, encaminhado_humano = _processar_mensagem_shopee(sessao_id, user_input)
+        metricas.LATENCIA_LOGICA.observar(time.perf_counter() - inicio, fluxo)
+        registrar_eventos(fluxo, estado_antes, sessao, humano_antes)
+
+        sessao['ULTIMA_MENSAGEM_CLIENTE'] = datetime.datetime.now()
+        if sessao['ATENDIMENTO_HUMANO_ATIVO'] and not sessao.get('AGUARDANDO_ATENDENTE_DESDE'):
+            # Cliente voltou a escrever depois da última resposta do atendente
+            sessao['AGUARDANDO_ATENDENTE_DESDE'] = sessao['ULTIMA_MENSAGEM_CLIENTE']
+        agendar_expiracoes(sessao_id, sessao)
+        atendimentos.atualizar(sessao_id, sessao)
+        if gravando:
+            gravador.registrar(sessao_id, estado_gravador, user_input, resposta_bot, encaminhado_humano)
+        persistencia.registrar_sessao(sessao_id, sessao)
+    return resposta_bot, encaminhado_humano
+
+def processar_mensagem_atendente(sessao_id, mensagem):
+    """
+    Registra uma mensagem enviada pela loja (atendente humano) na conversa, sem rodar a assistente.
+    Se a conversa ainda estava com a assistente, o atendente assume a partir daqui.
+    """
+    if _pid_inicializado != os.getpid():
+        inicializar_worker()
+    with TRAVA_SESSOES:
+        sessao = get_sessao_estado(sessao_id)
+        agora = datetime.datetime.now()
+        if mensagem.strip() == FINALIZACAO_ATENDENTE_HUMANO_FRASE:
+            if sessao['ATENDIMENTO_HUMANO_ATIVO']:
+                encerrar_atendimento_humano(sessao)
+            sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO'] = agora
+        else:
+            if not sessao['ATENDIMENTO_HUMANO_ATIVO']:
+                print(f"ℹ️ Atendente assumiu a conversa {sessao_id}. A assistente virtual fica em silêncio.")
+                encaminhar_para_humano(sessao)
+                sessao['MEMORIA_USUARIO'] = {}
+            sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO'] = agora
+            sessao['AGUARDANDO_ATENDENTE_DESDE'] = None
+        agendar_expiracoes(sessao_id, sessao)
+        atendimentos.atualizar(sessao_id, sessao)
+        persistencia.registrar_sessao(sessao_id, sessao)
+
+# Fluxos em que a transição só depende de (regras, estado da memória, mensagem normalizada)
+FLUXOS_MEMOIZAVEIS = ('menu', 'duvidas', 'pos_fluxo')
+
+def _memoria_congelada(memoria):
+    """Versão imutável (e hashable) da memória, ou None se ela guarda listas/dicionários."""
+    for valor in memoria.values():
+        if not isinstance(valor, (str, int, bool, type(None))):
+            return None
+    return tuple(sorted(memoria.items()))
+
+def _chave_cache(sessao, user_input):
+    """Chave do cache de respostas para esta mensagem, ou None se a transição não pode ser memoizada."""
+    if not cache_respostas.ATIVO or identificar_fluxo(sessao) not in FLUXOS_MEMOIZAVEIS:
+        return None
+    memoria = _memoria_congelada(sessao['MEMORIA_USUARIO'])
+    if memoria is None:
+        return None
+    return (_idioma_atual, sessao['PRIMEIRA_MENSAGEM_RECEBIDA'], memoria, user_input.lower().strip())
+
+def _processar_mensagem_shopee(sessao_id, user_input):
+    """Processa a mensagem de fato (ver processar_mensagem_shopee), usando o cache nas transições sem estado."""
+    global _regras_consultadas, _fallback_contado
+    sessao = get_sessao_estado(sessao_id)
+    chave = _chave_cache(sessao, user_input)
+    if chave is None:
+        return _executar_transicao(sessao_id, user_input)
+
+    em_cache = cache_respostas.obter(chave)
+    if em_cache is not None:
+        resposta_bot, memoria, intencoes, fallback = em_cache
+        sessao['PRIMEIRA_MENSAGEM_RECEBIDA'] = True
+        sessao['MEMORIA_USUARIO'] = dict(memoria)
+        for regra in intencoes:
+            contar_intencao(regra)
+        if fallback:
+            contar_fallback()
+        return resposta_bot, False
+
+    _regras_consultadas = []
+    _fallback_contado = False
+    try:
+        resposta_bot, encaminhado_humano = _executar_transicao(sessao_id, user_input)
+        regras = _regras_consultadas
+    finally:
+        _regras_consultadas = None
+
+    # Só guarda se a conversa continuou com a assistente e o novo estado também é simples
+    if not encaminhado_humano and not sessao['CONVERSA_ENCAMINHADA_HUMANO']:
+        memoria = _memoria_congelada(sessao['MEMORIA_USUARIO'])
+        if memoria is not None:
+            intencoes = tuple(_intencoes_mensagem)
+            cache_respostas.guardar(chave, (resposta_bot, memoria, intencoes, _fallback_contado), regras)
+    return resposta_bot, encaminhado_humano
+
+def _executar_transicao(sessao_id, user_input):
+    """Executa a lógica de conversa para uma mensagem (ver _processar_mensagem_shopee)."""
     sessao = get_sessao_estado(sessao_id)
     MEMORIA_USUARIO = sessao['MEMORIA_USUARIO']
     ATENDIMENTO_HUMANO_ATIVO = sessao['ATENDIMENTO_HUMANO_ATIVO']
-    ULTIMA_INTERACAO_ATENDENTE_HUMANO = sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO']
     CONVERSA_ENCAMINHADA_HUMANO = sessao['CONVERSA_ENCAMINHADA_HUMANO']
     PRIMEIRA_MENSAGEM_RECEBIDA = sessao['PRIMEIRA_MENSAGEM_RECEBIDA']
 
@@ -572,26 +1152,17 @@ def processar_mensagem_shopee(sessao_id, user_input):
     resposta_bot = None
     encaminhado_humano_final = False # Flag para retornar se a conversa foi encaminhada
 
-    # --- Lógica de Início de Conversa ---
-    if not PRIMEIRA_MENSAGEM_RECEBIDA:
-        sessao['PRIMEIRA_MENSAGEM_RECEBIDA'] = True
-        resposta_bot = exibir_saudacao_inicial() + "\n" + exibir_menu_principal()
-        return resposta_bot, encaminhado_humano_final
-
     # --- Lógica de Atendimento Humano ---
     if ATENDIMENTO_HUMANO_ATIVO:
         # Se o atendente humano enviou a frase de finalização
         if user_input.strip() == FINALIZACAO_ATENDENTE_HUMANO_FRASE:
-            sessao['ATENDIMENTO_HUMANO_ATIVO'] = False
-            sessao['CONVERSA_ENCAMINHADA_HUMANO'] = False
+            encerrar_atendimento_humano(sessao)
             sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO'] = datetime.datetime.now() # Marca o tempo da finalização
             return None, False # A assistente não responde, apenas desativa o modo humano
 
         # Se o cliente quer cancelar o atendimento humano
-        if user_input_lower == 'cancelar atendimento humano':
-            sessao['ATENDIMENTO_HUMANO_ATIVO'] = False
-            sessao['CONVERSA_ENCAMINHADA_HUMANO'] = False
-            sessao['MEMORIA_USUARIO'] = {} # Limpa a memória para recomeçar com a assistente
+        if user_input_lower in COMANDOS_CANCELAR_HUMANO:
+            encerrar_atendimento_humano(sessao) # Limpa a memória para recomeçar com a assistente
             resposta_bot = get_resposta_regra("CANCELAR_ATENDIMENTO_HUMANO") + "\n" + exibir_menu_principal()
             return resposta_bot, False
 
@@ -604,23 +1175,29 @@ def processar_mensagem_shopee(sessao_id, user_input):
             # O bot_logic não precisa gerar uma resposta de texto aqui.
             return None, True # Retorna True para indicar que ainda está encaminhado
 
-    # --- Retomada da Assistente Virtual após 24h de inatividade do atendente humano ---
-    # Esta lógica só se aplica se o atendimento humano foi finalizado (ULTIMA_INTERACAO_ATENDENTE_HUMANO não é None)
-    # E se o atendente NÃO enviou a frase de finalização.
-    if ULTIMA_INTERACAO_ATENDENTE_HUMANO and not ATENDIMENTO_HUMANO_ATIVO:
-        if (datetime.datetime.now() - ULTIMA_INTERACAO_ATENDENTE_HUMANO).total_seconds() > 24 * 3600: # 24 horas
-            sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO'] = None # Reseta o timer
-            # A assistente está pronta para responder normalmente na próxima interação do usuário.
-        else:
-            # Se ainda não passou 24h desde a última interação do atendente (sem a frase de finalização),
-            # e o atendimento humano não foi cancelado, a assistente ainda não retoma proativamente.
-            # Ela só responderá se o usuário iniciar uma nova conversa ou opção do menu.
-            pass
+    # --- Lógica de Início de Conversa ---
+    # Vem depois do atendimento humano: se o atendente assumiu antes da primeira mensagem
+    # do cliente (ver processar_mensagem_atendente), a assistente não cumprimenta por cima dele
+    if not PRIMEIRA_MENSAGEM_RECEBIDA:
+        sessao['PRIMEIRA_MENSAGEM_RECEBIDA'] = True
+        resposta_bot = exibir_saudacao_inicial() + "\n" + exibir_menu_principal()
+        return resposta_bot, encaminhado_humano_final
+
+    # --- Troca de Idioma Pedida pelo Cliente ("español", "english", "português") ---
+    # O processar_mensagem_shopee já trocou o idioma da sessão; um fluxo em andamento continua
+    if idioma.idioma_pedido(user_input) is not None:
+        resposta_bot = texto_fluxo("IDIOMA_ALTERADO")
+        if not MEMORIA_USUARIO:
+            resposta_bot += "\n" + exibir_menu_principal()
+        return resposta_bot, encaminhado_humano_final
+
+    # --- Retomada da Assistente Virtual após 24h sem a frase de finalização do atendente ---
+    # Não é mais verificada aqui: o agendador expira o atendimento humano no prazo
+    # (ver _expirar), mesmo que o cliente não volte a escrever.
 
     # --- Detecção de Intenção para Atendimento Humano (fora de um fluxo específico) ---
-    if user_input_lower == 'falar com atendimento humano' or user_input_lower == 'falar com atendente':
-        sessao['ATENDIMENTO_HUMANO_ATIVO'] = True
-        sessao['CONVERSA_ENCAMINHADA_HUMANO'] = True # Marca que a conversa foi encaminhada
+    if user_input_lower in COMANDOS_FALAR_HUMANO:
+        encaminhar_para_humano(sessao) # Marca que a conversa foi encaminhada
         sessao['MEMORIA_USUARIO'] = {} # Limpa a memória para o atendente humano
         resposta_bot = get_resposta_regra("TRANSFERENCIA_OFERECER")
         encaminhado_humano_final = True
@@ -637,9 +1214,7 @@ def processar_mensagem_shopee(sessao_id, user_input):
             resposta_bot = get_resposta_regra("SAIR_ATENDIMENTO")
         else:
             # Se o usuário digitou algo diferente de 1 ou 2, reexibe as opções
-            resposta_bot = ("Desculpe, não entendi sua escolha. Por favor, selecione uma das opções numeradas:\n"
-                    "1 - Voltar ao menu principal\n"
-                    "2 - Sair do atendimento")
+            resposta_bot = texto_fluxo("ESCOLHA_INVALIDA_POS_FLUXO")
         return resposta_bot, encaminhado_humano_final
 
     if MEMORIA_USUARIO.get('last_action_completed') == 'personalizacao_foto_concluida':
@@ -651,9 +1226,7 @@ def processar_mensagem_shopee(sessao_id, user_input):
             resposta_bot = get_resposta_regra("SAIR_ATENDIMENTO")
         else:
             # Se o usuário digitou algo diferente de 1 ou 2, reexibe as opções
-            resposta_bot = ("Desculpe, não entendi sua escolha. Por favor, selecione uma das opções numeradas:\n"
-                    "1 - Voltar ao menu principal\n"
-                    "2 - Sair do atendimento")
+            resposta_bot = texto_fluxo("ESCOLHA_INVALIDA_POS_FLUXO")
         return resposta_bot, encaminhado_humano_final
 
     # --- Processamento de Fluxos Ativos ---
@@ -681,6 +1254,8 @@ def processar_mensagem_shopee(sessao_id, user_input):
             encaminhado_humano_final = True
     elif 'duvidas_estado' in MEMORIA_USUARIO:
         resposta_bot = processar_duvidas_informacoes(sessao_id, user_input)
+        if sessao['CONVERSA_ENCAMINHADA_HUMANO']: # A opção "Falar com atendimento Humano" das dúvidas encaminha
+            encaminhado_humano_final = True
     else:
         # --- Processa as opções do menu principal ---
         if user_input_lower == '1':
@@ -701,51 +1276,30 @@ def processar_mensagem_shopee(sessao_id, user_input):
             resposta_bot = processar_devolucao_reembolso(sessao_id, user_input)
         elif user_input_lower == '5':
             resposta_bot = processar_duvidas_informacoes(sessao_id, user_input)
-        elif user_input_lower == '6' or user_input_lower == 'sair':
+        elif user_input_lower == '6' or user_input_lower in COMANDOS_SAIR:
             sessao['MEMORIA_USUARIO'] = {} # Limpa a memória ao sair
             resposta_bot = get_resposta_regra("SAIR_ATENDIMENTO")
-        elif user_input_lower == 'menu' or user_input_lower == 'menu principal':
+        elif user_input_lower in COMANDOS_MENU:
             resposta_bot = exibir_menu_principal()
-        elif user_input_lower == 'olá' or user_input_lower == 'oi' or user_input_lower == 'tudo bem':
+        elif user_input_lower in SAUDACOES:
             # Se for uma saudação e já passou da primeira mensagem, apenas exibe o menu
             resposta_bot = exibir_menu_principal()
-        elif user_input_lower == 'obrigado' or user_input_lower == 'obrigada':
-            resposta_bot = "De nada, Alex! Fico feliz em ajudar. Você gostaria de fazer mais alguma coisa ou tem alguma outra dúvida?"
-        elif "reembolso" in user_input_lower or "devolução" in user_input_lower or "dinheiro de volta" in user_input_lower:
+        elif user_input_lower in AGRADECIMENTOS:
+            resposta_bot = texto_fluxo("AGRADECIMENTO")
+        elif any(palavra in user_input_lower for palavra in PALAVRAS_DEVOLUCAO):
             # Define o last_flow_options ANTES de chamar a função
             MEMORIA_USUARIO['last_flow_options'] = 'devolucao_reembolso'
             resposta_bot = processar_devolucao_reembolso(sessao_id, user_input)
-        elif "prazo de envio" in user_input_lower or "recebimento do pedido" in user_input_lower:
-            resposta_bot = get_resposta_regra("LOGISTICA_ATRASO") + "\n" + exibir_menu_principal()
-        elif "comprei errado" in user_input_lower or "preciso alterar" in user_input_lower:
-            resposta_bot = get_resposta_regra("COMPRA_INCORRETA") + "\n" + exibir_menu_principal()
-        elif "formas de pagamento" in user_input_lower or "pagamento" in user_input_lower:
-            resposta_bot = get_resposta_regra("PAGAMENTO_COMPLETO") + "\n" + exibir_menu_principal()
-        elif "ver minha capinha" in user_input_lower or "aprovar antes do envio" in user_input_lower:
-            resposta_bot = get_resposta_regra("APROVACAO_VER_CAPINHA") + "\n" + exibir_menu_principal()
-        elif "imagens do anuncio" in user_input_lower or "diferentes do meu modelo" in user_input_lower:
-            resposta_bot = get_resposta_regra("IMAGENS_ILUSTRATIVAS") + "\n" + exibir_menu_principal()
-        elif "não sei meu modelo de celular" in user_input_lower or "nao sei meu modelo" in user_input_lower:
-            resposta_bot = get_resposta_regra("MODELO_DESCONHECIDO") + "\n" + exibir_menu_principal()
-        elif "mudar o tipo de letra" in user_input_lower or "alterar fonte" in user_input_lower:
-            resposta_bot = get_resposta_regra("ALTERAR_FONTE_LETRA") + "\n" + exibir_menu_principal()
-        elif "capinha possui proteção" in user_input_lower or "proteção da capinha" in user_input_lower:
-            resposta_bot = get_resposta_regra("CAPINHA_PROTECAO") + "\n" + exibir_menu_principal()
-        elif "capinha amarela" in user_input_lower or "amarela com o tempo" in user_input_lower:
-            resposta_bot = get_resposta_regra("CAPINHA_AMARELA") + "\n" + exibir_menu_principal()
-        elif "cupom de desconto" in user_input_lower or "promoção" in user_input_lower:
-            resposta_bot = get_resposta_regra("CUPOM_DESCONTO") + "\n" + exibir_menu_principal()
+        elif (regra_faq := buscar_regra_palavra_chave(user_input_lower)):
+            resposta_bot = get_resposta_regra(regra_faq) + "\n" + exibir_menu_principal()
         else:
             # Se não for uma opção do menu e não houver fluxo ativo, exibe a mensagem de fora do menu
             # e o menu principal.
             sessao['MEMORIA_USUARIO'] = {} # Limpa a memória para garantir que o menu principal seja exibido
+            contar_fallback()
             resposta_bot = get_resposta_regra("RESPOSTA_FORA_MENU") + "\n" + exibir_menu_principal()
 
-    # Atualiza o estado da sessão com as flags de atendimento humano
-    sessao['ATENDIMENTO_HUMANO_ATIVO'] = ATENDIMENTO_HUMANO_ATIVO
-    sessao['ULTIMA_INTERACAO_ATENDENTE_HUMANO'] = ULTIMA_INTERACAO_ATENDENTE_HUMANO
-    sessao['CONVERSA_ENCAMINHADA_HUMANO'] = CONVERSA_ENCAMINHADA_HUMANO
-
+    # As flags de atendimento humano já foram atualizadas na sessão por quem encaminhou
     return resposta_bot, encaminhado_humano_final
 
 # --- Simulação de Interação (para testes) ---
@@ -0,0 +1,86 @@
+# cache_respostas.py - Memoização das transições sem estado (menu e dúvidas)
+# -------------------------------------------------
+# A maior parte do tráfego são os mesmos poucos passos: saudação + menu,
+# "5" para o submenu de dúvidas, uma opção de 1 a 10, "1" para voltar...
+# Nesses estados a resposta só depende do conjunto de regras, do estado
+# do fluxo e da mensagem normalizada, então o bot_logic guarda aqui o
+# resultado da transição (resposta + novo estado) com a chave
+# (conjunto de regras, estado do fluxo, mensagem normalizada).
+#
+# O cache é um LRU limitado a CACHE_RESPOSTAS_LIMITE entradas. Cada
+# entrada lembra as chaves de regra usadas para montá-la: quando uma regra
+# muda (bot_logic.recarregar_regras), só as entradas que dependem dela
+# são descartadas. Acertos e falhas vão para bot_cache_respostas_total.
+# Só é usado dentro da bot_logic.TRAVA_SESSOES, por isso não tem trava própria.
+# -------------------------------------------------
+
+import os
+from collections import OrderedDict
+
+import metricas
+
+LIMITE = int(os.getenv('CACHE_RESPOSTAS_LIMITE', '4096'))
+ATIVO = LIMITE > 0
+
+_entradas = OrderedDict()     # chave -> (valor, regras usadas)
+_por_regra = {}               # chave de regra -> set(chaves do cache que dependem dela)
+acertos = 0
+falhas = 0
+
+def obter(chave):
+    """Retorna o valor guardado para `chave` (ou None), contando acerto/falha."""
+    global acertos, falhas
+    entrada = _entradas.get(chave)
+    if entrada is None:
+        falhas += 1
+        metricas.CACHE_RESPOSTAS.inc('falha')
+        return None
+    _entradas.move_to_end(chave)
+    acertos += 1
+    metricas.CACHE_RESPOSTAS.inc('acerto')
+    return entrada[0]
+
+def guardar(chave, valor, regras):
+    """Guarda `valor` para `chave`, registrando as regras de que ele depende."""
+    if chave in _entradas:
+        _descartar(chave)
+    regras = frozenset(regras)
+    _entradas[chave] = (valor, regras)
+    for regra in regras:
+        _por_regra.setdefault(regra, set()).add(chave)
+    if len(_entradas) > LIMITE:
+        _descartar(next(iter(_entradas)))
+
+def _descartar(chave):
+    _, regras = _entradas.pop(chave)
+    for regra in regras:
+        dependentes = _por_regra.get(regra)
+        if dependentes is not None:
+            dependentes.discard(chave)
+            if not dependentes:
+                del _por_regra[regra]
+
+def invalidar_regras(regras):
+    """Descarta as entradas que usaram alguma das `regras`. Retorna quantas foram descartadas."""
+    descartadas = 0
+    for regra in regras:
+        for chave in list(_por_regra.get(regra, ())):
+            _descartar(chave)
+            descartadas += 1
+    return descartadas
+
+def limpar():
+    """Esvazia o cache (as estatísticas continuam)."""
+    _entradas.clear()
+    _por_regra.clear()
+
+def estatisticas():
+    """Tamanho do cache, acertos, falhas e taxa de acerto deste processo."""
+    total = acertos + falhas
+    return {
+        'entradas': len(_entradas),
+        'limite': LIMITE,
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': round(acertos / total, 4) if total else 0.0,
+    }
@@ -0,0 +1,162 @@
+# catalogo.py - Catálogo de modelos de celular (arquivo em CATALOGO_MODELOS)
+# -------------------------------------------------
+# Normaliza o modelo que o cliente digita ("iphone13", "iPhone 13 ",
+# "Iphone 13" -> "iPhone 13") e diz se a loja tem capinha para ele.
+#
+# O catálogo só é usado se CATALOGO_MODELOS apontar para o arquivo com o
+# estoque real da loja (o formato está em CatalogoModelos.exemplo.txt).
+# Sem ele o catálogo fica vazio: os modelos ficam como o cliente digitou
+# e as consultas de capinha vão para o atendente.
+#
+# Cada nome/apelido do arquivo é normalizado (sem acentos, minúsculo, só
+# letras e números, "+" vira "plus") e inserido numa trie de dicionários,
+# caractere a caractere. Uma busca percorre a trie uma vez por posição de
+# início e custa poucos microssegundos, independente do tamanho do catálogo.
+# Uma correspondência só vale se terminar numa fronteira de palavra (espaço,
+# pontuação ou troca letra/número), para que "iphone 130" não vire iPhone 13.
+#
+# O catálogo é carregado no import (compartilhado entre os workers com
+# preload) e pode ser trocado em tempo de execução com recarregar().
+# -------------------------------------------------
+
+import os
+import re
+import unicodedata
+from collections import namedtuple
+
+ARQUIVO_CATALOGO = os.getenv('CATALOGO_MODELOS') or None
+ARQUIVO_EXEMPLO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "CatalogoModelos.exemplo.txt")
+
+Modelo = namedtuple('Modelo', 'nome disponivel')
+
+_FIM = None                          # chave do nó da trie que guarda o Modelo
+_PADRAO_TOKEN = re.compile(r"[a-z]+|[0-9]+")
+
+# Palavras (já normalizadas) que podem acompanhar o modelo numa consulta sem
+# mudar o que foi perguntado. Qualquer outra ("stitch", "flores") é um tema.
+PALAVRAS_CONSULTA = frozenset("""
+    oi ola bom boa dia tarde noite por favor pf pfv obrigado obrigada
+    tem tens teria tiver voces vcs vc ai ainda existe disponivel disponiveis estoque
+    quero queria gostaria saber se sim
+    capinha capinhas capa capas case cases celular modelo aparelho telefone
+    o a os as um uma do da dos das de pro pra para no na nos nas meu minha e
+    hola tienen tienes hay funda fundas carcasa para el la mi del
+    hi hello do you have any is there case cases cover for my the an in stock available
+""".split())
+
+def normalizar(texto):
+    """
+    Retorna (chave, fronteiras): a chave só tem [a-z0-9] e `fronteiras` é o
+    conjunto de posições da chave onde uma palavra começa ou termina.
+    """
+    texto = unicodedata.normalize('NFKD', texto.replace('+', ' plus '))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    partes = []
+    fronteiras = {0}
+    tamanho = 0
+    for token in _PADRAO_TOKEN.findall(texto):
+        partes.append(token)
+        tamanho += len(token)
+        fronteiras.add(tamanho)
+    return ''.join(partes), fronteiras
+
+def carregar_catalogo(filepath=ARQUIVO_CATALOGO):
+    """Lê o arquivo do catálogo e monta a trie. Retorna (trie, quantidade de modelos)."""
+    trie = {}
+    quantidade = 0
+    if not filepath:
+        print("ℹ️ CATALOGO_MODELOS não definido: sem catálogo de modelos, as consultas de capinha vão para o atendente.")
+        return trie, 0
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            linhas = f.read().splitlines()
+    except FileNotFoundError:
+        print(f"AVISO: Catálogo de modelos '{filepath}' não encontrado. Consultas irão para o atendente.")
+        return trie, 0
+
+    for numero, linha in enumerate(linhas, 1):
+        linha = linha.strip()
+        if not linha or linha.startswith('#'):
+            continue
+        disponivel = not linha.startswith('!')
+        nomes = [n.strip() for n in linha.lstrip('!').split('|') if n.strip()]
+        if not nomes:
+            continue
+        modelo = Modelo(nomes[0], disponivel)
+        quantidade += 1
+        for nome in nomes:
+            chave, _ = normalizar(nome)
+            if not chave:
+                continue
+            no = trie
+            for c in chave:
+                no = no.setdefault(c, {})
+            anterior = no.get(_FIM)
+            if anterior is not None and anterior.nome != modelo.nome:
+                print(f"AVISO: '{nome}' (linha {numero} do catálogo) já pertence a '{anterior.nome}'; ignorado.")
+                continue
+            no[_FIM] = modelo
+    return trie, quantidade
+
+_TRIE, QUANTIDADE_MODELOS = carregar_catalogo()
+
+def recarregar(filepath=ARQUIVO_CATALOGO):
+    """Relê o catálogo (ex.: depois de atualizar o estoque). Retorna a quantidade de modelos."""
+    global _TRIE, QUANTIDADE_MODELOS
+    _TRIE, QUANTIDADE_MODELOS = carregar_catalogo(filepath)
+    return QUANTIDADE_MODELOS
+
+def _mais_longo(chave, fronteiras, inicio):
+    """Modelo mais longo que começa em `inicio` e termina numa fronteira: (Modelo, fim) ou (None, inicio)."""
+    encontrado, fim = None, inicio
+    no = _TRIE
+    for posicao in range(inicio, len(chave)):
+        no = no.get(chave[posicao])
+        if no is None:
+            break
+        modelo = no.get(_FIM)
+        if modelo is not None and posicao + 1 in fronteiras:
+            encontrado, fim = modelo, posicao + 1
+    return encontrado, fim
+
+def canonizar_modelo(texto):
+    """Nome canônico se o texto inteiro for um modelo do catálogo, senão None."""
+    chave, fronteiras = normalizar(texto)
+    if not chave:
+        return None
+    modelo, fim = _mais_longo(chave, fronteiras, 0)
+    return modelo.nome if modelo is not None and fim == len(chave) else None
+
+def _buscar(chave, fronteiras):
+    """Primeiro modelo do texto normalizado: (Modelo, inicio, fim) ou (None, 0, 0)."""
+    for inicio in sorted(fronteiras):
+        modelo, fim = _mais_longo(chave, fronteiras, inicio)
+        if modelo is not None:
+            return modelo, inicio, fim
+    return None, 0, 0
+
+def buscar_modelo(texto):
+    """
+    Procura um modelo do catálogo em qualquer ponto do texto
+    ("tem capa pro galaxy s21 fe?"). Retorna o Modelo mais longo que aparece
+    primeiro, ou None.
+    """
+    return _buscar(*normalizar(texto))[0]
+
+def consultar_modelo(texto):
+    """
+    Modelo do catálogo se a consulta é só sobre ele ("iphone13", "tem capa pro
+    galaxy s21 fe?"), senão None. Se sobrar outra coisa além do modelo e de
+    PALAVRAS_CONSULTA ("tem do Stitch pro iPhone 13?"), a pergunta é de um
+    tema e quem responde é o atendente.
+    """
+    chave, fronteiras = normalizar(texto)
+    modelo, inicio, fim = _buscar(chave, fronteiras)
+    if modelo is None:
+        return None
+    # As fronteiras separam exatamente os tokens, e o modelo começa e termina numa delas
+    posicoes = sorted(fronteiras)
+    for comeco, final in zip(posicoes, posicoes[1:]):
+        if (final <= inicio or comeco >= fim) and chave[comeco:final] not in PALAVRAS_CONSULTA:
+            return None
+    return modelo
@@ -0,0 +1,349 @@
+# cluster.py - Vários nós, cada um dono de uma parte das conversas
+# -------------------------------------------------
+# Com CLUSTER_NO (a URL deste nó) e CLUSTER_NOS (as URLs de todos os nós,
+# separadas por vírgula) definidas, as conversas são divididas entre os
+# nós por hash consistente do conversation_id: cada nó ocupa CLUSTER_VNOS
+# pontos num anel (md5 de "url#i") e a conversa é do primeiro ponto
+# depois do hash dela. Cada nó guarda na memória só as sessões que são
+# dele: o SESSAO_ESTADOS continua sendo o estado quente, sem consulta a um
+# armazenamento compartilhado por mensagem.
+#
+# - Webhook que chega no nó errado (o balanceador não conhece o anel) é
+#   repassado ao dono e a resposta dele volta para a Shopee pelo nó que
+#   recebeu. Enquanto a nova lista de nós não chegou a todos, dois nós
+#   podem discordar do dono: o cabeçalho X-Cluster-Saltos limita o
+#   repasse a MAX_SALTOS e, depois disso, o nó processa a mensagem.
+# - Entrada ou saída de nó: POST /cluster/nos com a nova lista em TODOS os
+#   nós (um nó novo sobe com a lista atual, sem ele, e só passa a ser dono
+#   de conversas quando a nova lista é anunciada). Cada nó troca o anel e,
+#   em segundo plano, envia em lotes as sessões que passaram a ser de
+#   outro nó (POST /cluster/sessoes). Quem recebe só instala a sessão se
+#   ainda não a tem. A lista nova vai primeiro para o nó que entra e por
+#   último para o nó que sai: assim dois nós nunca repassam a mesma
+#   conversa um para o outro.
+# - Antes de processar a mensagem de uma conversa que o nó não tem, ela é
+#   buscada (POST /cluster/retirar) no dono segundo o anel deste nó, se
+#   não for ele mesmo, e, por JANELA_MIGRACAO_SEGUNDOS depois da troca, no
+#   dono anterior: a mensagem pode chegar antes do lote. Fora das trocas
+#   de nós isso não custa nada (quem processa é sempre o dono). A sessão
+#   que está sendo enviada fica "em trânsito" e também pode ser buscada;
+#   se o envio falhar, as que não foram buscadas voltam para este nó.
+# - O nó que entregou uma sessão (por lote ou por busca) lembra para onde
+#   ela foi durante a janela: webhooks dessa conversa que ainda chegam a
+#   ele (de nós com o anel antigo) são repassados para lá, e uma busca
+#   recebe de volta o endereço de quem está com ela.
+# - Quando todos os nós terminaram de migrar (GET /cluster: "migrando"
+#   false e "em_transito" 0), anunciar de novo a mesma lista encerra a
+#   janela: ninguém mais busca sessões no nó que saiu (e que já pode parar).
+#
+# Os endpoints /cluster/* usam o ADMIN_TOKEN dos /admin/* (os nós mandam o
+# token entre si). Cada nó roda com um worker só (ver gunicorn.conf.py).
+# Para testar com processos locais: python cluster_local.py --verificar
+# -------------------------------------------------
+
+import os
+import time
+import bisect
+import hashlib
+import threading
+from collections import defaultdict
+
+import requests
+
+import bot_logic
+import gravador
+import metricas
+from admin import ADMIN_TOKEN, CABECALHO_TOKEN
+
+NO_ATUAL = os.getenv('CLUSTER_NO', '').strip().rstrip('/')
+VNOS = int(os.getenv('CLUSTER_VNOS', '100'))
+TIMEOUT_SEGUNDOS = float(os.getenv('CLUSTER_TIMEOUT_SEGUNDOS', '5'))
+JANELA_MIGRACAO_SEGUNDOS = float(os.getenv('CLUSTER_JANELA_MIGRACAO_SEGUNDOS', '300'))
+LOTE_MIGRACAO = 200
+CABECALHO_SALTOS = 'X-Cluster-Saltos'
+MAX_SALTOS = 3
+MAX_BUSCAS = 3
+
+def _hash(texto):
+    return int.from_bytes(hashlib.md5(texto.encode('utf-8')).digest()[:8], 'big')
+
+def _normalizar_nos(nos):
+    """Lista de URLs de nós sem repetição, ordenada; levanta ValueError se ela não for válida."""
+    if not isinstance(nos, (list, tuple)) or not all(isinstance(no, str) for no in nos):
+        raise ValueError("'nos' deve ser uma lista de URLs")
+    nos = {no.strip().rstrip('/') for no in nos if no.strip()}
+    if not all(no.startswith(("http://", "https://")) for no in nos):
+        raise ValueError("as URLs dos nós devem começar com http:// ou https://")
+    return sorted(nos)
+
+class Anel:
+    """Anel de hash consistente: cada nó ocupa `vnos` pontos e a chave é do primeiro ponto depois do hash dela."""
+
+    def __init__(self, nos, vnos=VNOS):
+        self.nos = tuple(nos)
+        pontos = sorted((_hash(f"{no}#{i}"), no) for no in self.nos for i in range(vnos))
+        self._hashes = [h for h, _ in pontos]
+        self._donos = [no for _, no in pontos]
+
+    def dono(self, chave):
+        """URL do nó dono da chave (None se o anel está vazio)."""
+        if not self._hashes:
+            return None
+        posicao = bisect.bisect(self._hashes, _hash(chave)) % len(self._hashes)
+        return self._donos[posicao]
+
+_anel = Anel(_normalizar_nos(os.getenv('CLUSTER_NOS', '').split(',')))
+_anel_anterior = None      # anel de antes da última troca de nós (para buscar sessões)
+_anterior_ate = 0.0        # até quando (epoch) o _anel_anterior é consultado
+ATIVO = bool(NO_ATUAL and _anel.nos)
+if ATIVO and not ADMIN_TOKEN:
+    print("⚠️ ATENÇÃO: CLUSTER_NOS definida sem ADMIN_TOKEN (os nós não conseguem conversar entre si). "
+          "Este nó vai atender todas as conversas sozinho.")
+    ATIVO = False
+
+_trava = threading.Lock()         # _em_transito e a thread de migração
+_travas_busca = [threading.Lock() for _ in range(64)]   # uma busca por conversa (duas mensagens da mesma conversa)
+_em_transito = {}                 # sessao_id -> sessão já fora do SESSAO_ESTADOS, sendo enviada
+_entregues = {}                   # sessao_id -> (nó que ficou com ela, até quando lembrar)
+_migrando = False
+_migrar_de_novo = False
+_http = requests.Session()        # conexões reaproveitadas entre os nós
+
+def _post(no, caminho, dados):
+    """POST JSON para outro nó (com o token admin). Retorna o JSON da resposta ou None."""
+    try:
+        resposta = _http.post(f"{no}{caminho}", json=dados, timeout=TIMEOUT_SEGUNDOS,
+                              headers={CABECALHO_TOKEN: ADMIN_TOKEN})
+        resposta.raise_for_status()
+        return resposta.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"❌ Cluster: erro ao chamar {no}{caminho}: {e}")
+        return None
+
+# -------------------------------------------------
+# Roteamento
+# -------------------------------------------------
+def destino_sessao(sessao_id):
+    """URL do nó dono da conversa, ou None se ela é deste nó (ou se o cluster está desligado)."""
+    if not ATIVO:
+        return None
+    dono = _anel.dono(sessao_id)
+    return dono if dono != NO_ATUAL else None
+
+def _entregue_a(sessao_id):
+    entregue = _entregues.get(sessao_id)
+    return entregue[0] if entregue is not None and time.time() <= entregue[1] else None
+
+def _marcar_entregues(ids, destino):
+    ate = time.time() + JANELA_MIGRACAO_SEGUNDOS
+    with _trava:
+        for sessao_id in ids:
+            _entregues[sessao_id] = (destino, ate)
+
+def _desmarcar_entregue(sessao_id):
+    with _trava:
+        _entregues.pop(sessao_id, None)
+
+def _saltos(cabecalhos):
+    try:
+        return int(cabecalhos.get(CABECALHO_SALTOS, 0))
+    except ValueError:
+        return MAX_SALTOS
+
+def destino_webhook(data, cabecalhos):
+    """Nó para onde repassar este webhook, ou None para processá-lo aqui."""
+    if not ATIVO or _saltos(cabecalhos) >= MAX_SALTOS:
+        return None
+    conversation_id = data.get('data', {}).get('message', {}).get('conversation_id')
+    if not conversation_id:
+        return None
+    sessao_id = str(conversation_id)
+    if sessao_id in bot_logic.SESSAO_ESTADOS:
+        return destino_sessao(sessao_id)
+    return _entregue_a(sessao_id) or destino_sessao(sessao_id)
+
+def cabecalhos_repasse(cabecalhos):
+    """Cabeçalhos do webhook repassado (conta mais um salto)."""
+    return {"Content-Type": "application/json", CABECALHO_SALTOS: str(_saltos(cabecalhos) + 1)}
+
+def encaminhar_webhook(destino, corpo, cabecalhos):
+    """Repassa o webhook (corpo cru) ao nó dono. Retorna (status, corpo da resposta) ou None se ele não respondeu."""
+    try:
+        resposta = _http.post(f"{destino}/shopee/webhook", data=corpo, timeout=TIMEOUT_SEGUNDOS,
+                              headers=cabecalhos_repasse(cabecalhos))
+    except requests.RequestException as e:
+        metricas.WEBHOOKS_ENCAMINHADOS.inc('falha')
+        print(f"❌ Cluster: não foi possível repassar o webhook para {destino}: {e}")
+        return None
+    metricas.WEBHOOKS_ENCAMINHADOS.inc('ok')
+    return resposta.status_code, resposta.content
+
+# -------------------------------------------------
+# Busca de sessão que mudou de nó (dono novo)
+# -------------------------------------------------
+def _origens_busca(sessao_id):
+    """Nós que podem ter a sessão que falta aqui: o dono no anel atual e o do anel anterior (na janela)."""
+    if not ATIVO or sessao_id in bot_logic.SESSAO_ESTADOS:
+        return []
+    origens = [_anel.dono(sessao_id)]
+    if _anel_anterior is not None and time.time() <= _anterior_ate:
+        origens.append(_anel_anterior.dono(sessao_id))
+    return [origem for i, origem in enumerate(origens)
+            if origem is not None and origem != NO_ATUAL and origem not in origens[:i]]
+
+def precisa_buscar(sessao_id):
+    """True se a sessão não está aqui e pode estar em outro nó (ver garantir_sessao)."""
+    return bool(_origens_busca(sessao_id))
+
+def garantir_sessao(sessao_id):
+    """Antes de processar uma mensagem: traz a sessão do nó onde ela estava, se ainda não chegou a este nó."""
+    if not precisa_buscar(sessao_id):
+        return
+    with _travas_busca[_hash(sessao_id) % len(_travas_busca)]:
+        for origem in _origens_busca(sessao_id):
+            # Quem já entregou a sessão responde com o nó que ficou com ela
+            for _ in range(MAX_BUSCAS):
+                resposta = _post(origem, '/cluster/retirar', {'sessao_id': sessao_id, 'no': NO_ATUAL}) or {}
+                if resposta.get('estado') is not None:
+                    if bot_logic.adotar_sessao(sessao_id, gravador.estado_de_json(resposta['estado'])):
+                        _desmarcar_entregue(sessao_id)
+                        metricas.SESSOES_MIGRADAS.inc('buscada')
+                    return
+                origem = resposta.get('em')
+                if not origem or origem == NO_ATUAL:
+                    break
+
+# -------------------------------------------------
+# Endpoints /cluster/* (chamados pelos outros nós e pelo operador)
+# -------------------------------------------------
+def retirar_sessao(sessao_id, para):
+    """
+    Entrega a sessão ao nó `para`, que vai processar a próxima mensagem dela.
+    Retorna {'estado': JSON da sessão} ou, se ela não está aqui, {'estado': None, 'em': nó para onde foi (ou None)}.
+    """
+    with bot_logic.TRAVA_SESSOES:
+        sessao = bot_logic.remover_sessao(sessao_id)
+        if sessao is None:
+            with _trava:
+                sessao = _em_transito.pop(sessao_id, None)
+        if sessao is None:
+            return {'estado': None, 'em': _entregue_a(sessao_id)}
+        if para:
+            _marcar_entregues([sessao_id], para)
+        metricas.SESSOES_MIGRADAS.inc('devolvida')
+        return {'estado': gravador.estado_para_json(sessao)}
+
+def receber_sessoes(estados):
+    """Instala as sessões enviadas por outro nó ({sessao_id: estado em JSON}). Retorna quantas eram novas aqui."""
+    if not isinstance(estados, dict):
+        raise ValueError("'sessoes' deve ser um objeto {sessao_id: estado}")
+    instaladas = 0
+    for sessao_id, estado in estados.items():
+        if bot_logic.adotar_sessao(sessao_id, gravador.estado_de_json(estado)):
+            _desmarcar_entregue(sessao_id)
+            instaladas += 1
+    metricas.SESSOES_MIGRADAS.inc('recebida', valor=instaladas)
+    return instaladas
+
+def sessao_local(sessao_id):
+    """Estado (JSON) de uma sessão deste nó, ou None."""
+    with bot_logic.TRAVA_SESSOES:
+        sessao = bot_logic.SESSAO_ESTADOS.get(sessao_id)
+        return gravador.estado_para_json(sessao) if sessao is not None else None
+
+def estado():
+    """Resumo do cluster visto por este nó."""
+    return {
+        'ativo': ATIVO,
+        'no': NO_ATUAL,
+        'nos': list(_anel.nos),
+        'sessoes_locais': len(bot_logic.SESSAO_ESTADOS),
+        'em_transito': len(_em_transito),
+        'migrando': _migrando,
+        'busca_no_anterior': _anel_anterior is not None and time.time() <= _anterior_ate,
+    }
+
+def atualizar_nos(nos):
+    """
+    Troca a lista de nós (entrada ou saída de um nó) e começa a enviar, em segundo plano,
+    as sessões que passaram a ser de outro nó. A mesma lista de novo encerra a janela de
+    busca no anel anterior. Levanta ValueError se a lista for inválida.
+    """
+    global ATIVO, _anel, _anel_anterior, _anterior_ate, _migrando, _migrar_de_novo
+    if not NO_ATUAL or not ADMIN_TOKEN:
+        raise ValueError("defina CLUSTER_NO e ADMIN_TOKEN neste nó para usar o cluster")
+    novo = Anel(_normalizar_nos(nos))
+    if novo.nos == _anel.nos:
+        with _trava:
+            _anel_anterior = None
+        print("ℹ️ Cluster: lista de nós sem mudança; a busca de sessões no anel anterior foi encerrada.")
+        return estado()
+    with _trava:
+        _anel_anterior, _anel = _anel, novo
+        _anterior_ate = time.time() + JANELA_MIGRACAO_SEGUNDOS
+        agora = time.time()
+        for sessao_id in [s for s, (_, ate) in _entregues.items() if ate < agora]:
+            del _entregues[sessao_id]
+        ATIVO = bool(novo.nos)
+        if _migrando:
+            _migrar_de_novo = True
+        else:
+            _migrando = True
+            threading.Thread(target=_migrar, name="cluster-migracao", daemon=True).start()
+    print(f"ℹ️ Cluster: nós atualizados para {', '.join(novo.nos) or '(nenhum)'}. "
+          "Sessões de outros nós serão migradas em segundo plano.")
+    return estado()
+
+# -------------------------------------------------
+# Migração (dono antigo)
+# -------------------------------------------------
+def _migrar():
+    """Thread de migração: envia todas as sessões que não são deste nó (de novo, se o anel mudou no meio)."""
+    global _migrando, _migrar_de_novo
+    while True:
+        por_destino = defaultdict(list)
+        with bot_logic.TRAVA_SESSOES:
+            sessoes_ids = list(bot_logic.SESSAO_ESTADOS)
+        for sessao_id in sessoes_ids:
+            destino = destino_sessao(sessao_id)
+            if destino:
+                por_destino[destino].append(sessao_id)
+        for destino, ids in por_destino.items():
+            for inicio in range(0, len(ids), LOTE_MIGRACAO):
+                _enviar_lote(destino, ids[inicio:inicio + LOTE_MIGRACAO])
+        with _trava:
+            if not _migrar_de_novo:
+                _migrando = False
+                return
+            _migrar_de_novo = False
+
+def _enviar_lote(destino, ids):
+    """Tira as sessões do processo e as envia ao dono novo; se o envio falhar, as que não foram buscadas voltam."""
+    lote = {}
+    with bot_logic.TRAVA_SESSOES:
+        for sessao_id in ids:
+            if destino_sessao(sessao_id) != destino:
+                continue   # o anel mudou de novo
+            sessao = bot_logic.remover_sessao(sessao_id)
+            if sessao is not None:
+                lote[sessao_id] = sessao
+        with _trava:
+            _em_transito.update(lote)
+        _marcar_entregues(lote, destino)
+    if not lote:
+        return
+
+    estados = {sessao_id: gravador.estado_para_json(sessao) for sessao_id, sessao in lote.items()}
+    entregue = _post(destino, '/cluster/sessoes', {'sessoes': estados}) is not None
+
+    with bot_logic.TRAVA_SESSOES:
+        with _trava:
+            restantes = {sessao_id: _em_transito.pop(sessao_id) for sessao_id in lote if sessao_id in _em_transito}
+        if entregue:
+            metricas.SESSOES_MIGRADAS.inc('enviada', valor=len(lote))
+            return
+        for sessao_id, sessao in restantes.items():
+            bot_logic.adotar_sessao(sessao_id, sessao)
+            _desmarcar_entregue(sessao_id)
+    print(f"❌ Cluster: {len(restantes)} sessões não foram enviadas para {destino} e continuam neste nó "
+          "(o dono novo as busca quando receber a próxima mensagem).")
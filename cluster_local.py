@@ -0,0 +1,305 @@
+# cluster_local.py - Cluster de nós locais (cluster.py) para testes
+# -------------------------------------------------
+# Cada nó é um gunicorn com um worker só (como em produção), num diretório
+# temporário próprio com uma cópia das regras, e com CLUSTER_NO /
+# CLUSTER_NOS apontando para portas locais. Sem --verificar, sobe os nós,
+# mostra as URLs e fica esperando (Ctrl+C encerra).
+#
+# Com --verificar, roda um roteiro de rebalanceamento:
+#   1. conversas sintéticas (conversas_sinteticas.py) são enviadas em
+#      paralelo, cada mensagem para um nó sorteado (um balanceador que
+#      não conhece o anel), com message_id para a deduplicação;
+#   2. no meio do tráfego entra um nó novo e, mais adiante, sai um dos
+#      nós originais (ele envia as sessões antes de parar);
+#   3. no fim, cada conversa deve estar em exatamente um nó, com o mesmo
+#      estado de fluxo das mesmas conversas processadas num processo só.
+# Qualquer diferença é estado perdido (ou duplicado) na migração.
+#
+# Uso:
+#     python cluster_local.py --nos 3
+#     python cluster_local.py --verificar --nos 3 --conversas 600
+#     python cluster_local.py --verificar --servidor async
+# -------------------------------------------------
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+import urllib.error
+import urllib.request
+
+from bench_servidor import DIRETORIO_REPO, porta_livre, esperar_porta, payload_webhook
+from conversas_sinteticas import gerar_conversas
+
+TOKEN_ADMIN = "cluster-local"
+# Com o worker síncrono, cada repasse ocupa uma thread nos dois nós: com
+# poucas threads os nós ficam esperando uns pelos outros até o timeout
+COMANDOS_SERVIDOR = {
+    'flask': ["--threads", "32", "server:criar_app()"],
+    'async': ["--worker-class", "aiohttp.GunicornWebWorker", "server_async:criar_app()"],
+}
+# Campos da sessão que definem onde a conversa está (os horários variam entre as execuções)
+CAMPOS_COMPARADOS = ('MEMORIA_USUARIO', 'ATENDIMENTO_HUMANO_ATIVO', 'CONVERSA_ENCAMINHADA_HUMANO',
+                     'PRIMEIRA_MENSAGEM_RECEBIDA', 'IDIOMA')
+
+# -------------------------------------------------
+# Nós
+# -------------------------------------------------
+def url_no(porta):
+    return f"http://127.0.0.1:{porta}"
+
+def subir_no(porta, nos, servidor, diretorio_base, porta_stub):
+    """Sobe um nó na `porta` conhecendo a lista `nos` (que pode ainda não incluir ele mesmo)."""
+    diretorio = os.path.join(diretorio_base, f"no_{porta}")
+    os.makedirs(diretorio)
+    for arquivo in glob.glob(os.path.join(DIRETORIO_REPO, "RegrasLoja_v2*.txt")):
+        shutil.copy(arquivo, diretorio)
+    env = dict(os.environ)
+    env.update({
+        'SHOPEE_PARTNER_ID': env.get('SHOPEE_PARTNER_ID', '1'),
+        'SHOPEE_API_KEY': env.get('SHOPEE_API_KEY', 'local'),
+        'SHOPEE_API_SECRET': env.get('SHOPEE_API_SECRET', 'local'),
+        'SHOPEE_SHOP_ID': env.get('SHOPEE_SHOP_ID', '1'),
+        'SHOPEE_ACCESS_TOKEN_PLACEHOLDER': 'token-local',
+        'SHOPEE_BASE_URL': f"http://127.0.0.1:{porta_stub}",   # stub do bench_servidor.py
+        'PYTHONPATH': DIRETORIO_REPO,
+        'ADMIN_TOKEN': TOKEN_ADMIN,
+        'CLUSTER_NO': url_no(porta),
+        'CLUSTER_NOS': ",".join(nos),
+    })
+    log = open(os.path.join(diretorio, "no.log"), "w")
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(DIRETORIO_REPO, "gunicorn.conf.py"),
+         "-w", "1", "-b", f"127.0.0.1:{porta}"] + COMANDOS_SERVIDOR[servidor],
+        cwd=diretorio, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    esperar_porta(porta)
+    return processo
+
+def chamar(url, caminho, dados=None):
+    """GET (ou POST com `dados`) autenticado num nó. Retorna (status, JSON)."""
+    corpo = json.dumps(dados).encode('utf-8') if dados is not None else None
+    requisicao = urllib.request.Request(f"{url}{caminho}", data=corpo, headers={
+        "Content-Type": "application/json", "X-Admin-Token": TOKEN_ADMIN})
+    try:
+        with urllib.request.urlopen(requisicao, timeout=30) as resp:
+            return resp.status, json.loads(resp.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def anunciar_nos(urls, nos):
+    """Manda a nova lista de nós para cada nó em `urls`."""
+    for url in urls:
+        status, _ = chamar(url, "/cluster/nos", {"nos": nos})
+        if status != 200:
+            raise RuntimeError(f"{url} recusou a nova lista de nós (HTTP {status})")
+
+def esperar_migracao(urls, timeout=60):
+    """Espera todos os nós terminarem de enviar sessões."""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        estados = [chamar(url, "/cluster")[1] for url in urls]
+        if all(not e['migrando'] and not e['em_transito'] for e in estados):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"A migração não terminou em {timeout}s")
+
+def contadores_cluster(url):
+    """Lê do /metrics de um nó os contadores do cluster ({'nome{rotulos}': valor})."""
+    with urllib.request.urlopen(f"{url}/metrics", timeout=30) as resp:
+        texto = resp.read().decode('utf-8')
+    contadores = {}
+    for linha in texto.splitlines():
+        if linha.startswith("bot_cluster_"):
+            nome, valor = linha.rsplit(" ", 1)
+            contadores[nome] = float(valor)
+    return contadores
+
+# -------------------------------------------------
+# Roteiro de verificação
+# -------------------------------------------------
+def enviar(urls_ativas, trava, numero, mensagem, message_id):
+    """Envia uma mensagem da conversa `numero` a um nó sorteado (de novo, se ele estiver indisponível)."""
+    payload = payload_webhook(numero, mensagem)
+    payload['data']['message']['message_id'] = message_id
+    corpo = json.dumps(payload).encode('utf-8')
+    for _ in range(5):
+        with trava:
+            url = random.choice(urls_ativas)
+        requisicao = urllib.request.Request(f"{url}/shopee/webhook", data=corpo,
+                                            headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(requisicao, timeout=30) as resp:
+                resp.read()
+                return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.05)   # como a Shopee, reenvia o mesmo webhook
+    return False
+
+def estados_de_referencia(conversas):
+    """Estado final de cada conversa processada num processo só, direto no bot_logic."""
+    import bot_logic
+    import gravador
+    diretorio = tempfile.mkdtemp(prefix="cluster_local_ref_")
+    anterior = os.getcwd()
+    os.chdir(diretorio)   # arquivos de pedido
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for numero, (_, _, mensagens) in enumerate(conversas):
+                for mensagem in mensagens:
+                    bot_logic.processar_mensagem_shopee(str(numero + 1), mensagem)
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+    return {str(numero + 1): json.loads(json.dumps(gravador.estado_para_json(bot_logic.SESSAO_ESTADOS[str(numero + 1)])))
+            for numero in range(len(conversas))}
+
+def verificar(args, diretorio_base, porta_stub):
+    random.seed(args.semente)
+    portas = [porta_livre() for _ in range(args.nos + 1)]
+    nos = [url_no(p) for p in portas[:args.nos]]
+    processos = {url_no(p): subir_no(p, nos, args.servidor, diretorio_base, porta_stub)
+                 for p in portas[:args.nos]}
+    conversas = list(gerar_conversas(args.conversas, args.semente))
+    total = sum(len(mensagens) for _, _, mensagens in conversas)
+
+    urls_ativas = list(nos)   # o que o "balanceador" conhece
+    trava = threading.Lock()
+    enviadas = [0]
+    falhas = [0]
+
+    def trabalhador(indices):
+        for numero in indices:
+            for posicao, mensagem in enumerate(conversas[numero][2]):
+                if not enviar(urls_ativas, trava, numero, mensagem, f"{numero}-{posicao}"):
+                    with trava:
+                        falhas[0] += 1
+                with trava:
+                    enviadas[0] += 1
+
+    inicio = time.perf_counter()
+    indices = list(range(len(conversas)))
+    threads = [threading.Thread(target=trabalhador, args=(indices[i::args.simultaneas],))
+               for i in range(args.simultaneas)]
+    for t in threads:
+        t.start()
+
+    def esperar_progresso(fracao):
+        while enviadas[0] < total * fracao and any(t.is_alive() for t in threads):
+            time.sleep(0.01)
+
+    # Entrada de um nó: sobe com a lista atual e só depois a lista nova é anunciada a todos
+    esperar_progresso(1 / 3)
+    novo = url_no(portas[-1])
+    processos[novo] = subir_no(portas[-1], nos, args.servidor, diretorio_base, porta_stub)
+    nos = sorted(nos + [novo])
+    anunciar_nos([novo] + [no for no in nos if no != novo], nos)   # o nó que entra primeiro
+    with trava:
+        urls_ativas.append(novo)
+    print(f"ℹ️ {novo} entrou no cluster ({enviadas[0]}/{total} mensagens enviadas).")
+
+    # Saída de um nó: sai do balanceador, recebe a lista sem ele, envia as sessões e para
+    esperar_progresso(2 / 3)
+    saindo = next(no for no in nos if no != novo)   # um dos nós originais
+    with trava:
+        urls_ativas.remove(saindo)
+    nos = [no for no in nos if no != saindo]
+    anunciar_nos(nos + [saindo], nos)   # o nó que sai por último
+    esperar_migracao(nos + [saindo])
+    anunciar_nos(nos, nos)              # encerra a janela: ninguém mais busca no nó que sai
+    contadores_saida = contadores_cluster(saindo)
+    processos.pop(saindo).terminate()
+    print(f"ℹ️ {saindo} saiu do cluster ({enviadas[0]}/{total} mensagens enviadas).")
+
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    esperar_migracao(nos)
+
+    referencia = estados_de_referencia(conversas)
+    divergencias = []
+    por_no = {no: 0 for no in nos}
+    for sessao_id, esperado in referencia.items():
+        encontrados = []
+        for no in nos:
+            status, resposta = chamar(no, f"/cluster/sessao?id={sessao_id}")
+            if status == 200:
+                encontrados.append((no, resposta['estado']))
+        if len(encontrados) != 1:
+            divergencias.append({'sessao_id': sessao_id, 'erro': f"está em {len(encontrados)} nós"})
+            continue
+        no, estado = encontrados[0]
+        por_no[no] += 1
+        diferentes = [campo for campo in CAMPOS_COMPARADOS if estado.get(campo) != esperado.get(campo)]
+        if diferentes:
+            divergencias.append({'sessao_id': sessao_id, 'no': no, 'campos': diferentes})
+
+    contadores = dict(contadores_saida)
+    for no in nos:
+        for nome, valor in contadores_cluster(no).items():
+            contadores[nome] = contadores.get(nome, 0) + valor
+    for processo in processos.values():
+        processo.terminate()
+
+    resultado = {
+        'servidor': args.servidor,
+        'conversas': len(conversas),
+        'mensagens': total,
+        'mensagens_s': round(total / duracao, 1),
+        'falhas_envio': falhas[0],
+        'sessoes_por_no': por_no,
+        'contadores': contadores,
+        'divergencias': len(divergencias),
+    }
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    for divergencia in divergencias[:10]:
+        print(f"❌ {divergencia}")
+    return not divergencias and not falhas[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster de nós locais (hash consistente por conversa).")
+    parser.add_argument('--nos', type=int, default=3)
+    parser.add_argument('--servidor', choices=sorted(COMANDOS_SERVIDOR), default='flask')
+    parser.add_argument('--verificar', action='store_true', help="Roda o roteiro de entrada/saída de nós e compara os estados")
+    parser.add_argument('--conversas', type=int, default=600)
+    parser.add_argument('--simultaneas', type=int, default=16, help="Conversas enviadas em paralelo")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--latencia-shopee-ms', type=int, default=20)
+    args = parser.parse_args()
+
+    diretorio_base = tempfile.mkdtemp(prefix="cluster_local_")
+    porta_stub = porta_livre()
+    stub = subprocess.Popen([sys.executable, os.path.join(DIRETORIO_REPO, "bench_servidor.py"), "--stub", str(porta_stub),
+                             "--latencia-shopee-ms", str(args.latencia_shopee_ms)])
+    try:
+        esperar_porta(porta_stub)
+        if args.verificar:
+            sys.exit(0 if verificar(args, diretorio_base, porta_stub) else 1)
+
+        portas = [porta_livre() for _ in range(args.nos)]
+        nos = [url_no(p) for p in portas]
+        processos = [subir_no(p, nos, args.servidor, diretorio_base, porta_stub) for p in portas]
+        print(f"✅ {len(nos)} nós no ar: {', '.join(nos)} (logs em {diretorio_base}).")
+        print(f"   Token dos endpoints /cluster/*: {TOKEN_ADMIN}. Ctrl+C encerra.")
+        try:
+            while all(p.poll() is None for p in processos):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        for processo in processos:
+            processo.terminate()
+    finally:
+        stub.terminate()
+        shutil.rmtree(diretorio_base, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
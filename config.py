@@ -0,0 +1,88 @@
+# config.py - Configuração do bot lida uma única vez
+# -------------------------------------------------
+# carregar_env() lê o arquivo .env (uma vez por processo) e deve ser
+# chamado pelos servidores antes de importar os outros módulos, que leem
+# suas variáveis no import.
+#
+# configuracao_shopee() valida as credenciais da Shopee e guarda o
+# resultado. Se faltar alguma variável ou algum valor for inválido,
+# levanta ErroConfiguracao listando TODOS os problemas de uma vez, em vez
+# de quebrar no import com `int(None)`.
+# -------------------------------------------------
+
+import os
+from types import SimpleNamespace
+
+class ErroConfiguracao(RuntimeError):
+    """Variáveis de ambiente ausentes ou inválidas."""
+
+_env_carregado = False
+_configuracao_shopee = None
+
+DIRETORIO_PROJETO = os.path.dirname(os.path.abspath(__file__))
+
+def carregar_env():
+    """
+    Carrega o .env ao lado dos fontes (ou, se não houver, o do diretório atual).
+    Só a primeira chamada faz algo; variáveis já definidas no ambiente prevalecem.
+    """
+    global _env_carregado
+    if _env_carregado:
+        return
+    _env_carregado = True
+    for caminho in (os.path.join(DIRETORIO_PROJETO, ".env"), ".env"):
+        if os.path.exists(caminho):
+            from dotenv import load_dotenv   # só importa o python-dotenv se houver .env
+            load_dotenv(caminho)
+            return
+
+def _texto(nome, erros, obrigatoria=True, padrao=None):
+    valor = os.getenv(nome, '').strip()
+    if not valor:
+        if obrigatoria:
+            erros.append(f"{nome} não definida")
+        return padrao
+    return valor
+
+def _inteiro(nome, erros):
+    valor = _texto(nome, erros)
+    if valor is None:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        erros.append(f"{nome} deve ser um número inteiro (recebido: {valor!r})")
+        return None
+
+def configuracao_shopee():
+    """
+    Retorna as credenciais da Shopee validadas (partner_id, api_key,
+    api_secret em bytes, shop_id, base_url). Levanta ErroConfiguracao.
+    """
+    global _configuracao_shopee
+    if _configuracao_shopee is not None:
+        return _configuracao_shopee
+
+    carregar_env()
+    erros = []
+    partner_id = _inteiro('SHOPEE_PARTNER_ID', erros)
+    api_key = _texto('SHOPEE_API_KEY', erros)
+    api_secret = _texto('SHOPEE_API_SECRET', erros)
+    shop_id = _inteiro('SHOPEE_SHOP_ID', erros)
+    base_url = _texto('SHOPEE_BASE_URL', erros, obrigatoria=False, padrao="https://open.shopee.com")
+    if not base_url.startswith(("http://", "https://")):
+        erros.append(f"SHOPEE_BASE_URL deve começar com http:// ou https:// (recebido: {base_url!r})")
+    if erros:
+        raise ErroConfiguracao(
+            "Configuração da Shopee inválida (confira o .env ou as variáveis de ambiente):\n  - "
+            + "\n  - ".join(erros)
+        )
+
+    _configuracao_shopee = SimpleNamespace(
+        partner_id=partner_id,
+        api_key=api_key,
+        api_secret=api_secret.encode('utf-8'),   # a chave secreta deve ser bytes
+        shop_id=shop_id,
+        base_url=base_url.rstrip('/'),
+    )
+    return _configuracao_shopee
@@ -0,0 +1,192 @@
+# conversas_sinteticas.py - Gerador de conversas realistas para testes de carga
+# -------------------------------------------------
+# Gera conversas de vários turnos cobrindo todos os fluxos do bot:
+# personalização com nome (inclusive nome inválido e correção), com foto,
+# pedidos com várias capinhas numa mensagem só (uma por linha ou com ';'),
+# consulta de capinha, devolução/reembolso, submenu de dúvidas, perguntas
+# por palavra-chave e atendimento humano (com a frase de finalização do
+# atendente e o cancelamento pelo cliente).
+#
+# As conversas são determinísticas para uma mesma semente, então servem
+# tanto para benchmark quanto para comparação entre versões.
+# -------------------------------------------------
+
+import random
+
+from bot_logic import FINALIZACAO_ATENDENTE_HUMANO_FRASE
+
+MODELOS = [
+    "iPhone 11", "iPhone 12", "iPhone 13", "iPhone 13 Pro", "iPhone 14", "iPhone 15 Pro Max",
+    "Samsung S21", "Samsung A54", "Galaxy S23 Ultra", "Moto G84", "Moto G54", "Redmi Note 12",
+    "Capa verde", "Estampa BS-056", "Estampa BS-057",
+]
+TEMAS = ["Tema Flores", "Tema Pet", "Foto da família", "Tema Praia", "Tema Futebol"]
+NOMES = ["Ana", "João", "Maria Clara", "Pedro", "Alex", "Luíza", "José", "Beatriz", "Enzo", "Helena"]
+NOMES_INVALIDOS = ["Ana ❤️", "J0ão", "Maria Clara da Silva Souza", "@pedro", "Nome123"]
+ARQUIVOS_FOTO = ["minha_foto.jpg", "foto_do_pet.png", "familia.jpeg", "praia.PNG", "gatinho.gif"]
+PERGUNTAS_PALAVRA_CHAVE = [
+    "qual o prazo de envio?", "comprei errado", "quais as formas de pagamento",
+    "posso ver minha capinha antes?", "a capinha amarela com o tempo?",
+    "tem cupom de desconto?", "não sei meu modelo de celular",
+]
+SAUDACOES = ["oi", "olá", "Oi", "tudo bem", "Boa tarde"]
+
+# Peso de cada fluxo na mistura de conversas (aproxima o tráfego real: muita dúvida)
+PESOS_FLUXOS = {
+    'personalizacao_nome': 20,
+    'personalizacao_foto': 10,
+    'personalizacao_nome_lote': 8,
+    'personalizacao_foto_lote': 4,
+    'consulta_capinha': 10,
+    'devolucao': 8,
+    'duvidas': 30,
+    'palavra_chave': 12,
+    'atendimento_humano': 10,
+}
+
+# -------------------------------------------------
+# Roteiros por fluxo
+# -------------------------------------------------
+def _conversa_nome(rnd):
+    quantidade = rnd.randint(1, 3)
+    msgs = [rnd.choice(SAUDACOES), "1", str(quantidade)]
+    for _ in range(quantidade):
+        modelo = rnd.choice(MODELOS)
+        if rnd.random() < 0.2:
+            msgs.append(f"{modelo}, {rnd.choice(NOMES_INVALIDOS)}")
+            msgs.append(rnd.choice(NOMES))
+        else:
+            msgs.append(f"{modelo}, {rnd.choice(NOMES)}")
+    if rnd.random() < 0.2:
+        msgs.append("não")
+        msgs.append(f"Capinha 1, {rnd.choice(NOMES)}")
+    msgs.append("sim")
+    msgs.append(rnd.choice(["1", "2"]))
+    return msgs
+
+def _conversa_foto(rnd):
+    quantidade = rnd.randint(1, 3)
+    msgs = [rnd.choice(SAUDACOES), "2", str(quantidade)]
+    for _ in range(quantidade):
+        msgs.append(rnd.choice(MODELOS + TEMAS))
+        if rnd.random() < 0.15:
+            msgs.append("vou mandar a foto")
+        msgs.append(rnd.choice(ARQUIVOS_FOTO))
+    msgs.append("sim")
+    msgs.append(rnd.choice(["1", "2"]))
+    return msgs
+
+def _conversa_nome_lote(rnd):
+    # Todas as capinhas numa mensagem só, às vezes sem informar a quantidade antes
+    quantidade = rnd.randint(2, 5)
+    msgs = [rnd.choice(SAUDACOES), "1"]
+    if rnd.random() < 0.5:
+        msgs.append(str(quantidade))
+    itens = [f"{rnd.choice(MODELOS)}, {rnd.choice(NOMES)}" for _ in range(quantidade)]
+    invalida = rnd.randrange(quantidade) if rnd.random() < 0.2 else None
+    if invalida is not None:
+        itens[invalida] = f"{rnd.choice(MODELOS)}, {rnd.choice(NOMES_INVALIDOS)}"
+    msgs.append(rnd.choice(["\n", "; "]).join(itens))
+    if invalida is not None:
+        msgs.append(f"{rnd.choice(MODELOS)}, {rnd.choice(NOMES)}")
+    msgs.append("sim")
+    msgs.append(rnd.choice(["1", "2"]))
+    return msgs
+
+def _conversa_foto_lote(rnd):
+    quantidade = rnd.randint(2, 5)
+    msgs = [rnd.choice(SAUDACOES), "2"]
+    itens = [f"{rnd.choice(MODELOS + TEMAS)}, {rnd.choice(ARQUIVOS_FOTO)}" for _ in range(quantidade)]
+    msgs.append("\n".join(itens))
+    msgs.append("sim")
+    msgs.append(rnd.choice(["1", "2"]))
+    return msgs
+
+def _conversa_consulta(rnd):
+    msgs = [rnd.choice(SAUDACOES), "3", rnd.choice(MODELOS + TEMAS), "alguém aí?"]
+    if rnd.random() < 0.5:
+        msgs.append("cancelar atendimento humano")
+        msgs.append("6")
+    return msgs
+
+def _conversa_devolucao(rnd):
+    inicio = rnd.choice(["4", "quero reembolso", "como faço a devolução?"])
+    return [rnd.choice(SAUDACOES), inicio, rnd.choice(["1", "2", "talvez"])]
+
+def _conversa_duvidas(rnd):
+    msgs = [rnd.choice(SAUDACOES), "5"]
+    for _ in range(rnd.randint(1, 3)):
+        msgs.append(str(rnd.randint(1, 10)))
+        msgs.append("2")
+    msgs.append(str(rnd.randint(1, 10)))
+    msgs.append(rnd.choice(["1", "3"]))
+    return msgs
+
+def _conversa_palavra_chave(rnd):
+    msgs = [rnd.choice(SAUDACOES)]
+    msgs.extend(rnd.sample(PERGUNTAS_PALAVRA_CHAVE, rnd.randint(1, 3)))
+    msgs.append(rnd.choice(["obrigado", "blablabla", "sair"]))
+    return msgs
+
+def _conversa_atendimento_humano(rnd):
+    msgs = [rnd.choice(SAUDACOES), rnd.choice(["falar com atendente", "Falar com atendimento humano"]),
+            "preciso trocar o nome do meu pedido"]
+    if rnd.random() < 0.7:
+        # O atendente encerra e o cliente volta a falar com a assistente
+        msgs.append(FINALIZACAO_ATENDENTE_HUMANO_FRASE)
+        msgs.append("menu")
+        msgs.append("6")
+    else:
+        msgs.append("cancelar atendimento humano")
+        msgs.append("5")
+        msgs.append("12")
+    return msgs
+
+ROTEIROS = {
+    'personalizacao_nome': _conversa_nome,
+    'personalizacao_foto': _conversa_foto,
+    'personalizacao_nome_lote': _conversa_nome_lote,
+    'personalizacao_foto_lote': _conversa_foto_lote,
+    'consulta_capinha': _conversa_consulta,
+    'devolucao': _conversa_devolucao,
+    'duvidas': _conversa_duvidas,
+    'palavra_chave': _conversa_palavra_chave,
+    'atendimento_humano': _conversa_atendimento_humano,
+}
+
+def gerar_conversas(quantidade, semente=42, fluxos=None):
+    """
+    Gera `quantidade` conversas como tuplas (sessao_id, fluxo, [mensagens]).
+    `fluxos` restringe a mistura a alguns fluxos (por padrão, todos com PESOS_FLUXOS).
+    """
+    rnd = random.Random(semente)
+    nomes_fluxos = list(fluxos or PESOS_FLUXOS)
+    pesos = [PESOS_FLUXOS[f] for f in nomes_fluxos]
+    for i in range(quantidade):
+        fluxo = rnd.choices(nomes_fluxos, weights=pesos)[0]
+        yield f"bench-{semente}-{i}", fluxo, ROTEIROS[fluxo](rnd)
+
+def intercalar(conversas, simultaneas):
+    """
+    Intercala as mensagens de até `simultaneas` conversas abertas ao mesmo
+    tempo, como acontece no webhook. Gera (sessao_id, mensagem).
+    """
+    conversas = iter(conversas)
+    abertas = []
+    for _ in range(simultaneas):
+        proxima = next(conversas, None)
+        if proxima is None:
+            break
+        abertas.append([proxima[0], iter(proxima[2])])
+    while abertas:
+        ainda_abertas = []
+        for sessao_id, mensagens in abertas:
+            mensagem = next(mensagens, None)
+            if mensagem is None:
+                proxima = next(conversas, None)
+                if proxima is not None:
+                    ainda_abertas.append([proxima[0], iter(proxima[2])])
+                continue
+            yield sessao_id, mensagem
+            ainda_abertas.append([sessao_id, mensagens])
+        abertas = ainda_abertas
@@ -0,0 +1,161 @@
+# exportacao.py - Exportação dos pedidos para a fila da produção
+# -------------------------------------------------
+# Lê o pedidos.jsonl (pedidos.py) desde a última exportação e acrescenta
+# os pedidos novos em DESTINO:
+#   - pedidos_AAAA-MM-DD.csv e pedidos_AAAA-MM-DD.jsonl: um lote por dia
+#     (dia em que o pedido foi confirmado);
+#   - folhas/AAAA-MM-DD/<modelo>.txt: folhas de impressão agrupadas por
+#     modelo de celular (ou estampa/tema), para a oficina imprimir tudo de
+#     um mesmo modelo de uma vez.
+#   - cursor.json: posição (em bytes) do pedidos.jsonl já exportada. A
+#     próxima execução continua dali.
+#
+# Os pedidos são processados um a um (gerador) e no máximo
+# MAX_ARQUIVOS_ABERTOS arquivos de saída ficam abertos (LRU): a memória é
+# constante, independente do tamanho do pedidos.jsonl. O cursor só é
+# gravado no fim; se a exportação for interrompida, a próxima repete o
+# lote interrompido.
+#
+# Uso (ex.: no cron, a cada hora):
+#     python exportacao.py exportacao/
+#     python exportacao.py exportacao/ --desde 0      # reexporta tudo
+# -------------------------------------------------
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+import datetime
+from collections import OrderedDict
+
+import pedidos
+
+CAMPOS_CSV = ('pedido', 'tipo', 'modelo', 'nome', 'foto', 'criado_em')
+MAX_ARQUIVOS_ABERTOS = int(os.getenv('EXPORTACAO_MAX_ARQUIVOS', '256'))   # cobre um dia inteiro do catálogo
+
+class ArquivosSaida:
+    """Arquivos de saída abertos para acréscimo, limitados aos mais usados (LRU)."""
+
+    def __init__(self, limite=MAX_ARQUIVOS_ABERTOS):
+        self.limite = limite
+        self.abertos = OrderedDict()   # chave -> arquivo
+        self.criados = set()
+
+    def obter(self, chave, caminho, cabecalho=None):
+        """
+        Retorna o arquivo aberto para `chave`. `caminho` é uma função que monta o
+        caminho (só chamada se o arquivo não estiver aberto); se o arquivo ainda
+        não existe, cria e escreve o `cabecalho`.
+        """
+        arquivo = self.abertos.get(chave)
+        if arquivo is not None:
+            self.abertos.move_to_end(chave)
+            return arquivo
+        caminho = caminho()
+        novo = not os.path.exists(caminho)
+        if novo:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            self.criados.add(caminho)
+        arquivo = open(caminho, "a", encoding="utf-8", newline="")
+        if novo and cabecalho:
+            arquivo.write(cabecalho)
+        self.abertos[chave] = arquivo
+        if len(self.abertos) > self.limite:
+            _, antigo = self.abertos.popitem(last=False)
+            antigo.close()
+        return arquivo
+
+    def fechar(self):
+        for arquivo in self.abertos.values():
+            arquivo.close()
+        self.abertos.clear()
+
+def _nome_arquivo(texto):
+    """Nome de arquivo seguro a partir do modelo/tema."""
+    return re.sub(r"[^\w.-]+", "_", texto, flags=re.UNICODE).strip("_") or "sem_modelo"
+
+def _cabecalho_folha(modelo, dia):
+    return (f"FOLHA DE IMPRESSÃO - {modelo} - {dia}\n"
+            "[ ] Pedido                 | Tipo | Nome gravado / Arquivo da foto\n")
+
+def _linha_folha(pedido):
+    detalhe = pedido.get('nome') if pedido.get('tipo') == 'nome' else pedido.get('foto')
+    return f"[ ] {pedido.get('pedido', ''):<22} | {pedido.get('tipo', ''):<4} | {detalhe or ''}\n"
+
+def ler_cursor(destino):
+    """Posição (bytes) do pedidos.jsonl já exportada para `destino` (0 se nunca exportou)."""
+    try:
+        with open(os.path.join(destino, "cursor.json"), encoding="utf-8") as f:
+            return int(json.load(f)['posicao'])
+    except FileNotFoundError:
+        return 0
+
+def gravar_cursor(destino, posicao):
+    caminho = os.path.join(destino, "cursor.json")
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump({'posicao': posicao, 'exportado_em': datetime.datetime.now().isoformat(timespec='seconds')}, f)
+    os.replace(temporario, caminho)
+
+def exportar(destino, desde=None, arquivo_pedidos=None):
+    """
+    Exporta os pedidos novos (desde o cursor salvo em `destino`, ou desde a
+    posição `desde`) e avança o cursor. Retorna um resumo da exportação.
+    """
+    arquivo_pedidos = arquivo_pedidos or pedidos.ARQUIVO_PEDIDOS
+    os.makedirs(destino, exist_ok=True)
+    inicio = ler_cursor(destino) if desde is None else desde
+    tamanho = os.path.getsize(arquivo_pedidos) if os.path.exists(arquivo_pedidos) else 0
+    if inicio > tamanho:
+        print(f"⚠️ ATENÇÃO: o cursor ({inicio}) passa do fim de {arquivo_pedidos} ({tamanho} bytes). "
+              "O arquivo foi trocado? Exportando desde o início.")
+        inicio = 0
+
+    saidas = ArquivosSaida()
+    posicao = inicio
+    quantidade = 0
+    dias = set()
+    try:
+        for posicao, linha in pedidos.ler_linhas(inicio, arquivo_pedidos):
+            pedido = json.loads(linha)
+            dia = (pedido.get('criado_em') or '')[:10] or "sem_data"
+            dias.add(dia)
+            arquivo_csv = saidas.obter(('csv', dia), lambda: os.path.join(destino, f"pedidos_{dia}.csv"),
+                                       ",".join(CAMPOS_CSV) + "\r\n")
+            csv.writer(arquivo_csv).writerow([pedido.get(campo) for campo in CAMPOS_CSV])
+            saidas.obter(('jsonl', dia), lambda: os.path.join(destino, f"pedidos_{dia}.jsonl")).write(linha.decode('utf-8'))
+            modelo = pedido.get('modelo') or "sem_modelo"
+            saidas.obter(('folha', dia, modelo),
+                         lambda: os.path.join(destino, "folhas", dia, _nome_arquivo(modelo) + ".txt"),
+                         _cabecalho_folha(modelo, dia)).write(_linha_folha(pedido))
+            quantidade += 1
+    finally:
+        saidas.fechar()
+    if posicao != inicio:
+        gravar_cursor(destino, posicao)
+    return {
+        'pedidos': quantidade,
+        'desde': inicio,
+        'cursor': posicao,
+        'dias': sorted(dias),
+        'arquivos_criados': len(saidas.criados),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta os pedidos novos para CSV/JSONL diários e folhas de impressão.")
+    parser.add_argument('destino', nargs='?', default="exportacao")
+    parser.add_argument('--desde', type=int, default=None, help="Posição (bytes) inicial; padrão: cursor salvo no destino")
+    parser.add_argument('--arquivo', default=None, help="Arquivo de pedidos (padrão: PEDIDOS_ARQUIVO ou pedidos.jsonl)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resumo = exportar(args.destino, args.desde, args.arquivo)
+    print(f"✅ {resumo['pedidos']} pedidos exportados para {args.destino} em {time.perf_counter() - inicio:.2f}s "
+          f"(bytes {resumo['desde']} -> {resumo['cursor']}, dias: {', '.join(resumo['dias']) or '-'}).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
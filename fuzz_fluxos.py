@@ -0,0 +1,508 @@
+# fuzz_fluxos.py - Fuzzing da máquina de estados das conversas
+# -------------------------------------------------
+# Gera sequências aleatórias de mensagens em grande volume e as processa
+# com processar_mensagem_shopee no próprio processo. Cada conversa parte
+# de um roteiro de conversas_sinteticas.py (para chegar fundo nos fluxos)
+# e é mutada no caminho: mensagens trocadas, inseridas ou puladas, com o
+# vocabulário do bot (números do menu, sim/não, voltar, modelos, nomes,
+# arquivos de foto, correções, lotes), lixo (emoji, textos enormes,
+# separadores soltos), mensagens do atendente humano e expirações. Várias
+# conversas ficam abertas ao mesmo tempo, intercaladas como no webhook.
+#
+# A cada passo confere as invariantes (ver verificar_resposta e
+# verificar_sessao):
+#   - nenhuma exceção;
+#   - a assistente sempre responde com texto, exceto com a conversa nas
+#     mãos do atendente humano, quando fica em silêncio (None);
+#   - o indicador de encaminhamento devolvido bate com a sessão;
+#   - o estado do fluxo é coerente (contadores de capinhas e os dados
+#     temporários que o próximo passo vai ler).
+# No fim de cada conversa confere que a sessão sobrevive ao JSON do
+# gravador (persistência e cluster) e, numa fração delas, que o cache de
+# respostas não muda nenhuma resposta (a conversa é refeita sem cache).
+#
+# Uma falha é reduzida à menor sequência de eventos que ainda falha e
+# gravada em JSON para ser reproduzida:
+#     python fuzz_fluxos.py --passos 2000000
+#     python fuzz_fluxos.py --reproduzir fuzz_falha.json
+# Sem falhas, mostra o custo por mensagem (p50/p99, os passos mais lentos
+# e a média por fluxo) e quantos estados e transições foram visitados.
+# -------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import random
+import shutil
+import argparse
+import tempfile
+import traceback
+from array import array
+
+import bot_logic
+import agendador
+import gravador
+import cache_respostas
+import conversas_sinteticas as sinteticas
+from bench_servidor import percentil
+
+# Eventos de uma conversa: ('cliente', texto), ('atendente', texto) ou ('expirar',)
+CLIENTE, ATENDENTE, EXPIRAR = 'cliente', 'atendente', 'expirar'
+
+# Os números de pedido mudam a cada execução (ver gerar_id_pedido)
+PADRAO_ID_PEDIDO = re.compile(r"\d{8}-\d{4}-\d+")
+
+# -------------------------------------------------
+# Geração de mensagens
+# -------------------------------------------------
+# Tudo que algum fluxo compara com a mensagem, mais números fora das faixas esperadas
+VOCABULARIO = tuple(dict.fromkeys(
+    [str(n) for n in range(-1, 13)] + ["01", "1.5", " 2 ", "99999999999999999999", "um", "dois"]
+    + list(bot_logic.COMANDOS_VOLTAR + bot_logic.RESPOSTAS_SIM + bot_logic.RESPOSTAS_NAO + bot_logic.COMANDOS_SAIR
+           + bot_logic.COMANDOS_MENU + bot_logic.SAUDACOES + bot_logic.AGRADECIMENTOS
+           + bot_logic.COMANDOS_FALAR_HUMANO + bot_logic.COMANDOS_CANCELAR_HUMANO + bot_logic.PALAVRAS_DEVOLUCAO)
+    + [trecho for trechos, _ in bot_logic.PALAVRAS_CHAVE_FAQ for trecho in trechos]
+    + sinteticas.MODELOS + sinteticas.TEMAS + sinteticas.NOMES + sinteticas.NOMES_INVALIDOS
+    + sinteticas.ARQUIVOS_FOTO + sinteticas.PERGUNTAS_PALAVRA_CHAVE
+    + [bot_logic.FINALIZACAO_ATENDENTE_HUMANO_FRASE, "", " ", "\n", ",", ";", ", ,", "Capinha", "foto.jpg", ".png"]
+))
+CARACTERES_LIXO = "aeiouAEIOUçãéñü0123456789 ,;.\n\t-_/@#!?'\"\\{}%❤️😀🙏"
+MENSAGEM_ATENDENTE = "Oi, aqui é a atendente. Já vou verificar o seu pedido."
+
+def _item_nome(rnd):
+    return f"{rnd.choice(sinteticas.MODELOS)}, {rnd.choice(sinteticas.NOMES + sinteticas.NOMES_INVALIDOS)}"
+
+def _item_foto(rnd):
+    return f"{rnd.choice(sinteticas.MODELOS + sinteticas.TEMAS)}, {rnd.choice(sinteticas.ARQUIVOS_FOTO)}"
+
+def _lote(rnd):
+    itens = [rnd.choice((_item_nome, _item_foto))(rnd) for _ in range(rnd.randint(2, 6))]
+    return rnd.choice(("\n", "; ", ";")).join(itens)
+
+def _correcao_nome(rnd):
+    capinha = rnd.choice(bot_logic.PALAVRAS_CAPINHA).title()
+    return f"{capinha} {rnd.randint(0, 6)}, {rnd.choice(sinteticas.NOMES + sinteticas.NOMES_INVALIDOS)}"
+
+def _correcao_foto(rnd):
+    arquivo = rnd.choice(sinteticas.ARQUIVOS_FOTO + ["foto.txt", ""])
+    return f"Capinha {rnd.randint(0, 6)}, {rnd.choice(sinteticas.MODELOS + sinteticas.TEMAS)}, {arquivo}"
+
+def _lixo(rnd):
+    tamanho = rnd.randint(1000, 5000) if rnd.random() < 0.05 else rnd.randint(0, 40)
+    return "".join(rnd.choices(CARACTERES_LIXO, k=tamanho))
+
+GERADORES = (_item_nome, _item_foto, _lote, _correcao_nome, _correcao_foto,
+             lambda rnd: f"nome {rnd.choice(sinteticas.NOMES)}")
+VARIACOES = (str.upper, str.title, lambda texto: f"  {texto}  ")
+
+def mensagem_aleatoria(rnd):
+    sorteio = rnd.random()
+    if sorteio < 0.6:
+        texto = rnd.choice(VOCABULARIO)
+    elif sorteio < 0.85:
+        texto = rnd.choice(GERADORES)(rnd)
+    else:
+        texto = _lixo(rnd)
+    if rnd.random() < 0.1:
+        texto = rnd.choice(VARIACOES)(texto)
+    return texto
+
+def _evento_extra(rnd):
+    sorteio = rnd.random()
+    if sorteio < 0.04:
+        return (EXPIRAR,)
+    if sorteio < 0.08:
+        return (ATENDENTE, rnd.choice((bot_logic.FINALIZACAO_ATENDENTE_HUMANO_FRASE, MENSAGEM_ATENDENTE)))
+    return (CLIENTE, mensagem_aleatoria(rnd))
+
+FLUXOS = list(sinteticas.PESOS_FLUXOS)
+PESOS = [sinteticas.PESOS_FLUXOS[f] for f in FLUXOS]
+
+def eventos_conversa(rnd, mutacao):
+    """Eventos de uma conversa: um roteiro sintético com mensagens trocadas, inseridas e puladas."""
+    eventos = []
+    if rnd.random() < 0.02:
+        eventos.append((ATENDENTE, MENSAGEM_ATENDENTE))   # o atendente escreve antes do cliente
+    for mensagem in sinteticas.ROTEIROS[rnd.choices(FLUXOS, weights=PESOS)[0]](rnd):
+        while rnd.random() < mutacao / 2:
+            eventos.append(_evento_extra(rnd))
+        sorteio = rnd.random()
+        if sorteio < mutacao / 4:
+            continue
+        if sorteio < mutacao / 2:
+            mensagem = mensagem_aleatoria(rnd)
+        eventos.append((CLIENTE, mensagem))
+    while rnd.random() < mutacao or not eventos:
+        eventos.append(_evento_extra(rnd))
+    return eventos
+
+# -------------------------------------------------
+# Invariantes
+# -------------------------------------------------
+class Falha(Exception):
+    """Invariante violada (ou exceção) num evento. `invariante` identifica a falha na redução."""
+
+    def __init__(self, invariante, detalhe, indice=None):
+        super().__init__(f"{invariante}: {detalhe}")
+        self.invariante = invariante
+        self.detalhe = detalhe
+        self.indice = indice
+
+# Dados que o próximo passo do fluxo lê da memória
+PENDENTES_POR_ESTADO = {
+    'aguardando_upload_foto': ('modelo_tema_atual_foto',),
+    'aguardando_correcao_nome': ('modelo_para_correcao', 'nome_para_correcao'),
+}
+ESTADOS_EM_ANDAMENTO = ('aguardando_modelo_nome', 'aguardando_correcao_nome',
+                        'aguardando_modelo_foto', 'aguardando_upload_foto')
+ESTADOS_CONFIRMACAO = ('confirmacao_final', 'aguardando_correcao_final')
+
+def silencio_esperado(humano_ativo, encaminhada, texto):
+    """A assistente deve ficar calada: a conversa está com o atendente e o cliente não pediu para cancelar."""
+    if not humano_ativo:
+        return False
+    if texto.strip() == bot_logic.FINALIZACAO_ATENDENTE_HUMANO_FRASE:
+        return True
+    return encaminhada and texto.lower().strip() not in bot_logic.COMANDOS_CANCELAR_HUMANO
+
+def verificar_resposta(silencio, resposta, encaminhado, sessao):
+    if silencio and resposta is not None:
+        raise Falha("respondeu durante o atendimento humano", repr(resposta[:200]))
+    if not silencio and not (isinstance(resposta, str) and resposta.strip()):
+        raise Falha("não respondeu", repr(resposta))
+    if encaminhado != sessao['CONVERSA_ENCAMINHADA_HUMANO']:
+        raise Falha("indicador de encaminhamento diferente da sessão",
+                    f"devolveu {encaminhado}, sessão {sessao['CONVERSA_ENCAMINHADA_HUMANO']}")
+
+def verificar_sessao(sessao):
+    if sessao['ATENDIMENTO_HUMANO_ATIVO'] != sessao['CONVERSA_ENCAMINHADA_HUMANO']:
+        raise Falha("flags de atendimento humano divergentes",
+                    f"ativo={sessao['ATENDIMENTO_HUMANO_ATIVO']} encaminhada={sessao['CONVERSA_ENCAMINHADA_HUMANO']}")
+    memoria = sessao['MEMORIA_USUARIO']
+    ativos = [campo for campo in bot_logic.CAMPO_ESTADO_FLUXO.values() if campo in memoria]
+    if len(ativos) > 1:
+        raise Falha("mais de um fluxo ativo", str(ativos))
+    for tipo in ('nome', 'foto'):
+        estado = memoria.get(f'personalizacao_{tipo}_estado')
+        if estado is None:
+            continue
+        faltando = [campo for campo in PENDENTES_POR_ESTADO.get(estado, ()) if campo not in memoria]
+        if faltando:
+            raise Falha("dado pendente ausente", f"{estado} sem {faltando}")
+        detalhes = memoria.get(f'detalhes_personalizacao_{tipo}')
+        if not isinstance(detalhes, list):
+            raise Falha("lista de capinhas ausente", estado)
+        if estado in ESTADOS_EM_ANDAMENTO:
+            atual = memoria.get(f'capinha_atual_{tipo}')
+            quantidade = memoria.get(f'quantidade_capinhas_{tipo}', 0)
+            if atual != len(detalhes) + 1 or atual > quantidade:
+                raise Falha("contagem de capinhas incoerente",
+                            f"{estado}: capinha {atual} de {quantidade}, {len(detalhes)} anotadas")
+        elif estado in ESTADOS_CONFIRMACAO and not detalhes:
+            raise Falha("confirmação sem capinhas", estado)
+
+def verificar_serializacao(sessao):
+    """A sessão precisa voltar igual do JSON do gravador (WAL, transcrições e migração entre nós)."""
+    copia = gravador.estado_de_json(json.loads(json.dumps(gravador.estado_para_json(sessao))))
+    if copia != sessao:
+        raise Falha("sessão muda ao passar pelo JSON", "")
+
+# -------------------------------------------------
+# Execução
+# -------------------------------------------------
+def _resumo_traceback(e):
+    quadros = traceback.extract_tb(e.__traceback__)[-3:]
+    return f"{type(e).__name__}: {e} | " + " <- ".join(f"{os.path.basename(q.filename)}:{q.lineno} {q.name}"
+                                                      for q in reversed(quadros))
+
+def passo(sessao_id, evento):
+    """
+    Aplica um evento à sessão e confere as invariantes (levanta Falha).
+    Retorna (resposta normalizada ou None, segundos gastos no bot).
+    """
+    antes = bot_logic.SESSAO_ESTADOS.get(sessao_id)
+    resposta = encaminhado = None
+    inicio = time.perf_counter()
+    try:
+        if evento[0] == CLIENTE:
+            silencio = antes is not None and silencio_esperado(
+                antes['ATENDIMENTO_HUMANO_ATIVO'], antes['CONVERSA_ENCAMINHADA_HUMANO'], evento[1])
+            inicio = time.perf_counter()
+            resposta, encaminhado = bot_logic.processar_mensagem_shopee(sessao_id, evento[1])
+        elif evento[0] == ATENDENTE:
+            bot_logic.processar_mensagem_atendente(sessao_id, evento[1])
+        else:
+            agendador.vencer(sessao_id)
+    except Exception as e:
+        raise Falha(f"exceção {type(e).__name__}", _resumo_traceback(e)) from e
+    duracao = time.perf_counter() - inicio
+
+    sessao = bot_logic.SESSAO_ESTADOS.get(sessao_id)
+    if sessao is None:
+        return None, duracao
+    if evento[0] == CLIENTE:
+        verificar_resposta(silencio, resposta, encaminhado, sessao)
+    verificar_sessao(sessao)
+    if resposta is not None:
+        resposta = PADRAO_ID_PEDIDO.sub("<pedido>", resposta)
+    return resposta, duracao
+
+_isoladas = 0
+
+def rodar_isolada(eventos, conferir_cache=False):
+    """Roda os eventos numa sessão nova, sozinha. Retorna a Falha (com o índice do evento) ou None."""
+    global _isoladas
+
+    def rodar(usar_cache):
+        global _isoladas
+        _isoladas += 1
+        sessao_id = f"fuzz-isolada-{_isoladas}"
+        ativo = cache_respostas.ATIVO
+        cache_respostas.ATIVO = usar_cache and ativo
+        cache_respostas.limpar()
+        respostas = []
+        try:
+            for indice, evento in enumerate(eventos):
+                try:
+                    respostas.append(passo(sessao_id, evento)[0])
+                except Falha as falha:
+                    falha.indice = indice
+                    raise
+            sessao = bot_logic.SESSAO_ESTADOS.get(sessao_id)
+            if sessao is not None:
+                verificar_serializacao(sessao)
+            return respostas
+        finally:
+            cache_respostas.ATIVO = ativo
+            bot_logic.remover_sessao(sessao_id)
+
+    try:
+        respostas = rodar(True)
+        if conferir_cache:
+            comparar_sem_cache(respostas, rodar(False))
+    except Falha as falha:
+        return falha
+    return None
+
+def comparar_sem_cache(respostas, sem_cache):
+    for indice, (com, sem) in enumerate(zip(respostas, sem_cache)):
+        if com != sem:
+            raise Falha("cache mudou a resposta", f"com cache {com!r:.200} / sem cache {sem!r:.200}", indice)
+
+def reduzir(eventos, falha, conferir_cache):
+    """Menor subsequência dos eventos que ainda viola a mesma invariante (remoção de blocos, como no ddmin)."""
+    def ainda_falha(candidatos):
+        nova = rodar_isolada(candidatos, conferir_cache)
+        return nova is not None and nova.invariante == falha.invariante
+
+    if not ainda_falha(eventos):
+        return None
+    tamanho = len(eventos) // 2
+    while tamanho >= 1:
+        inicio = 0
+        while inicio < len(eventos):
+            candidatos = eventos[:inicio] + eventos[inicio + tamanho:]
+            if candidatos and ainda_falha(candidatos):
+                eventos = candidatos
+            else:
+                inicio += tamanho
+        tamanho //= 2
+    return eventos
+
+# -------------------------------------------------
+# Laço principal
+# -------------------------------------------------
+def fuzz(args):
+    """Roda os passos. Retorna (estatísticas, None) ou (None, relatório da falha)."""
+    rnd = random.Random(args.semente)
+    abertas = []          # [sessao_id, eventos, posição, respostas]
+    conversas = 0
+    conferidas = 0
+    latencias = array('d')
+    lentos = []           # heap de (segundos, passo, estado, mensagem) com os mais lentos
+    por_fluxo = {}        # fluxo -> [mensagens, segundos]
+    estados = set()
+    transicoes = set()
+    processar_passo = passo
+    estado_fluxo = bot_logic.estado_fluxo
+    sessoes = bot_logic.SESSAO_ESTADOS
+
+    inicio_total = time.perf_counter()
+    for numero_passo in range(args.passos):
+        while len(abertas) < args.simultaneas:
+            conversas += 1
+            abertas.append([f"fuzz-{conversas}", eventos_conversa(rnd, args.mutacao), 0, []])
+        posicao_aberta = rnd.randrange(len(abertas))
+        conversa = abertas[posicao_aberta]
+        sessao_id, eventos, posicao, respostas = conversa
+        evento = eventos[posicao]
+
+        sessao = sessoes.get(sessao_id)
+        estado_antes = estado_fluxo(sessao) if sessao is not None else 'nova'
+        try:
+            resposta, duracao = processar_passo(sessao_id, evento)
+            conversa[2] = posicao = posicao + 1
+            respostas.append(resposta)
+            if posicao == len(eventos):
+                sessao = sessoes.get(sessao_id)
+                if sessao is not None:
+                    verificar_serializacao(sessao)
+                if args.conferir_cache and rnd.random() < args.conferir_cache:
+                    conferidas += 1
+                    falha = rodar_isolada(eventos)
+                    if falha is not None:
+                        raise Falha("falha só intercalada com outras conversas",
+                                    f"sozinha: {falha}", falha.indice)
+                    ativo = cache_respostas.ATIVO
+                    cache_respostas.ATIVO = False
+                    try:
+                        sem_cache = [processar_passo(f"{sessao_id}-sem-cache", e)[0] for e in eventos]
+                    finally:
+                        cache_respostas.ATIVO = ativo
+                        bot_logic.remover_sessao(f"{sessao_id}-sem-cache")
+                    comparar_sem_cache(respostas, sem_cache)
+        except Falha as falha:
+            if falha.indice is None:
+                falha.indice = posicao
+            return None, relatorio_falha(args, falha, eventos[:falha.indice + 1], numero_passo)
+
+        if evento[0] == CLIENTE:
+            latencias.append(duracao)
+            fluxo = estado_antes.split(':', 1)[0]
+            acumulado = por_fluxo.get(fluxo)
+            if acumulado is None:
+                acumulado = por_fluxo[fluxo] = [0, 0.0]
+            acumulado[0] += 1
+            acumulado[1] += duracao
+            if len(lentos) < 5:
+                heapq.heappush(lentos, (duracao, numero_passo, estado_antes, evento[1]))
+            elif duracao > lentos[0][0]:
+                heapq.heapreplace(lentos, (duracao, numero_passo, estado_antes, evento[1]))
+            if args.limite_ms and duracao * 1000 > args.limite_ms:
+                falha = Falha("mensagem lenta", f"{duracao * 1000:.1f} ms em {estado_antes}", posicao - 1)
+                return None, relatorio_falha(args, falha, eventos[:posicao], numero_passo)
+        sessao = sessoes.get(sessao_id)
+        estado_depois = estado_fluxo(sessao) if sessao is not None else 'nova'
+        estados.add(estado_depois)
+        transicoes.add((estado_antes, estado_depois))
+
+        if posicao == len(eventos):
+            bot_logic.remover_sessao(sessao_id)
+            abertas[posicao_aberta] = abertas[-1]
+            abertas.pop()
+    duracao_total = time.perf_counter() - inicio_total
+
+    ordenadas = sorted(latencias)
+    return {
+        'passos': args.passos,
+        'mensagens': len(ordenadas),
+        'conversas': conversas,
+        'conversas_sem_cache_conferidas': conferidas,
+        'passos_s': round(args.passos / duracao_total, 1),
+        'p50_us': round(percentil(ordenadas, 50) * 1e6, 1),
+        'p99_us': round(percentil(ordenadas, 99) * 1e6, 1),
+        'max_us': round(ordenadas[-1] * 1e6, 1) if ordenadas else 0.0,
+        'media_us_por_fluxo': {fluxo: round(total / n * 1e6, 1) for fluxo, (n, total) in sorted(por_fluxo.items())},
+        'estados_visitados': len(estados),
+        'transicoes_visitadas': len(transicoes),
+        'mais_lentas': [{'us': round(d * 1e6, 1), 'passo': p, 'estado': e, 'mensagem': m[:80]}
+                        for d, p, e, m in sorted(lentos, reverse=True)],
+    }, None
+
+def relatorio_falha(args, falha, eventos, numero_passo):
+    """Reduz a sequência que falhou e monta o relatório gravado em JSON."""
+    conferir_cache = falha.invariante == "cache mudou a resposta"
+    reduzidos = reduzir(list(eventos), falha, conferir_cache) if falha.invariante != "mensagem lenta" else None
+    if reduzidos is not None:
+        falha = rodar_isolada(reduzidos, conferir_cache) or falha
+        eventos = reduzidos[:falha.indice + 1]
+    return {
+        'invariante': falha.invariante,
+        'detalhe': falha.detalhe,
+        'semente': args.semente,
+        'passo': numero_passo,
+        'reproduz_isolada': reduzidos is not None,
+        'conferir_cache': conferir_cache,
+        'eventos': [list(evento) for evento in eventos],
+    }
+
+def reproduzir(caminho):
+    """Roda de novo os eventos de um relatório, mostrando cada resposta."""
+    with open(caminho, encoding="utf-8") as f:
+        relatorio = json.load(f)
+    eventos = [tuple(evento) for evento in relatorio['eventos']]
+    saida = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        respostas = []
+        falha = None
+        for indice, evento in enumerate(eventos):
+            try:
+                respostas.append(passo("fuzz-reproducao", evento)[0])
+            except Falha as e:
+                falha, e.indice = e, indice
+                break
+        if falha is None and relatorio.get('conferir_cache'):
+            falha = rodar_isolada(eventos, conferir_cache=True)
+    finally:
+        sys.stdout.close()
+        sys.stdout = saida
+    for evento, resposta in zip(eventos, respostas + [None]):
+        print(f"{evento[0]}> {evento[1] if len(evento) > 1 else ''}")
+        if resposta is not None:
+            print(f"   < {resposta}")
+    if falha is None:
+        print("✅ A sequência não falhou.")
+        return True
+    print(f"❌ Evento {falha.indice}: {falha}")
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzing da máquina de estados das conversas (invariantes e custo por mensagem).")
+    parser.add_argument('--passos', type=int, default=200000)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--simultaneas', type=int, default=64, help="Conversas abertas ao mesmo tempo")
+    parser.add_argument('--mutacao', type=float, default=0.3, help="Chance de mutação por mensagem do roteiro")
+    parser.add_argument('--conferir-cache', type=float, default=0.02,
+                        help="Fração das conversas refeitas sem o cache de respostas para comparar")
+    parser.add_argument('--limite-ms', type=float, default=0.0, help="Mensagem mais lenta que isso conta como falha")
+    parser.add_argument('--saida', default='fuzz_falha.json', help="Onde gravar a sequência reduzida de uma falha")
+    parser.add_argument('--reproduzir', metavar='ARQUIVO', help="Roda de novo uma falha gravada")
+    args = parser.parse_args()
+    args.saida = os.path.abspath(args.saida)
+
+    # Os pedidos confirmados gravam arquivos: roda tudo em um diretório temporário
+    anterior = os.getcwd()
+    diretorio = tempfile.mkdtemp(prefix="fuzz_fluxos_")
+    os.chdir(diretorio)
+    try:
+        if args.reproduzir:
+            sys.exit(0 if reproduzir(os.path.join(anterior, args.reproduzir)) else 1)
+
+        # Os prints do bot atrapalham a medição e a leitura do resultado
+        saida = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            estatisticas, falha = fuzz(args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = saida
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if falha is None:
+        print(json.dumps(estatisticas, indent=2, ensure_ascii=False))
+        return
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(falha, f, indent=2, ensure_ascii=False)
+    print(f"❌ {falha['invariante']}: {falha['detalhe']}")
+    print(f"   {len(falha['eventos'])} eventos (reduzidos: {falha['reproduz_isolada']}) gravados em {args.saida}")
+    print(f"   Para reproduzir: python fuzz_fluxos.py --reproduzir {os.path.relpath(args.saida)}")
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# gravador.py - Gravação de transcrições e replay determinístico
+# -------------------------------------------------
+# Com a variável GRAVADOR_DIR definida, cada mensagem processada por
+# processar_mensagem_shopee vira uma linha JSONL com o estado da sessão
+# ANTES da mensagem, a mensagem e a resposta do bot:
+#     {"t": 1718000000.1, "s": "123", "e": {...}, "m": "1", "r": "...", "h": false}
+# O arquivo é só de acréscimo, com buffer (descarregado a cada
+# INTERVALO_FLUSH_SEGUNDOS) e rotacionado ao passar de GRAVADOR_MAX_BYTES.
+# Cada worker grava no seu próprio arquivo (transcricoes_<pid>.jsonl).
+#
+# Replay: reexecuta cada linha contra o bot_logic atual, partindo do
+# estado gravado, e mostra as respostas que mudaram:
+#     python gravador.py replay GRAVADOR_DIR/*.jsonl
+# -------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import datetime
+import threading
+
+GRAVADOR_DIR = os.getenv('GRAVADOR_DIR')
+MAX_BYTES = int(os.getenv('GRAVADOR_MAX_BYTES', str(50 * 1024 * 1024)))
+INTERVALO_FLUSH_SEGUNDOS = 1.0
+TAMANHO_BUFFER = 64 * 1024
+
+ATIVO = bool(GRAVADOR_DIR)
+
+_trava = threading.Lock()
+_arquivo = None
+_ultimo_flush = 0.0
+
+# -------------------------------------------------
+# Serialização do estado da sessão (datetime não é JSON)
+# -------------------------------------------------
+def _para_json(valor):
+    if isinstance(valor, datetime.datetime):
+        return {'$dt': valor.isoformat()}
+    if isinstance(valor, dict):
+        return {k: _para_json(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_para_json(v) for v in valor]
+    return valor
+
+def _de_json(valor):
+    if isinstance(valor, dict):
+        if len(valor) == 1 and '$dt' in valor:
+            return datetime.datetime.fromisoformat(valor['$dt'])
+        return {k: _de_json(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_de_json(v) for v in valor]
+    return valor
+
+def estado_para_json(sessao):
+    """Converte o estado de uma sessão em algo serializável em JSON (cópia profunda)."""
+    return _para_json(sessao)
+
+def estado_de_json(dados):
+    """Reconstrói o estado de uma sessão a partir de estado_para_json."""
+    return _de_json(dados)
+
+# -------------------------------------------------
+# Gravação
+# -------------------------------------------------
+def _caminho_atual():
+    return os.path.join(GRAVADOR_DIR, f"transcricoes_{os.getpid()}.jsonl")
+
+def _abrir():
+    global _arquivo
+    os.makedirs(GRAVADOR_DIR, exist_ok=True)
+    _arquivo = open(_caminho_atual(), "a", encoding="utf-8", buffering=TAMANHO_BUFFER)
+
+def _rotacionar():
+    global _arquivo
+    _arquivo.close()
+    caminho = _caminho_atual()
+    os.replace(caminho, caminho[:-len(".jsonl")] + time.strftime("_%Y%m%d-%H%M%S.jsonl"))
+    _abrir()
+
+def registrar(sessao_id, estado_antes, mensagem, resposta, encaminhado):
+    """Acrescenta uma linha à transcrição (estado_antes já em estado_para_json)."""
+    global _ultimo_flush
+    linha = json.dumps({
+        't': round(time.time(), 3),
+        's': sessao_id,
+        'e': estado_antes,
+        'm': mensagem,
+        'r': resposta,
+        'h': encaminhado,
+    }, ensure_ascii=False, separators=(',', ':'))
+    with _trava:
+        try:
+            if _arquivo is None:
+                _abrir()
+            _arquivo.write(linha + "\n")
+            agora = time.monotonic()
+            if agora - _ultimo_flush >= INTERVALO_FLUSH_SEGUNDOS:
+                _ultimo_flush = agora
+                _arquivo.flush()
+                if _arquivo.tell() >= MAX_BYTES:
+                    _rotacionar()
+        except OSError as e:
+            print(f"❌ Erro ao gravar transcrição em {GRAVADOR_DIR}: {e}")
+
+@atexit.register
+def fechar():
+    """Descarrega e fecha o arquivo de transcrição."""
+    global _arquivo
+    with _trava:
+        if _arquivo is not None:
+            _arquivo.close()
+            _arquivo = None
+
+# -------------------------------------------------
+# Leitura e replay
+# -------------------------------------------------
+def ler_transcricoes(caminhos):
+    """Gera os registros gravados (dicts), arquivo por arquivo, na ordem das linhas."""
+    for caminho in caminhos:
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                linha = linha.strip()
+                if linha:
+                    yield json.loads(linha)
+
+# IDs de pedido mudam a cada execução (data/hora + contador)
+_PADRAO_ID_PEDIDO = re.compile(r"\d{8}-\d{4}-\d+")
+
+def _normalizar(resposta):
+    return _PADRAO_ID_PEDIDO.sub("<ID_PEDIDO>", resposta) if resposta else resposta
+
+def replay(registros):
+    """
+    Reexecuta cada registro a partir do estado gravado e compara a resposta.
+    Retorna (total, lista de diferenças).
+    """
+    import bot_logic
+    import gravador
+    gravador.ATIVO = False   # não grava o próprio replay
+
+    total = 0
+    diferencas = []
+    for registro in registros:
+        total += 1
+        bot_logic.SESSAO_ESTADOS[registro['s']] = estado_de_json(registro['e'])
+        resposta, encaminhado = bot_logic.processar_mensagem_shopee(registro['s'], registro['m'])
+        if _normalizar(resposta) != _normalizar(registro['r']) or encaminhado != registro['h']:
+            diferencas.append({
+                'linha': total,
+                'sessao': registro['s'],
+                'mensagem': registro['m'],
+                'gravada': registro['r'],
+                'atual': resposta,
+                'encaminhado_gravado': registro['h'],
+                'encaminhado_atual': encaminhado,
+            })
+    return total, diferencas
+
+def main(argv):
+    if len(argv) < 2 or argv[0] != 'replay':
+        print("Uso: python gravador.py replay ARQUIVO.jsonl [ARQUIVO.jsonl ...]")
+        return 2
+
+    import tempfile
+    import contextlib
+
+    caminhos = [os.path.abspath(c) for c in argv[1:]]
+    # Confirmações de pedido gravam arquivos .txt: o replay roda em um diretório temporário.
+    # As regras são carregadas antes de trocar de diretório.
+    import bot_logic  # noqa: F401
+    os.chdir(tempfile.mkdtemp(prefix="replay_"))
+
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        total, diferencas = replay(ler_transcricoes(caminhos))
+
+    for d in diferencas:
+        print(f"--- linha {d['linha']} (sessão {d['sessao']}) mensagem: {d['mensagem']!r}")
+        print(f"    gravada:  {d['gravada']!r} (encaminhado={d['encaminhado_gravado']})")
+        print(f"    atual:    {d['atual']!r} (encaminhado={d['encaminhado_atual']})")
+    print(f"{total} mensagens reexecutadas, {len(diferencas)} respostas diferentes.")
+    return 1 if diferencas else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,62 @@
+# gunicorn.conf.py - Configuração de produção do gunicorn
+# -------------------------------------------------
+# Uso:
+#     gunicorn -c gunicorn.conf.py
+#     gunicorn -c gunicorn.conf.py "server_async:criar_app()" --worker-class aiohttp.GunicornWebWorker
+#
+# Com preload_app o master importa o app uma vez (config, regras já
+# indexadas, regex compiladas, tabelas) antes do fork: os workers sobem
+# sem repetir esse trabalho e compartilham essas páginas de memória
+# (copy-on-write). gc.freeze() tira esses objetos do coletor de lixo, para
+# que uma coleta no worker não toque (e copie) as páginas compartilhadas.
+#
+# O que é de cada processo (persistência, agendador, fila de atendimentos)
+# é inicializado no post_fork, já dentro do worker.
+#
+# UM WORKER POR NÓ. O estado das conversas é da memória do processo:
+# SESSAO_ESTADOS (fluxo de cada cliente), o heap do agendador, o índice
+# de atendimentos humanos e a deduplicação de message_id. O gunicorn
+# entrega cada webhook a qualquer worker, então com dois workers uma
+# conversa teria o fluxo dividido entre eles e um atendente que assumiu
+# a conversa num worker não calaria a assistente no outro. Por isso o
+# padrão é WEB_CONCURRENCY=1 (e o post_fork avisa se houver mais):
+#   - a concorrência vem das threads do worker (GUNICORN_THREADS, no
+#     server.py com Flask) ou do event loop (server_async.py);
+#   - para crescer, suba mais nós com o cluster.py, que leva cada
+#     conversa sempre ao mesmo nó.
+#
+# Os diretórios compartilhados abaixo cobrem a troca de worker (reinício
+# ou reload, quando o novo sobe antes do antigo sair): o eco de uma
+# resposta enviada pelo worker antigo pode chegar ao novo
+# (SHOPEE_ENVIOS_DIR) e, sem ANALISE_DIR nem PERSISTENCIA_DIR, o
+# histórico do /admin/analise fica num diretório deste master (ele só
+# sobrevive a reinícios do master com um desses diretórios configurado).
+# -------------------------------------------------
+
+import os
+import gc
+import tempfile
+
+wsgi_app = "server:criar_app()"
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))   # ver "UM WORKER POR NÓ" acima
+threads = int(os.getenv('GUNICORN_THREADS', '8'))   # worker síncrono (Flask); o aiohttp ignora
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Lido pelo shopee_api.py no import (no master com preload_app, ou em cada worker)
+os.environ.setdefault('SHOPEE_ENVIOS_DIR', os.path.join(tempfile.gettempdir(), f"bot_envios_{os.getpid()}"))
+# Lido pelo analise.py no import
+if not os.getenv('ANALISE_DIR') and not os.getenv('PERSISTENCIA_DIR'):
+    os.environ['ANALISE_DIR'] = os.path.join(tempfile.gettempdir(), f"bot_analise_{os.getpid()}")
+
+def pre_fork(server, worker):
+    # Tudo que o master carregou até aqui vai para a geração permanente do GC
+    gc.freeze()
+
+def post_fork(server, worker):
+    if server.cfg.workers > 1:
+        print(f"⚠️ ATENÇÃO: {server.cfg.workers} workers. As sessões, os atendimentos humanos e a deduplicação "
+              "são de cada worker: mensagens da mesma conversa em workers diferentes vão perder o fluxo e o "
+              "atendente não cala a assistente nos outros workers. Use WEB_CONCURRENCY=1 (ver gunicorn.conf.py).")
+    import bot_logic
+    bot_logic.inicializar_worker()
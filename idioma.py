@@ -0,0 +1,140 @@
+# idioma.py - Detecção do idioma do cliente (português, espanhol ou inglês)
+# -------------------------------------------------
+# Compradores do cross-border da Shopee às vezes escrevem em espanhol ou
+# inglês. As mensagens do cliente passam por um classificador de
+# trigramas de caracteres (naive Bayes): cada idioma tem a frequência dos
+# trigramas das suas regras/textos (RegrasLoja_v2.<idioma>.txt,
+# TextosBot.<idioma>.txt) mais as AMOSTRAS abaixo, com frases curtas de
+# chat ("oi", "hola", "thanks") que não aparecem nas regras.
+#
+# Os perfis ficam numa tabela só, trigrama -> (log P por idioma): uma
+# mensagem custa uma consulta de dicionário por trigrama (dezenas de
+# microssegundos; o texto é cortado em MAX_CARACTERES).
+#
+# Uma mensagem curta de cliente brasileiro engana fácil o classificador
+# ("Quero devolver" parece espanhol, "iPhone 13" parece inglês), por isso
+# a detecção só decide com evidência: marcas, modelos e palavras
+# emprestadas (NEUTRAS) não contam, o texto precisa de MIN_TRIGRAMAS e o
+# idioma vencedor tem de ser MARGEM (log natural, umas 50 vezes) e
+# MARGEM_POR_TRIGRAMA mais provável que o segundo. Sem isso a resposta é
+# None: o bot_logic segue no IDIOMA_PADRAO e tenta de novo na próxima
+# mensagem. O cliente também pode pedir o idioma pelo nome
+# ("español", "english", "português"; ver idioma_pedido).
+# -------------------------------------------------
+
+import os
+import re
+import math
+from collections import Counter
+
+IDIOMAS = ('pt', 'es', 'en')
+IDIOMA_PADRAO = 'pt'
+MARGEM = float(os.getenv('IDIOMA_MARGEM', '4'))
+MARGEM_POR_TRIGRAMA = 0.5
+MIN_TRIGRAMAS = 8
+MAX_CARACTERES = 200
+PESO_AMOSTRAS = 5   # as amostras de chat valem mais que o texto das regras
+
+AMOSTRAS = {
+    'pt': """
+        oi olá oie tudo bem bom dia boa tarde boa noite obrigado obrigada valeu
+        quero uma capinha com nome quero personalizar minha capinha
+        vocês têm capinha para o meu celular? tem capa pro iphone?
+        qual o prazo de entrega? quando chega meu pedido? não recebi meu pedido
+        quero devolver quero o reembolso do meu dinheiro comprei errado
+        sim não voltar sair falar com atendente preciso de ajuda por favor
+        qual é a forma de pagamento? aceita pix? tem cupom de desconto?
+        tem pro moto g? e pro galaxy? alguém aí? ok blz kkk talvez depois
+        """,
+    'es': """
+        hola buenas buenos días buenas tardes buenas noches qué tal gracias muchas gracias
+        quiero una funda con nombre quiero personalizar mi funda
+        ¿tienen funda para mi celular? ¿hay carcasa para el iphone?
+        ¿cuál es el plazo de entrega? ¿cuándo llega mi pedido? no recibí mi pedido
+        quiero devolver quiero el reembolso de mi dinero compré mal
+        sí no volver salir hablar con un agente necesito ayuda por favor
+        ¿cuál es la forma de pago? ¿tienen cupón de descuento? ¿cuánto cuesta?
+        """,
+    'en': """
+        hi hi there hello hey good morning good afternoon good evening thanks thank you
+        i want a case with my name i want to personalize my phone case
+        do you have a case for my phone? is there a cover for the iphone?
+        what is the delivery time? when will my order arrive? i did not get my order
+        i want to return it i want a refund of my money i bought the wrong one
+        yes no back exit talk to an agent i need help please
+        what are the payment methods? do you have a discount coupon? how much is it?
+        """,
+}
+
+# Não dizem o idioma: marcas e modelos de celular e palavras usadas em qualquer um deles
+NEUTRAS = frozenset("""
+    iphone apple samsung galaxy motorola moto xiaomi redmi poco note pro max plus mini ultra lite
+    realme oppo vivo huawei honor nokia asus zenfone pixel google lg infinix tecno edge
+    case ok okay pix
+    """.split())
+
+# Mensagem que é só o nome de um idioma: o cliente está pedindo para trocar
+PEDIDOS_IDIOMA = {
+    'português': 'pt', 'portugues': 'pt', 'portuguese': 'pt', 'portugués': 'pt',
+    'español': 'es', 'espanol': 'es', 'spanish': 'es', 'espanhol': 'es',
+    'english': 'en', 'inglés': 'en', 'ingles': 'en', 'inglês': 'en',
+}
+
+_PADRAO_PALAVRA = re.compile(r"[^\W\d_]+")   # só letras (com acento)
+_tabela = {}   # trigrama -> (log da probabilidade em cada idioma de IDIOMAS)
+_pisos = ()    # log da probabilidade de um trigrama nunca visto, por idioma
+
+def trigramas(texto):
+    """
+    Trigramas de caracteres das palavras do texto (cada palavra entre espaços: " oi" e "oi "),
+    sem as NEUTRAS e as letras soltas ("S21", "G84").
+    """
+    resultado = []
+    for palavra in _PADRAO_PALAVRA.findall(texto.lower()):
+        if len(palavra) < 2 or palavra in NEUTRAS:
+            continue
+        palavra = f" {palavra} "
+        resultado.extend(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+def treinar(textos=None):
+    """
+    Monta os perfis dos idiomas a partir das AMOSTRAS e de `textos`
+    ({idioma: texto}, ex.: as regras carregadas pelo bot_logic).
+    """
+    global _tabela, _pisos
+    textos = textos or {}
+    contagens = []
+    for idioma in IDIOMAS:
+        contagem = Counter(trigramas(AMOSTRAS[idioma]) * PESO_AMOSTRAS)
+        contagem.update(trigramas(textos.get(idioma, '')))
+        contagens.append(contagem)
+    vocabulario = set().union(*contagens)
+    totais = [sum(c.values()) + len(vocabulario) for c in contagens]   # suavização de Laplace
+    _tabela = {t: tuple(math.log((c[t] + 1) / total) for c, total in zip(contagens, totais))
+               for t in vocabulario}
+    _pisos = tuple(math.log(1 / total) for total in totais)
+
+def pontuar(texto):
+    """{idioma: log da probabilidade do texto} e a quantidade de trigramas usados."""
+    lista = trigramas(texto[:MAX_CARACTERES])
+    tabela, pisos = _tabela, _pisos
+    colunas = zip(*[tabela.get(t, pisos) for t in lista]) if lista else ((),) * len(IDIOMAS)
+    return dict(zip(IDIOMAS, map(sum, colunas))), len(lista)
+
+def detectar(texto):
+    """Idioma da mensagem ('pt', 'es' ou 'en'), ou None se não há evidência suficiente."""
+    pontos, quantidade = pontuar(texto)
+    if quantidade < MIN_TRIGRAMAS:
+        return None
+    segundo, melhor = sorted(pontos, key=pontos.get)[-2:]
+    vantagem = pontos[melhor] - pontos[segundo]
+    if vantagem < MARGEM or vantagem < MARGEM_POR_TRIGRAMA * quantidade:
+        return None
+    return melhor
+
+def idioma_pedido(texto):
+    """Idioma que o cliente pediu pelo nome ("español", "english"...), ou None."""
+    return PEDIDOS_IDIOMA.get(texto.strip().strip('.!').lower())
+
+treinar()
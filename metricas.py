@@ -0,0 +1,264 @@
+# metricas.py - Métricas no formato texto do Prometheus
+# -------------------------------------------------
+# Contadores, histogramas e gauges simples, sem dependências externas.
+#
+# Cada processo acumula as métricas em dicionários próprios (uma única
+# trava curta por observação). Com gunicorn há vários workers: se a
+# variável METRICAS_DIR estiver definida, uma thread de cada worker grava
+# um retrato das suas métricas em METRICAS_DIR/metricas_<pid>.json a cada
+# INTERVALO_GRAVACAO_SEGUNDOS (também com o worker ocioso, para os gauges
+# não ficarem parados) e o endpoint /metrics soma os retratos de todos os
+# workers. Sem METRICAS_DIR, /metrics mostra apenas o processo atual.
+# -------------------------------------------------
+
+import os
+import json
+import time
+import bisect
+import threading
+
+METRICAS_DIR = os.getenv('METRICAS_DIR')
+INTERVALO_GRAVACAO_SEGUNDOS = 1.0
+
+BUCKETS_PADRAO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_trava = threading.Lock()
+_trava_gravacao = threading.Lock()   # um retrato por vez (thread de gravação e /metrics)
+_pid_gravador = None                 # processo em que a thread de gravação foi iniciada
+
+# Registro das métricas do processo: nome -> objeto de métrica
+_METRICAS = {}
+
+# -------------------------------------------------
+# Tipos de métrica
+# -------------------------------------------------
+class Contador:
+    """Contador monotônico, com rótulos opcionais."""
+    tipo = 'counter'
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.valores = {}   # tupla de valores dos rótulos -> total
+        _METRICAS[nome] = self
+
+    def inc(self, *valores_rotulos, valor=1):
+        with _trava:
+            self.valores[valores_rotulos] = self.valores.get(valores_rotulos, 0) + valor
+        iniciar_gravacao()
+
+    def retrato(self):
+        return {'|'.join(k): v for k, v in self.valores.items()}
+
+
+class Histograma:
+    """Histograma com buckets fixos (em segundos), com rótulos opcionais."""
+    tipo = 'histogram'
+
+    def __init__(self, nome, descricao, rotulos=(), buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(buckets)
+        self.valores = {}   # tupla de valores dos rótulos -> [contagens por bucket..., +Inf, soma]
+        _METRICAS[nome] = self
+
+    def observar(self, segundos, *valores_rotulos):
+        idx = bisect.bisect_left(self.buckets, segundos)
+        with _trava:
+            serie = self.valores.get(valores_rotulos)
+            if serie is None:
+                serie = self.valores[valores_rotulos] = [0] * (len(self.buckets) + 2)
+            serie[idx] += 1
+            serie[-1] += segundos
+        iniciar_gravacao()
+
+    def cronometrar(self, *valores_rotulos):
+        """Context manager que observa a duração do bloco."""
+        return _Cronometro(self, valores_rotulos)
+
+    def retrato(self):
+        return {'|'.join(k): list(v) for k, v in self.valores.items()}
+
+
+class Gauge:
+    """Valor instantâneo lido por uma função no momento da coleta (somado entre workers)."""
+    tipo = 'gauge'
+
+    def __init__(self, nome, descricao, funcao=None):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = ()
+        self.funcao = funcao
+        self.valor = 0
+        _METRICAS[nome] = self
+
+    def inc(self, valor=1):
+        with _trava:
+            self.valor += valor
+
+    def dec(self, valor=1):
+        with _trava:
+            self.valor -= valor
+
+    def retrato(self):
+        return {'': self.funcao() if self.funcao else self.valor}
+
+
+class _Cronometro:
+    def __init__(self, histograma, valores_rotulos):
+        self.histograma = histograma
+        self.valores_rotulos = valores_rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histograma.observar(time.perf_counter() - self.inicio, *self.valores_rotulos)
+        return False
+
+# -------------------------------------------------
+# Métricas do bot
+# -------------------------------------------------
+LATENCIA_WEBHOOK = Histograma('bot_webhook_latencia_segundos', "Tempo total de processamento do webhook.")
+LATENCIA_LOGICA = Histograma('bot_logica_latencia_segundos', "Tempo de processar_mensagem_shopee por fluxo.", rotulos=('fluxo',))
+LATENCIA_SHOPEE = Histograma('bot_shopee_api_latencia_segundos', "Tempo das chamadas à Shopee API por endpoint.", rotulos=('endpoint',))
+
+INTENCOES = Contador('bot_intencoes_total', "Respostas servidas por chave de regra.", rotulos=('regra',))
+FALLBACKS = Contador('bot_resposta_fora_menu_total', "Mensagens respondidas com RESPOSTA_FORA_MENU.")
+ENCAMINHAMENTOS_HUMANO = Contador('bot_encaminhamentos_humano_total', "Conversas encaminhadas para atendimento humano.")
+DEDUP = Contador('bot_webhooks_duplicados_total', "Webhooks ignorados por message_id repetido.")
+EXPIRACOES = Contador('bot_expiracoes_total', "Sessões expiradas pelo agendador, por tipo.", rotulos=('tipo',))
+MENSAGENS_LOJA = Contador('bot_mensagens_loja_total', "Mensagens da conta da loja recebidas no webhook (atendente ou eco do bot).", rotulos=('tipo',))
+CACHE_RESPOSTAS = Contador('bot_cache_respostas_total', "Consultas ao cache de respostas, por resultado (acerto/falha).", rotulos=('resultado',))
+CONSULTAS_CATALOGO = Contador('bot_consultas_catalogo_total', "Consultas de capinha respondidas pelo catálogo de modelos (disponivel/indisponivel/desconhecido).", rotulos=('resultado',))
+WEBHOOKS_ENCAMINHADOS = Contador('bot_cluster_webhooks_encaminhados_total', "Webhooks repassados ao nó dono da conversa, por resultado (ok/falha).", rotulos=('resultado',))
+SESSOES_MIGRADAS = Contador('bot_cluster_sessoes_migradas_total', "Sessões que mudaram de nó no rebalanceamento (enviada/recebida/buscada/devolvida).", rotulos=('direcao',))
+IDIOMAS_DETECTADOS = Contador('bot_idiomas_detectados_total', "Conversas por idioma detectado na primeira mensagem (pt/es/en).", rotulos=('idioma',))
+FALHAS_RESPOSTA = Contador('bot_falhas_resposta_total', "Falhas ao enviar resposta ou marcar conversa na Shopee.", rotulos=('endpoint',))
+
+SESSOES_ATIVAS = Gauge('bot_sessoes_ativas', "Sessões em memória.")
+ATENDIMENTOS_ABERTOS = Gauge('bot_atendimentos_abertos', "Conversas com atendente humano em aberto.")
+EXPIRACOES_PENDENTES = Gauge('bot_expiracoes_agendadas', "Expirações agendadas e ainda pendentes.")
+FILA_WEBHOOKS = Gauge('bot_webhooks_em_andamento', "Webhooks sendo processados no momento.")
+
+# -------------------------------------------------
+# Agregação entre workers
+# -------------------------------------------------
+def _retrato_processo():
+    with _trava:
+        return {nome: m.retrato() for nome, m in _METRICAS.items()}
+
+def _gravar_retrato():
+    caminho = os.path.join(METRICAS_DIR, f"metricas_{os.getpid()}.json")
+    temporario = f"{caminho}.{threading.get_ident()}.tmp"
+    with _trava_gravacao:
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(_retrato_processo(), f)
+        os.replace(temporario, caminho)
+
+def _laco_gravacao():
+    while True:
+        try:
+            os.makedirs(METRICAS_DIR, exist_ok=True)
+            _gravar_retrato()
+        except OSError as e:
+            print(f"❌ Erro ao gravar métricas em {METRICAS_DIR}: {e}")
+        time.sleep(INTERVALO_GRAVACAO_SEGUNDOS)
+
+def iniciar_gravacao():
+    """
+    Garante a thread de gravação neste processo (threads não sobrevivem ao fork dos
+    workers). Chamada no início do worker e, por garantia, a cada observação.
+    """
+    global _pid_gravador
+    if not METRICAS_DIR or _pid_gravador == os.getpid():
+        return
+    with _trava:
+        if _pid_gravador == os.getpid():
+            return
+        _pid_gravador = os.getpid()
+    threading.Thread(target=_laco_gravacao, name="metricas-gravacao", daemon=True).start()
+
+def _reiniciar_travas_no_filho():
+    # Uma thread do processo pai pode estar com a trava no momento do fork
+    global _trava, _trava_gravacao
+    _trava = threading.Lock()
+    _trava_gravacao = threading.Lock()
+
+os.register_at_fork(after_in_child=_reiniciar_travas_no_filho)
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _retratos():
+    """Retratos de todos os workers (ou só do processo atual sem METRICAS_DIR)."""
+    if not METRICAS_DIR:
+        return [(True, _retrato_processo())]
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+    _gravar_retrato()
+    retratos = []
+    for nome_arquivo in os.listdir(METRICAS_DIR):
+        if not (nome_arquivo.startswith("metricas_") and nome_arquivo.endswith(".json")):
+            continue
+        try:
+            pid = int(nome_arquivo[len("metricas_"):-len(".json")])
+            with open(os.path.join(METRICAS_DIR, nome_arquivo), encoding="utf-8") as f:
+                retratos.append((_processo_vivo(pid), json.load(f)))
+        except (OSError, ValueError):
+            continue
+    return retratos
+
+# -------------------------------------------------
+# Exposição no formato texto do Prometheus
+# -------------------------------------------------
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = [f'{n}="{v}"' for n, v in zip(nomes, valores) if n]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def gerar_texto_prometheus():
+    """Gera o corpo do endpoint /metrics somando as métricas de todos os workers."""
+    retratos = _retratos()
+    linhas = []
+    for nome, metrica in _METRICAS.items():
+        total = {}
+        for vivo, retrato in retratos:
+            # Gauges de workers que já morreram não fazem mais sentido
+            if metrica.tipo == 'gauge' and not vivo:
+                continue
+            for chave, valor in retrato.get(nome, {}).items():
+                if isinstance(valor, list):
+                    acumulado = total.setdefault(chave, [0] * len(valor))
+                    for i, v in enumerate(valor):
+                        acumulado[i] += v
+                else:
+                    total[chave] = total.get(chave, 0) + valor
+
+        linhas.append(f"# HELP {nome} {metrica.descricao}")
+        linhas.append(f"# TYPE {nome} {metrica.tipo}")
+        for chave, valor in sorted(total.items()):
+            valores_rotulos = chave.split('|') if metrica.rotulos else ()
+            if metrica.tipo == 'histogram':
+                acumulado = 0
+                for limite, contagem in zip(metrica.buckets + ('+Inf',), valor[:-1]):
+                    acumulado += contagem
+                    rotulos = _formatar_rotulos(metrica.rotulos, valores_rotulos, f'le="{limite}"')
+                    linhas.append(f"{nome}_bucket{rotulos} {acumulado}")
+                rotulos = _formatar_rotulos(metrica.rotulos, valores_rotulos)
+                linhas.append(f"{nome}_sum{rotulos} {valor[-1]}")
+                linhas.append(f"{nome}_count{rotulos} {acumulado}")
+            else:
+                linhas.append(f"{nome}{_formatar_rotulos(metrica.rotulos, valores_rotulos)} {valor}")
+    return "\n".join(linhas) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
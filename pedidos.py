@@ -0,0 +1,70 @@
+# pedidos.py - Registro de pedidos para a produção (pedidos.jsonl)
+# -------------------------------------------------
+# Além dos .txt individuais (Nomes_Personalizar / Fotos_Personalizar),
+# cada capinha confirmada vira uma linha JSON em PEDIDOS_ARQUIVO:
+#     {"pedido": "...", "tipo": "nome"|"foto", "modelo": "...",
+#      "nome": "...", "foto": "...", "criado_em": "2025-01-31T14:05:09"}
+# O arquivo só recebe acréscimos: cada linha é gravada com um único
+# os.write em um descritor O_APPEND, então vários workers podem gravar no
+# mesmo arquivo sem misturar linhas.
+#
+# ler_pedidos() percorre o arquivo a partir de uma posição (em bytes) sem
+# carregar tudo na memória; a exportação (exportacao.py) usa essa posição
+# como cursor "desde a última exportação".
+# -------------------------------------------------
+
+import os
+import json
+import datetime
+import threading
+
+ARQUIVO_PEDIDOS = os.getenv('PEDIDOS_ARQUIVO', "pedidos.jsonl")
+
+_trava = threading.Lock()
+_fd = None
+_pid_fd = None
+
+def _descritor():
+    """Abre o arquivo de pedidos uma vez por processo (chamar com _trava)."""
+    global _fd, _pid_fd
+    if _fd is None or _pid_fd != os.getpid():
+        _fd = os.open(ARQUIVO_PEDIDOS, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        _pid_fd = os.getpid()
+    return _fd
+
+def registrar_pedido(pedido_id, tipo, modelo, nome=None, foto=None, criado_em=None):
+    """Acrescenta uma capinha confirmada ao arquivo de pedidos."""
+    registro = {
+        'pedido': pedido_id,
+        'tipo': tipo,
+        'modelo': modelo,
+        'nome': nome,
+        'foto': foto,
+        'criado_em': (criado_em or datetime.datetime.now()).isoformat(timespec='seconds'),
+    }
+    linha = (json.dumps(registro, ensure_ascii=False) + "\n").encode('utf-8')
+    with _trava:
+        os.write(_descritor(), linha)
+
+def ler_linhas(desde=0, caminho=None):
+    """
+    Gera (posição após a linha, linha em bytes) a partir da posição `desde` (bytes).
+    Uma última linha incompleta (gravação em andamento) é deixada para a próxima leitura.
+    """
+    caminho = caminho or ARQUIVO_PEDIDOS
+    if not os.path.exists(caminho):
+        return
+    with open(caminho, "rb") as f:
+        f.seek(desde)
+        posicao = desde
+        for linha in f:
+            if not linha.endswith(b"\n"):
+                break
+            posicao += len(linha)
+            if linha.strip():
+                yield posicao, linha
+
+def ler_pedidos(desde=0, caminho=None):
+    """Gera (posição após a linha, pedido) a partir da posição `desde` (bytes)."""
+    for posicao, linha in ler_linhas(desde, caminho):
+        yield posicao, json.loads(linha)
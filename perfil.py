@@ -0,0 +1,181 @@
+# perfil.py - Profiling opcional e captura de requisições lentas
+# -------------------------------------------------
+# Cada webhook abre um "rastro" (iniciar_requisicao/finalizar_requisicao).
+# Trechos importantes marcam fases com `with perfil.fase('nome'):`
+# (busca nas regras, gravação de arquivos, chamadas à Shopee...). Medir
+# as fases custa só dois perf_counter, então fica sempre ligado: toda
+# requisição acima de LIMITE_LENTO_MS vai para um buffer circular com as
+# últimas MAX_LENTAS requisições lentas e o tempo gasto em cada fase.
+#
+# O modo profiling (amostragem de pilhas) é opcional e vale por worker:
+# uma thread lê sys._current_frames() a cada INTERVALO_AMOSTRAGEM_SEGUNDOS
+# e conta as pilhas das threads que estão atendendo um webhook. As pilhas
+# mais frequentes entram junto no registro da requisição lenta.
+#
+# No Flask cada requisição tem a sua thread, amostrada do início ao fim.
+# No aiohttp a thread do event loop é de todas as requisições: ela não é
+# amostrada (amostrar_thread=False), só as fases que a requisição roda em
+# outra thread (a lógica do bot, via asyncio.to_thread, que leva junto o
+# rastro no contextvar) e enquanto essas fases duram.
+# -------------------------------------------------
+
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import deque, Counter
+
+LIMITE_LENTO_MS = float(os.getenv('PERFIL_LIMITE_MS', '500'))
+MAX_LENTAS = int(os.getenv('PERFIL_MAX_LENTAS', '50'))
+INTERVALO_AMOSTRAGEM_SEGUNDOS = 0.005
+MAX_PILHAS_POR_RASTRO = 10
+PROFUNDIDADE_PILHA = 30
+
+PERFIL_ATIVO = False
+REQUISICOES_LENTAS = deque(maxlen=MAX_LENTAS)
+
+_rastro_atual = contextvars.ContextVar('rastro_atual', default=None)
+# thread id -> rastro que está usando a thread (o que o amostrador vai ver)
+_RASTROS_POR_THREAD = {}
+_SEM_RASTRO = object()
+_thread_amostragem = None
+
+
+class _Rastro:
+    __slots__ = ('rotulo', 'inicio', 'fases', 'pilhas', 'thread_id', 'amostrar_thread')
+
+    def __init__(self, rotulo, amostrar_thread):
+        self.rotulo = rotulo
+        self.inicio = time.perf_counter()
+        self.fases = {}          # nome da fase -> [segundos, chamadas]
+        self.pilhas = Counter()  # pilha resumida -> amostras
+        self.thread_id = threading.get_ident()
+        self.amostrar_thread = amostrar_thread
+
+
+class _Fase:
+    __slots__ = ('nome', 'rastro', 'inicio', 'thread_id', 'anterior')
+
+    def __init__(self, nome):
+        self.nome = nome
+
+    def __enter__(self):
+        self.rastro = _rastro_atual.get()
+        self.thread_id = None
+        if self.rastro is not None:
+            thread_id = threading.get_ident()
+            # A fase roda em outra thread (ou na própria thread da requisição, se ela é amostrada)
+            if self.rastro.amostrar_thread or thread_id != self.rastro.thread_id:
+                self.thread_id = thread_id
+                self.anterior = _RASTROS_POR_THREAD.get(thread_id, _SEM_RASTRO)
+                _RASTROS_POR_THREAD[thread_id] = self.rastro
+            self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.rastro is not None:
+            acumulado = self.rastro.fases.setdefault(self.nome, [0.0, 0])
+            acumulado[0] += time.perf_counter() - self.inicio
+            acumulado[1] += 1
+        if self.thread_id is not None:
+            if self.anterior is _SEM_RASTRO:
+                _RASTROS_POR_THREAD.pop(self.thread_id, None)
+            else:
+                _RASTROS_POR_THREAD[self.thread_id] = self.anterior
+        return False
+
+
+def fase(nome):
+    """Context manager que soma o tempo do bloco na fase `nome` da requisição atual."""
+    return _Fase(nome)
+
+def iniciar_requisicao(rotulo, amostrar_thread=True):
+    """
+    Abre o rastro da requisição atual. Retorna o token para finalizar_requisicao.
+    amostrar_thread=False quando a thread atual é compartilhada com outras requisições (event loop).
+    """
+    rastro = _Rastro(rotulo, amostrar_thread)
+    if amostrar_thread:
+        _RASTROS_POR_THREAD[rastro.thread_id] = rastro
+    return _rastro_atual.set(rastro)
+
+def finalizar_requisicao(token):
+    """Fecha o rastro e o guarda no buffer se a requisição passou do limite."""
+    rastro = _rastro_atual.get()
+    _rastro_atual.reset(token)
+    if rastro is None:
+        return
+    if _RASTROS_POR_THREAD.get(rastro.thread_id) is rastro:
+        del _RASTROS_POR_THREAD[rastro.thread_id]
+
+    total_ms = (time.perf_counter() - rastro.inicio) * 1000
+    if total_ms < LIMITE_LENTO_MS:
+        return
+
+    fases = {nome: {'ms': round(seg * 1000, 3), 'chamadas': n} for nome, (seg, n) in rastro.fases.items()}
+    fases['outros'] = {'ms': round(max(0.0, total_ms - sum(f['ms'] for f in fases.values())), 3), 'chamadas': 1}
+    REQUISICOES_LENTAS.append({
+        'quando': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'rotulo': rastro.rotulo,
+        'pid': os.getpid(),
+        'total_ms': round(total_ms, 3),
+        'fases': fases,
+        'pilhas': [{'pilha': p, 'amostras': n} for p, n in rastro.pilhas.most_common(MAX_PILHAS_POR_RASTRO)],
+    })
+
+# -------------------------------------------------
+# Amostragem de pilhas
+# -------------------------------------------------
+def _resumir_pilha(frame):
+    partes = []
+    while frame is not None and len(partes) < PROFUNDIDADE_PILHA:
+        codigo = frame.f_code
+        partes.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(partes))
+
+def _amostrar():
+    proprio = threading.get_ident()
+    while PERFIL_ATIVO:
+        frames = sys._current_frames()
+        for thread_id, rastro in list(_RASTROS_POR_THREAD.items()):
+            if thread_id == proprio:
+                continue
+            frame = frames.get(thread_id)
+            if frame is not None:
+                rastro.pilhas[_resumir_pilha(frame)] += 1
+        time.sleep(INTERVALO_AMOSTRAGEM_SEGUNDOS)
+
+def configurar(ativo=None, limite_ms=None):
+    """
+    Liga/desliga a amostragem de pilhas e ajusta o limite de lentidão (apenas neste worker).
+    Levanta ValueError se `ativo` não for booleano ou `limite_ms` não for um número >= 0.
+    """
+    global PERFIL_ATIVO, LIMITE_LENTO_MS, _thread_amostragem
+    if ativo is not None and not isinstance(ativo, bool):
+        raise ValueError("'ativo' deve ser true ou false")
+    if limite_ms is not None:
+        try:
+            limite = float(limite_ms) if not isinstance(limite_ms, bool) else None
+        except (TypeError, ValueError, OverflowError):   # texto que não é número, listas...
+            limite = None
+        if limite is None or not 0 <= limite < float('inf'):
+            raise ValueError("'limite_ms' deve ser um número >= 0")
+        LIMITE_LENTO_MS = limite
+    if ativo is not None:
+        PERFIL_ATIVO = bool(ativo)
+        if PERFIL_ATIVO and (_thread_amostragem is None or not _thread_amostragem.is_alive()):
+            _thread_amostragem = threading.Thread(target=_amostrar, name="perfil-amostragem", daemon=True)
+            _thread_amostragem.start()
+    return estado()
+
+def estado():
+    """Estado atual do profiling neste worker, com as últimas requisições lentas."""
+    return {
+        'pid': os.getpid(),
+        'ativo': PERFIL_ATIVO,
+        'limite_ms': LIMITE_LENTO_MS,
+        'max_lentas': MAX_LENTAS,
+        'lentas': list(REQUISICOES_LENTAS),
+    }
@@ -0,0 +1,295 @@
+# persistencia.py - Estado das sessões durável (snapshot + write-ahead log)
+# -------------------------------------------------
+# Com PERSISTENCIA_DIR definida, o SESSAO_ESTADOS sobrevive a deploys e
+# quedas do processo:
+#   - wal.<geração>: log só de acréscimo. Cada mensagem processada grava
+#     o novo estado da sessão que mudou (um único os.write, sem buffer);
+#     uma sessão que saiu do processo (migrou para outro nó do cluster)
+#     vira um registro com estado None;
+#   - snapshot: retrato compacto (pickle) de todas as sessões, feito a cada
+#     SNAPSHOT_A_CADA registros no WAL. Ao iniciar o snapshot o WAL troca
+#     de geração; uma thread então serializa as sessões em blocos de
+#     TAMANHO_BLOCO_SNAPSHOT, pegando a TRAVA_SESSOES do bot_logic só
+#     durante cada bloco (alguns milissegundos), e grava os blocos em
+#     sequência no arquivo. As mensagens seguem entre um bloco e outro:
+#     o snapshot não é um retrato de um instante só, mas toda sessão que
+#     mudou depois da troca de geração está no WAL novo, que a restauração
+#     reaplica por cima (cada registro é o estado inteiro da sessão).
+#     Quando o snapshot termina, as gerações antigas são apagadas. (Não
+#     usamos fork: o worker tem threads do agendador, do perfil e das
+#     requisições, e o filho poderia herdar travas presas.)
+# Na subida: carrega o snapshot e reaplica os WALs das gerações seguintes.
+# Um registro truncado no fim do WAL (queda no meio da escrita) é ignorado.
+#
+# Um diretório pertence a um único processo (trava com flock). Cada worker
+# do gunicorn usa o primeiro diretório livre: o próprio PERSISTENCIA_DIR e
+# depois PERSISTENCIA_DIR/worker-1, worker-2, ... Um worker que reinicia
+# pega o diretório que ficou livre e restaura as sessões de quem saiu.
+# -------------------------------------------------
+
+import os
+import time
+import struct
+import pickle
+import threading
+
+from config import ErroConfiguracao
+
+PERSISTENCIA_DIR = os.getenv('PERSISTENCIA_DIR')
+MAX_DIRETORIOS_WORKERS = 64
+SNAPSHOT_A_CADA = int(os.getenv('PERSISTENCIA_SNAPSHOT_A_CADA', '50000'))
+TAMANHO_BLOCO_SNAPSHOT = 1000   # sessões serializadas por vez com a TRAVA_SESSOES
+FSYNC = os.getenv('PERSISTENCIA_FSYNC', '0') == '1'
+
+ATIVO = False
+
+_CABECALHO = struct.Struct('<I')   # tamanho do registro (4 bytes) antes de cada pickle
+_trava = threading.Lock()
+_sessoes = None
+_trava_sessoes = None      # a TRAVA_SESSOES do bot_logic (ver iniciar)
+_obter_contador = None
+_fd_wal = None
+_fd_trava = None
+_diretorio = None          # diretório deste processo (ver _escolher_diretorio)
+_geracao = 0
+_registros_desde_snapshot = 0
+_snapshot_em_andamento = None   # (thread, geração inicial coberta pelo snapshot, resultado)
+
+# Tipos de registro no WAL
+_SESSAO = 's'
+_CONTADOR = 'c'
+
+# -------------------------------------------------
+# Arquivos
+# -------------------------------------------------
+def _caminho(nome):
+    return os.path.join(_diretorio, nome)
+
+def _geracoes_wal():
+    geracoes = []
+    for nome in os.listdir(_diretorio):
+        if nome.startswith("wal.") and nome[4:].isdigit():
+            geracoes.append(int(nome[4:]))
+    return sorted(geracoes)
+
+def _abrir_wal(geracao):
+    global _fd_wal, _geracao
+    _geracao = geracao
+    _fd_wal = os.open(_caminho(f"wal.{geracao}"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+def _ler_wal(caminho):
+    """Gera os registros de um arquivo de WAL, parando em um registro incompleto."""
+    with open(caminho, "rb") as f:
+        dados = f.read()
+    pos = 0
+    tamanho_cabecalho = _CABECALHO.size
+    while pos + tamanho_cabecalho <= len(dados):
+        (tamanho,) = _CABECALHO.unpack_from(dados, pos)
+        inicio = pos + tamanho_cabecalho
+        if inicio + tamanho > len(dados):
+            break
+        try:
+            yield pickle.loads(dados[inicio:inicio + tamanho])
+        except Exception:
+            break
+        pos = inicio + tamanho
+
+def _travar_diretorio(diretorio):
+    """Garante que só um processo usa o diretório. Retorna False se já estiver em uso."""
+    global _fd_trava
+    import fcntl
+    fd = os.open(os.path.join(diretorio, "trava"), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _fd_trava = fd
+    return True
+
+def _escolher_diretorio():
+    """Primeiro diretório livre para este processo (um por worker). Levanta ErroConfiguracao."""
+    for numero in range(MAX_DIRETORIOS_WORKERS):
+        diretorio = PERSISTENCIA_DIR if numero == 0 else os.path.join(PERSISTENCIA_DIR, f"worker-{numero}")
+        os.makedirs(diretorio, exist_ok=True)
+        if _travar_diretorio(diretorio):
+            return diretorio
+    raise ErroConfiguracao(f"PERSISTENCIA_DIR: os {MAX_DIRETORIOS_WORKERS} diretórios de {PERSISTENCIA_DIR} "
+                           "já estão em uso por outros processos; as sessões deste worker não seriam persistidas.")
+
+# -------------------------------------------------
+# Restauração
+# -------------------------------------------------
+def carregar(diretorio):
+    """
+    Lê snapshot + WALs de `diretorio` sem travar nada.
+    Retorna (sessões, contador de pedidos ou None, próxima geração de WAL).
+    """
+    sessoes = {}
+    contador = None
+    primeira_geracao = 0
+    caminho_snapshot = os.path.join(diretorio, "snapshot")
+    if os.path.exists(caminho_snapshot):
+        with open(caminho_snapshot, "rb") as f:
+            cabecalho = pickle.load(f)
+            contador = cabecalho['contador']
+            primeira_geracao = cabecalho['proxima_geracao']
+            if 'sessoes' in cabecalho:
+                sessoes = cabecalho['sessoes']   # snapshot antigo, de um pickle só
+            while True:
+                try:
+                    sessoes.update(pickle.load(f))
+                except EOFError:
+                    break
+
+    ultima_geracao = primeira_geracao - 1
+    for nome in sorted((n for n in os.listdir(diretorio) if n.startswith("wal.") and n[4:].isdigit()),
+                       key=lambda n: int(n[4:])):
+        geracao = int(nome[4:])
+        if geracao < primeira_geracao:
+            continue
+        ultima_geracao = geracao
+        for tipo, chave, valor in _ler_wal(os.path.join(diretorio, nome)):
+            if tipo == _SESSAO and valor is None:
+                sessoes.pop(chave, None)
+            elif tipo == _SESSAO:
+                sessoes[chave] = valor
+            elif tipo == _CONTADOR:
+                contador = valor
+    return sessoes, contador, max(primeira_geracao, ultima_geracao + 1)
+
+def iniciar(sessoes, obter_contador, trava_sessoes):
+    """
+    Restaura as sessões persistidas dentro de `sessoes` (o SESSAO_ESTADOS) e
+    passa a registrar as mudanças. `obter_contador` devolve o contador de
+    pedidos atual para o snapshot; `trava_sessoes` é a trava de quem altera
+    as sessões. Retorna o contador salvo (ou None).
+    """
+    global ATIVO, _sessoes, _trava_sessoes, _obter_contador, _diretorio
+    if not PERSISTENCIA_DIR:
+        return None
+    _diretorio = _escolher_diretorio()
+
+    inicio = time.perf_counter()
+    restauradas, contador, proxima_geracao = carregar(_diretorio)
+    sessoes.update(restauradas)
+    _sessoes = sessoes
+    _trava_sessoes = trava_sessoes
+    _obter_contador = obter_contador
+    _abrir_wal(proxima_geracao)
+    ATIVO = True
+    print(f"✅ {len(restauradas)} sessões restauradas de {_diretorio} "
+          f"em {time.perf_counter() - inicio:.2f}s.")
+    return contador
+
+# -------------------------------------------------
+# Registro de mudanças
+# -------------------------------------------------
+def _acrescentar(registro):
+    global _registros_desde_snapshot
+    dados = pickle.dumps(registro, protocol=pickle.HIGHEST_PROTOCOL)
+    with _trava:
+        os.write(_fd_wal, _CABECALHO.pack(len(dados)) + dados)
+        if FSYNC:
+            os.fsync(_fd_wal)
+        _registros_desde_snapshot += 1
+        _verificar_snapshot()
+        if _registros_desde_snapshot >= SNAPSHOT_A_CADA and _snapshot_em_andamento is None:
+            _iniciar_snapshot()
+
+def registrar_sessao(sessao_id, sessao):
+    """Grava no WAL o estado atual de uma sessão."""
+    if ATIVO:
+        _acrescentar((_SESSAO, sessao_id, sessao))
+
+def remover_sessao(sessao_id):
+    """Grava no WAL que a sessão não é mais deste processo."""
+    if ATIVO:
+        _acrescentar((_SESSAO, sessao_id, None))
+
+def registrar_contador(valor):
+    """Grava no WAL o contador de IDs de pedido."""
+    if ATIVO:
+        _acrescentar((_CONTADOR, None, valor))
+
+# -------------------------------------------------
+# Snapshot
+# -------------------------------------------------
+def _gravar_snapshot(proxima_geracao, resultado):
+    """
+    Serializa e grava as sessões em blocos (roda na thread do snapshot): um cabeçalho
+    e depois um pickle {sessao_id: sessão} por bloco, cada um feito com a TRAVA_SESSOES.
+    """
+    try:
+        temporario = _caminho("snapshot.tmp")
+        with open(temporario, "wb") as f:
+            with _trava_sessoes:
+                chaves = list(_sessoes)
+                cabecalho = {'proxima_geracao': proxima_geracao, 'contador': _obter_contador()}
+            pickle.dump(cabecalho, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for inicio in range(0, len(chaves), TAMANHO_BLOCO_SNAPSHOT):
+                with _trava_sessoes:
+                    bloco = {chave: _sessoes[chave] for chave in chaves[inicio:inicio + TAMANHO_BLOCO_SNAPSHOT]
+                             if chave in _sessoes}
+                    dados = pickle.dumps(bloco, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, _caminho("snapshot"))
+        resultado['ok'] = True
+    except Exception as e:
+        resultado['erro'] = e
+
+def _apagar_wals_antigos(proxima_geracao):
+    for geracao in _geracoes_wal():
+        if geracao < proxima_geracao:
+            os.remove(_caminho(f"wal.{geracao}"))
+
+def _iniciar_snapshot():
+    """Troca a geração do WAL e começa o snapshot em uma thread (chamar com _trava)."""
+    global _registros_desde_snapshot, _snapshot_em_andamento
+    os.close(_fd_wal)
+    proxima_geracao = _geracao + 1
+    _abrir_wal(proxima_geracao)
+    _registros_desde_snapshot = 0
+    resultado = {}
+    thread = threading.Thread(target=_gravar_snapshot, args=(proxima_geracao, resultado),
+                              name="persistencia-snapshot", daemon=True)
+    thread.start()
+    _snapshot_em_andamento = (thread, proxima_geracao, resultado)
+
+def _verificar_snapshot():
+    """Recolhe a thread do snapshot se ela terminou; se deu certo, apaga os WALs que ele cobre (chamar com _trava)."""
+    global _snapshot_em_andamento
+    if _snapshot_em_andamento is None:
+        return
+    thread, proxima_geracao, resultado = _snapshot_em_andamento
+    if thread.is_alive():
+        return
+    _snapshot_em_andamento = None
+    if resultado.get('ok'):
+        _apagar_wals_antigos(proxima_geracao)
+    else:
+        print(f"❌ Erro ao gravar snapshot das sessões: {resultado.get('erro')}. Os WALs foram mantidos.")
+
+def _esperar_snapshot():
+    # Espera sem a _trava nem a TRAVA_SESSOES: a thread do snapshot precisa da TRAVA_SESSOES,
+    # e quem está com ela pode estar esperando a _trava para gravar no WAL
+    andamento = _snapshot_em_andamento
+    if andamento is not None:
+        andamento[0].join()
+    with _trava:
+        _verificar_snapshot()
+
+def snapshot_agora():
+    """
+    Força um snapshot e espera ele terminar (útil antes de um deploy).
+    Não chamar com a TRAVA_SESSOES.
+    """
+    if not ATIVO:
+        return
+    _esperar_snapshot()
+    with _trava:
+        if _snapshot_em_andamento is None:
+            _iniciar_snapshot()
+    _esperar_snapshot()
@@ -3,21 +3,20 @@
 # Este arquivo já está pronto para ser usado. Basta substituir o
 # conteúdo atual do seu repositório pelo código abaixo e, em seguida,
 # executar `python server.py` (ou `flask run` se preferir).
+#
+# Em produção, use o gunicorn.conf.py (app factory + --preload):
+#     gunicorn -c gunicorn.conf.py
 # -------------------------------------------------
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import os
-import hashlib
-import hmac
 import json
-import requests
-from datetime import datetime
-from dotenv import load_dotenv
 
 # -------------------------------------------------
-# Carrega as variáveis de ambiente do arquivo .env
+# Carrega as variáveis de ambiente do arquivo .env (antes dos outros imports, que as leem)
 # -------------------------------------------------
-load_dotenv()
+import config
+config.carregar_env()
 
 # -------------------------------------------------
 # Importa a lógica principal do seu bot
@@ -25,22 +24,36 @@ load_dotenv()
 # CORREÇÃO: O arquivo de lógica do bot foi ajustado para **bot_logic.py**
 from bot_logic import (
     processar_mensagem_shopee, # <-- Nova função para processar a mensagem com o sessao_id
+    processar_mensagem_atendente,
+    recarregar_regras,
     get_resposta_regra,
 )
-
-# -------------------------------------------------
-# Inicializa o aplicativo Flask
-# -------------------------------------------------
-app = Flask(__name__)
-
-# -------------------------------------------------
-# Credenciais da Shopee (variáveis no .env)
-# -------------------------------------------------
-PARTNER_ID = int(os.getenv('SHOPEE_PARTNER_ID'))
-API_KEY = os.getenv('SHOPEE_API_KEY')
-API_SECRET = os.getenv('SHOPEE_API_SECRET').encode('utf-8')   # a chave secreta deve ser bytes
-SHOP_ID = int(os.getenv('SHOPEE_SHOP_ID'))
-BASE_URL = "https://open.shopee.com"   # URL base da API da Shopee
+# Credenciais e assinatura ficam em shopee_api.py (compartilhado com server_async.py)
+from shopee_api import (
+    PARTNER_ID,
+    API_KEY,
+    API_SECRET,
+    SHOP_ID,
+    BASE_URL,
+    generate_shopee_signature,
+    get_access_token,
+    montar_requisicao_shopee,
+    extrair_dados_mensagem,
+    mensagem_duplicada,
+    esquecer_mensagem,
+    remetente_e_loja,
+    registrar_envio,
+    confirmar_envio,
+    eco_de_envio,
+    id_mensagem,
+)
+import metricas
+import perfil
+import atendimentos
+import cache_respostas
+import analise
+import cluster
+from admin import token_admin_valido, CABECALHO_TOKEN
 
 # -------------------------------------------------
 # Dicionário para armazenar tokens de acesso e refresh_token por shop_id
@@ -51,76 +64,33 @@ SHOP_TOKENS = {}   # Ex.: {shop_id: {'access_token': '...', 'refresh_token': '..
 # -------------------------------------------------
 # Funções auxiliares
 # -------------------------------------------------
-def generate_shopee_signature(url_path, access_token, shop_id, partner_id, timestamp, secret_key):
-    """Gera a assinatura HMAC‑SHA256 para requisições da Shopee API."""
-    base_string = f"{url_path}|{access_token}|{shop_id}|{partner_id}|{timestamp}"
-    h = hmac.new(secret_key, base_string.encode('utf-8'), hashlib.sha256)
-    return h.hexdigest()
-
-def get_access_token(shop_id):
-    """
-    Função mock para obter o access_token.
-    Em produção, implemente o fluxo OAuth 2.0 completo
-    para obter e renovar o access_token.
-    """
-    # TODO: Implementar a lógica real de OAuth 2.0 para obter e renovar o access_token
-    # Por enquanto, estamos usando um placeholder.
-    # Você precisará de um access_token válido para fazer chamadas reais à API.
-    print(
-        "⚠️ ATENÇÃO: Usando access_token placeholder para shop_id "
-        f"{shop_id}. Implemente o fluxo OAuth 2.0 para obter um token real."
-    )
-    # --- IMPORTANTE: Substitua isso pelo seu token real obtido via OAuth ---
-    # Se você ainda não implementou o OAuth, pode usar um token de teste temporário aqui,
-    # mas ele expirará.
-    return os.getenv('SHOPEE_ACCESS_TOKEN_PLACEHOLDER', "SEU_ACCESS_TOKEN_REAL_AQUI")
-
 def reply_shopee_message(shop_id, conversation_id, message_content):
     """Envia uma resposta para a Shopee API."""
-    url_path = "/api/v2/message/reply_message"
-    timestamp = int(datetime.now().timestamp())
-    access_token = get_access_token(shop_id)   # Obtenha o token real
-
-    if not access_token or access_token == "SEU_ACCESS_TOKEN_REAL_AQUI":
-        print("❌ Erro: access_token inválido. Não é possível responder à mensagem.")
-        return False
-
-    signature = generate_shopee_signature(
-        url_path,
-        access_token,
-        shop_id,
-        PARTNER_ID,
-        timestamp,
-        API_SECRET,
-    )
-
-    headers = {
-        "Content-Type": "application/json",
-        "Host": "open.shopee.com",
-        "x-shopee-api-partner-id": str(PARTNER_ID),
-        "x-shopee-api-timestamp": str(timestamp),
-        "x-shopee-api-access-token": access_token,
-        "x-shopee-api-shop-id": str(shop_id),
-        "x-shopee-api-signature": signature,
-    }
-
     payload = {
         "conversation_id": conversation_id,
         "message_type": "TEXT",
         "content": {"text": message_content},
     }
+    requisicao = montar_requisicao_shopee("/api/v2/message/reply_message", shop_id, payload)
+    if requisicao is None:
+        print("❌ Erro: access_token inválido. Não é possível responder à mensagem.")
+        metricas.FALHAS_RESPOSTA.inc("reply_message")
+        return False
+    url, headers, corpo = requisicao
+    id_envio = registrar_envio(conversation_id, message_content)   # a Shopee devolve o texto como eco no webhook
+    import requests   # import tardio: só o worker que de fato chama a Shopee paga o custo
 
     try:
-        response = requests.post(
-            f"{BASE_URL}{url_path}",
-            headers=headers,
-            data=json.dumps(payload),
-        )
+        with metricas.LATENCIA_SHOPEE.cronometrar("reply_message"), perfil.fase('shopee_api'):
+            response = requests.post(url, headers=headers, data=corpo)
         response.raise_for_status()          # Levanta erro para códigos 4xx/5xx
-        print(f"✅ Resposta enviada para Shopee: {response.json()}")
+        resultado = response.json()
+        print(f"✅ Resposta enviada para Shopee: {resultado}")
+        confirmar_envio(conversation_id, id_envio, (resultado.get('response') or {}).get('message_id'))
         return True
     except requests.exceptions.RequestException as e:
         print(f"❌ Erro ao enviar resposta para a Shopee: {e}")
+        metricas.FALHAS_RESPOSTA.inc("reply_message")
         print(
             f"Resposta da Shopee: {response.text if 'response' in locals() else 'N/A'}"
         )
@@ -128,41 +98,18 @@ def reply_shopee_message(shop_id, conversation_id, message_content):
 
 def mark_shopee_message_unread(shop_id, conversation_id):
     """Marca uma conversa como não lida na Shopee API."""
-    url_path = "/api/v2/message/mark_message_unread"
-    timestamp = int(datetime.now().timestamp())
-    access_token = get_access_token(shop_id)   # Obtenha o token real
-
-    if not access_token or access_token == "SEU_ACCESS_TOKEN_REAL_AQUI":
+    payload = {"conversation_id": conversation_id}
+    requisicao = montar_requisicao_shopee("/api/v2/message/mark_message_unread", shop_id, payload)
+    if requisicao is None:
         print("❌ Erro: access_token inválido. Não é possível marcar mensagem como não lida.")
+        metricas.FALHAS_RESPOSTA.inc("mark_message_unread")
         return False
-
-    signature = generate_shopee_signature(
-        url_path,
-        access_token,
-        shop_id,
-        PARTNER_ID,
-        timestamp,
-        API_SECRET,
-    )
-
-    headers = {
-        "Content-Type": "application/json",
-        "Host": "open.shopee.com",
-        "x-shopee-api-partner-id": str(PARTNER_ID),
-        "x-shopee-api-timestamp": str(timestamp),
-        "x-shopee-api-access-token": access_token,
-        "x-shopee-api-shop-id": str(shop_id),
-        "x-shopee-api-signature": signature,
-    }
-
-    payload = {"conversation_id": conversation_id}
+    url, headers, corpo = requisicao
+    import requests
 
     try:
-        response = requests.post(
-            f"{BASE_URL}{url_path}",
-            headers=headers,
-            data=json.dumps(payload),
-        )
+        with metricas.LATENCIA_SHOPEE.cronometrar("mark_message_unread"), perfil.fase('shopee_api'):
+            response = requests.post(url, headers=headers, data=corpo)
         response.raise_for_status()
         print(
             f"✅ Conversa {conversation_id} marcada como não lida na Shopee: {response.json()}"
@@ -170,24 +117,34 @@ def mark_shopee_message_unread(shop_id, conversation_id):
         return True
     except requests.exceptions.RequestException as e:
         print(f"❌ Erro ao marcar conversa como não lida na Shopee: {e}")
+        metricas.FALHAS_RESPOSTA.inc("mark_message_unread")
         print(
             f"Resposta da Shopee: {response.text if 'response' in locals() else 'N/A'}"
         )
         return False
 
 # -------------------------------------------------
-# Endpoints da API (rotas do Flask)
+# Endpoints da API (rotas do Flask, registradas em criar_app)
 # -------------------------------------------------
 
 # Rota para a URL base (para verificar se o serviço está online)
-@app.route('/')
 def home():
     """Retorna uma mensagem simples para indicar que o bot está online."""
     return "Bot Shopee Atendimento Posh está online!", 200
 
-@app.route('/shopee/webhook', methods=['GET', 'POST'])
 def shopee_webhook():
     """Endpoint para receber webhooks de mensagens da Shopee."""
+    metricas.FILA_WEBHOOKS.inc()
+    token_perfil = perfil.iniciar_requisicao(f"{request.method} /shopee/webhook")
+    try:
+        with metricas.LATENCIA_WEBHOOK.cronometrar():
+            return _processar_webhook()
+    finally:
+        perfil.finalizar_requisicao(token_perfil)
+        metricas.FILA_WEBHOOKS.dec()
+
+def _processar_webhook():
+    """Processa o webhook de fato (ver shopee_webhook)."""
     if request.method == 'GET':
         # Responde a requisições GET para verificação da URL pela Shopee
         print("✅ Webhook URL verificado pela Shopee (GET request).")
@@ -210,6 +167,21 @@ def shopee_webhook():
         return jsonify({"message": "Webhook verificado com sucesso"}), 200
     # --- FIM DA CORREÇÃO CRÍTICA ---
 
+    # Com vários nós (cluster.py), a conversa é atendida pelo nó dono dela
+    destino = cluster.destino_webhook(data, request.headers)
+    if destino:
+        repassado = cluster.encaminhar_webhook(destino, request.get_data(), request.headers)
+        if repassado is None:
+            return jsonify({"message": "Nó responsável pela conversa indisponível"}), 503
+        status, corpo = repassado
+        return Response(corpo, status=status, content_type="application/json")
+
+    # Reenvio do mesmo webhook pela Shopee: já respondemos, só confirma o recebimento
+    if mensagem_duplicada(data):
+        metricas.DEDUP.inc()
+        print("ℹ️ Webhook duplicado (message_id já processado). Ignorando.")
+        return jsonify({"message": "Mensagem duplicada ignorada"}), 200
+
     # -------------------------------------------------
     # Verifica a assinatura do webhook (opcional – importante em produção)
     # -------------------------------------------------
@@ -219,24 +191,32 @@ def shopee_webhook():
     # Extrai informações da mensagem
     # -------------------------------------------------
     try:
-        shop_id = data.get('shop_id')
-        # Usar .get com fallback para dicionário vazio para evitar NoneType
-        message_data = data.get('data', {}).get('message', {})
-        conversation_id = message_data.get('conversation_id')
-        sender_id = message_data.get('from_user_id')          # ID do cliente
-        message_content = message_data.get('content', {}).get('text', '')
-
-        if not all([shop_id, conversation_id, sender_id, message_content is not None]):
+        dados_mensagem = extrair_dados_mensagem(data)
+        if dados_mensagem is None:
             print("❌ Dados essenciais da mensagem ausentes no webhook.")
             return jsonify({"message": "Dados da mensagem incompletos"}), 400
+        shop_id, conversation_id, sender_id, message_content = dados_mensagem
+
+        # Simula o ID da sessão do bot com o conversation_id da Shopee
+        sessao_id = str(conversation_id)
+        cluster.garantir_sessao(sessao_id)   # conversa que acabou de mudar de nó
+
+        # -------------------------------------------------
+        # Mensagens enviadas pela própria loja: eco das respostas do bot ou atendente humano
+        # -------------------------------------------------
+        if remetente_e_loja(shop_id, sender_id):
+            if eco_de_envio(conversation_id, message_content, id_mensagem(data)):
+                metricas.MENSAGENS_LOJA.inc('eco_bot')
+                return jsonify({"message": "Eco da resposta do bot ignorado"}), 200
+            metricas.MENSAGENS_LOJA.inc('atendente')
+            print(f"Mensagem do atendente na conversa {conversation_id}. A assistente não responde.")
+            processar_mensagem_atendente(sessao_id, message_content)
+            return jsonify({"message": "Mensagem do atendente registrada"}), 200
 
         print(
             f"Mensagem do cliente ({sender_id}) na conversa {conversation_id} da loja {shop_id}: {message_content}"
         )
 
-        # Simula o ID da sessão do bot com o conversation_id da Shopee
-        sessao_id = str(conversation_id)
-
         # -------------------------------------------------
         # Processa a mensagem com a lógica do seu bot
         # -------------------------------------------------
@@ -260,10 +240,120 @@ def shopee_webhook():
 
     except Exception as e:
         print(f"❌ Erro ao processar webhook da Shopee: {e}")
+        # A Shopee reenvia o webhook que falhou: o reenvio não pode ser tratado como duplicado
+        esquecer_mensagem(data)
         # Retorna um erro 500 para outros tipos de exceção
         return jsonify({"message": "Erro interno do servidor"}), 500
 
-@app.route('/oauth/callback', methods=['GET'])
+def metrics():
+    """Expõe as métricas do bot no formato texto do Prometheus."""
+    return Response(metricas.gerar_texto_prometheus(), content_type=metricas.CONTENT_TYPE)
+
+def admin_perfil():
+    """
+    GET: retorna o estado do profiling e as últimas requisições lentas deste worker.
+    POST: liga/desliga o profiling neste worker. Ex.: {"ativo": true, "limite_ms": 200}
+    """
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    if request.method == 'POST':
+        dados = request.get_json(force=True, silent=True) or {}
+        try:
+            if not isinstance(dados, dict):
+                raise ValueError("corpo JSON inválido")
+            return jsonify(perfil.configurar(dados.get('ativo'), dados.get('limite_ms'))), 200
+        except ValueError:
+            return jsonify({"message": "Parâmetros 'ativo' ou 'limite_ms' inválidos"}), 400
+    return jsonify(perfil.estado()), 200
+
+def admin_atendimentos():
+    """
+    Fila de atendimentos humanos em aberto deste worker, do cliente esperando há mais tempo
+    para o mais recente. Paginação: ?limite=50&cursor=<proximo_cursor da página anterior>
+    """
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    try:
+        pagina = atendimentos.listar(request.args.get('limite', atendimentos.LIMITE_PADRAO),
+                                     request.args.get('cursor'))
+    except ValueError:
+        return jsonify({"message": "Parâmetros 'limite' ou 'cursor' inválidos"}), 400
+    return jsonify(pagina), 200
+
+def admin_regras():
+    """Relê o arquivo de regras neste worker (o cache de respostas descarta só o que mudou)."""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    alteradas = recarregar_regras()
+    return jsonify({"regras_alteradas": alteradas, "cache": cache_respostas.estatisticas()}), 200
+
+def admin_analise():
+    """
+    Agregados por hora de todos os workers com ANALISE_DIR (intenções, fluxos, transições, abandonos...).
+    Parâmetros: ?desde=2025-01-31T00&ate=2025-02-01T00&evento=transicao,abandono&por_hora=1
+    (padrão: últimas 24h, todos os eventos, só os totais).
+    """
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    eventos = [e for e in request.args.get('evento', '').split(',') if e]
+    try:
+        resultado = analise.consultar(request.args.get('desde'), request.args.get('ate'), eventos,
+                                      por_hora=request.args.get('por_hora') == '1')
+    except ValueError:
+        return jsonify({"message": "Parâmetros 'desde' ou 'ate' inválidos"}), 400
+    return jsonify(resultado), 200
+
+def _json_cluster():
+    """Corpo JSON de uma chamada /cluster/* (levanta ValueError se não for um objeto)."""
+    dados = request.get_json(force=True, silent=True)
+    if not isinstance(dados, dict):
+        raise ValueError("corpo JSON inválido")
+    return dados
+
+def cluster_estado():
+    """Nós do cluster e sessões deste nó."""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    return jsonify(cluster.estado()), 200
+
+def cluster_nos():
+    """Troca a lista de nós (entrada/saída de nó). Ex.: {"nos": ["http://10.0.0.1:5000", ...]}"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    try:
+        return jsonify(cluster.atualizar_nos(_json_cluster().get('nos'))), 200
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+def cluster_sessoes():
+    """Recebe sessões migradas de outro nó. Ex.: {"sessoes": {"123": {...}}}"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    try:
+        return jsonify({"instaladas": cluster.receber_sessoes(_json_cluster().get('sessoes'))}), 200
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+def cluster_retirar():
+    """Entrega uma sessão ao nó que vai atendê-la (e a tira deste nó). Ex.: {"sessao_id": "123", "no": "http://..."}"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    try:
+        dados = _json_cluster()
+        sessao_id, para = str(dados['sessao_id']), str(dados.get('no') or '')
+    except (ValueError, KeyError):
+        return jsonify({"message": "Informe 'sessao_id'"}), 400
+    return jsonify(cluster.retirar_sessao(sessao_id, para)), 200
+
+def cluster_sessao():
+    """Estado de uma sessão deste nó: ?id=<conversation_id>"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return jsonify({"message": "Não autorizado"}), 403
+    estado = cluster.sessao_local(request.args.get('id', ''))
+    if estado is None:
+        return jsonify({"message": "Sessão não está neste nó"}), 404
+    return jsonify({"estado": estado}), 200
+
 def oauth_callback():
     """Endpoint para o callback OAuth da Shopee."""
     # Este endpoint é onde a Shopee redirecionará após o vendedor autorizar seu app.
@@ -286,3 +376,32 @@ def oauth_callback():
         ), 200
     else:
         return "OAuth Callback: Parâmetros 'code' ou 'shop_id' ausentes.", 400
+
+# -------------------------------------------------
+# App factory
+# -------------------------------------------------
+def criar_app():
+    """Cria o aplicativo Flask com as rotas do bot (usado pelo gunicorn: "server:criar_app()")."""
+    app = Flask(__name__)
+    app.add_url_rule('/', view_func=home)
+    app.add_url_rule('/shopee/webhook', view_func=shopee_webhook, methods=['GET', 'POST'])
+    app.add_url_rule('/metrics', view_func=metrics, methods=['GET'])
+    app.add_url_rule('/admin/perfil', view_func=admin_perfil, methods=['GET', 'POST'])
+    app.add_url_rule('/admin/atendimentos', view_func=admin_atendimentos, methods=['GET'])
+    app.add_url_rule('/admin/regras', view_func=admin_regras, methods=['POST'])
+    app.add_url_rule('/admin/analise', view_func=admin_analise, methods=['GET'])
+    app.add_url_rule('/cluster', view_func=cluster_estado, methods=['GET'])
+    app.add_url_rule('/cluster/nos', view_func=cluster_nos, methods=['POST'])
+    app.add_url_rule('/cluster/sessoes', view_func=cluster_sessoes, methods=['POST'])
+    app.add_url_rule('/cluster/retirar', view_func=cluster_retirar, methods=['POST'])
+    app.add_url_rule('/cluster/sessao', view_func=cluster_sessao, methods=['GET'])
+    app.add_url_rule('/oauth/callback', view_func=oauth_callback, methods=['GET'])
+    return app
+
+# Mantido para `gunicorn server:app` e `flask run`
+app = criar_app()
+
+if __name__ == "__main__":
+    import bot_logic
+    bot_logic.inicializar_worker()
+    app.run(port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,399 @@
+# server_async.py - Servidor asyncio (aiohttp) para integração com Shopee
+# -------------------------------------------------
+# Alternativa ao server.py (Flask + gunicorn síncrono). Atende as mesmas
+# rotas (`/`, `/shopee/webhook` e `/oauth/callback`), mas as chamadas de
+# saída para a Shopee usam um cliente HTTP assíncrono com pool de conexões,
+# então uma chamada lenta da Shopee não bloqueia o worker inteiro.
+#
+# A lógica do bot (`processar_mensagem_shopee`, `processar_mensagem_atendente`
+# e as rotas /cluster/* que mexem nas sessões) roda em threads com
+# asyncio.to_thread: ela espera a TRAVA_SESSOES (também usada pela thread do
+# agendador) e grava arquivos (pedidos, WAL com fsync opcional, eco dos
+# envios), e nada disso pode parar as outras conexões do event loop.
+#
+# Para executar localmente:
+#     python server_async.py
+# Com gunicorn:
+#     gunicorn -c gunicorn.conf.py "server_async:criar_app()" --worker-class aiohttp.GunicornWebWorker
+# -------------------------------------------------
+
+import os
+import json
+import asyncio
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector, ClientError
+
+# -------------------------------------------------
+# Carrega as variáveis de ambiente do arquivo .env (antes dos outros imports, que as leem)
+# -------------------------------------------------
+import config
+config.carregar_env()
+
+from bot_logic import processar_mensagem_shopee, processar_mensagem_atendente, recarregar_regras
+from shopee_api import (
+    montar_requisicao_shopee,
+    extrair_dados_mensagem,
+    mensagem_duplicada,
+    esquecer_mensagem,
+    remetente_e_loja,
+    registrar_envio,
+    confirmar_envio,
+    eco_de_envio,
+    id_mensagem,
+)
+import metricas
+import perfil
+import atendimentos
+import cache_respostas
+import analise
+import cluster
+from admin import token_admin_valido, CABECALHO_TOKEN
+
+# Tamanho do pool de conexões de saída e timeout das chamadas à Shopee
+LIMITE_CONEXOES_SHOPEE = int(os.getenv('SHOPEE_LIMITE_CONEXOES', '100'))
+TIMEOUT_SHOPEE_SEGUNDOS = float(os.getenv('SHOPEE_TIMEOUT_SEGUNDOS', '10'))
+
+CHAVE_CLIENTE_HTTP = web.AppKey("cliente_http", ClientSession)
+
+# -------------------------------------------------
+# Chamadas assíncronas à Shopee API
+# -------------------------------------------------
+async def _post_shopee(cliente, url_path, shop_id, payload):
+    """Faz um POST assinado na Shopee API. Retorna o JSON de resposta ou None em caso de erro."""
+    endpoint = url_path.rsplit('/', 1)[-1]
+    requisicao = montar_requisicao_shopee(url_path, shop_id, payload)
+    if requisicao is None:
+        print(f"❌ Erro: access_token inválido. Não é possível chamar {url_path}.")
+        metricas.FALHAS_RESPOSTA.inc(endpoint)
+        return None
+    url, headers, corpo = requisicao
+
+    try:
+        with metricas.LATENCIA_SHOPEE.cronometrar(endpoint), perfil.fase('shopee_api'):
+            async with cliente.post(url, headers=headers, data=corpo) as response:
+                texto = await response.text()
+        if response.status >= 400:
+            print(f"❌ Erro HTTP {response.status} ao chamar {url_path} na Shopee.")
+            print(f"Resposta da Shopee: {texto}")
+            metricas.FALHAS_RESPOSTA.inc(endpoint)
+            return None
+        return json.loads(texto) if texto else {}
+    except (ClientError, asyncio.TimeoutError, ValueError) as e:
+        print(f"❌ Erro ao chamar {url_path} na Shopee: {e}")
+        metricas.FALHAS_RESPOSTA.inc(endpoint)
+        return None
+
+async def reply_shopee_message(cliente, shop_id, conversation_id, message_content):
+    """Envia uma resposta para a Shopee API."""
+    payload = {
+        "conversation_id": conversation_id,
+        "message_type": "TEXT",
+        "content": {"text": message_content},
+    }
+    # A Shopee devolve o texto como eco no webhook (o registro pode ir para arquivo: fora do event loop)
+    id_envio = await asyncio.to_thread(registrar_envio, conversation_id, message_content)
+    resultado = await _post_shopee(cliente, "/api/v2/message/reply_message", shop_id, payload)
+    if resultado is None:
+        return False
+    print(f"✅ Resposta enviada para Shopee: {resultado}")
+    await asyncio.to_thread(confirmar_envio, conversation_id, id_envio,
+                            (resultado.get('response') or {}).get('message_id'))
+    return True
+
+async def encaminhar_webhook(cliente, destino, corpo, cabecalhos):
+    """Repassa o webhook ao nó dono da conversa (cluster.py). Retorna a resposta dele ou None."""
+    try:
+        async with cliente.post(f"{destino}/shopee/webhook", data=corpo,
+                                timeout=ClientTimeout(total=cluster.TIMEOUT_SEGUNDOS),
+                                headers=cluster.cabecalhos_repasse(cabecalhos)) as resp:
+            resposta = web.Response(body=await resp.read(), status=resp.status, content_type="application/json")
+    except (ClientError, asyncio.TimeoutError) as e:
+        metricas.WEBHOOKS_ENCAMINHADOS.inc('falha')
+        print(f"❌ Cluster: não foi possível repassar o webhook para {destino}: {e}")
+        return None
+    metricas.WEBHOOKS_ENCAMINHADOS.inc('ok')
+    return resposta
+
+async def mark_shopee_message_unread(cliente, shop_id, conversation_id):
+    """Marca uma conversa como não lida na Shopee API."""
+    payload = {"conversation_id": conversation_id}
+    resultado = await _post_shopee(cliente, "/api/v2/message/mark_message_unread", shop_id, payload)
+    if resultado is None:
+        return False
+    print(f"✅ Conversa {conversation_id} marcada como não lida na Shopee: {resultado}")
+    return True
+
+# -------------------------------------------------
+# Endpoints da API (rotas do aiohttp)
+# -------------------------------------------------
+async def home(request):
+    """Retorna uma mensagem simples para indicar que o bot está online."""
+    return web.Response(text="Bot Shopee Atendimento Posh está online!")
+
+async def shopee_webhook(request):
+    """Endpoint para receber webhooks de mensagens da Shopee."""
+    metricas.FILA_WEBHOOKS.inc()
+    # A thread do event loop é de todas as requisições: só as fases em outras threads são amostradas
+    token_perfil = perfil.iniciar_requisicao(f"{request.method} /shopee/webhook", amostrar_thread=False)
+    try:
+        with metricas.LATENCIA_WEBHOOK.cronometrar():
+            return await _processar_webhook(request)
+    finally:
+        perfil.finalizar_requisicao(token_perfil)
+        metricas.FILA_WEBHOOKS.dec()
+
+async def _processar_webhook(request):
+    """Processa o webhook de fato (ver shopee_webhook)."""
+    if request.method == 'GET':
+        print("✅ Webhook URL verificado pela Shopee (GET request).")
+        return web.Response(text="Webhook URL verified")
+
+    try:
+        data = await request.json(loads=json.loads)
+    except ValueError:
+        data = None
+
+    if not data or not isinstance(data, dict):
+        print("❌ Payload vazio ou não-JSON válido recebido no webhook POST.")
+        return web.json_response({"message": "Payload inválido ou vazio"}, status=400)
+
+    print(f"Webhook da Shopee recebido: {json.dumps(data, indent=2)}")
+
+    if data.get('data', {}).get('verify_info'):
+        print("✅ Payload de verificação da Shopee recebido. Respondendo com 200 OK.")
+        return web.json_response({"message": "Webhook verificado com sucesso"})
+
+    # Com vários nós (cluster.py), a conversa é atendida pelo nó dono dela
+    destino = cluster.destino_webhook(data, request.headers)
+    if destino:
+        resposta = await encaminhar_webhook(request.app[CHAVE_CLIENTE_HTTP], destino, await request.read(),
+                                            request.headers)
+        if resposta is None:
+            return web.json_response({"message": "Nó responsável pela conversa indisponível"}, status=503)
+        return resposta
+
+    if mensagem_duplicada(data):
+        metricas.DEDUP.inc()
+        print("ℹ️ Webhook duplicado (message_id já processado). Ignorando.")
+        return web.json_response({"message": "Mensagem duplicada ignorada"})
+
+    try:
+        dados_mensagem = extrair_dados_mensagem(data)
+        if dados_mensagem is None:
+            print("❌ Dados essenciais da mensagem ausentes no webhook.")
+            return web.json_response({"message": "Dados da mensagem incompletos"}, status=400)
+        shop_id, conversation_id, sender_id, message_content = dados_mensagem
+
+        sessao_id = str(conversation_id)
+        if cluster.precisa_buscar(sessao_id):
+            # Conversa que acabou de mudar de nó: a busca é HTTP síncrona, fora do event loop
+            await asyncio.to_thread(cluster.garantir_sessao, sessao_id)
+
+        # Mensagens enviadas pela própria loja: eco das respostas do bot ou atendente humano
+        if remetente_e_loja(shop_id, sender_id):
+            if await asyncio.to_thread(eco_de_envio, conversation_id, message_content, id_mensagem(data)):
+                metricas.MENSAGENS_LOJA.inc('eco_bot')
+                return web.json_response({"message": "Eco da resposta do bot ignorado"})
+            metricas.MENSAGENS_LOJA.inc('atendente')
+            print(f"Mensagem do atendente na conversa {conversation_id}. A assistente não responde.")
+            await asyncio.to_thread(processar_mensagem_atendente, sessao_id, message_content)
+            return web.json_response({"message": "Mensagem do atendente registrada"})
+
+        print(
+            f"Mensagem do cliente ({sender_id}) na conversa {conversation_id} da loja {shop_id}: {message_content}"
+        )
+
+        # A lógica do bot é síncrona (trava das sessões e gravação em arquivos): roda numa thread
+        resposta_bot, encaminhado_humano = await asyncio.to_thread(processar_mensagem_shopee, sessao_id,
+                                                                   message_content)
+        print(f"Resposta do bot para {sessao_id}: {resposta_bot}")
+
+        cliente = request.app[CHAVE_CLIENTE_HTTP]
+        if resposta_bot:
+            await reply_shopee_message(cliente, shop_id, conversation_id, resposta_bot)
+
+        if encaminhado_humano:
+            print(f"Bot indicou transferência para humano na sessão {sessao_id}. Marcando como não lida.")
+            await mark_shopee_message_unread(cliente, shop_id, conversation_id)
+
+        return web.json_response({"message": "Mensagem processada com sucesso"})
+
+    except Exception as e:
+        print(f"❌ Erro ao processar webhook da Shopee: {e}")
+        # A Shopee reenvia o webhook que falhou: o reenvio não pode ser tratado como duplicado
+        esquecer_mensagem(data)
+        return web.json_response({"message": "Erro interno do servidor"}, status=500)
+
+async def metrics(request):
+    """Expõe as métricas do bot no formato texto do Prometheus."""
+    # Grava o snapshot deste worker e lê os dos outros: fora do event loop.
+    texto = await asyncio.to_thread(metricas.gerar_texto_prometheus)
+    return web.Response(body=texto.encode('utf-8'),
+                        headers={"Content-Type": metricas.CONTENT_TYPE})
+
+async def admin_perfil(request):
+    """
+    GET: retorna o estado do profiling e as últimas requisições lentas deste worker.
+    POST: liga/desliga o profiling neste worker. Ex.: {"ativo": true, "limite_ms": 200}
+    """
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    if request.method == 'POST':
+        try:
+            dados = await request.json()
+        except ValueError:
+            dados = {}
+        try:
+            if not isinstance(dados, dict):
+                raise ValueError("corpo JSON inválido")
+            return web.json_response(perfil.configurar(dados.get('ativo'), dados.get('limite_ms')))
+        except ValueError:
+            return web.json_response({"message": "Parâmetros 'ativo' ou 'limite_ms' inválidos"}, status=400)
+    return web.json_response(perfil.estado())
+
+async def admin_atendimentos(request):
+    """
+    Fila de atendimentos humanos em aberto deste worker, do cliente esperando há mais tempo
+    para o mais recente. Paginação: ?limite=50&cursor=<proximo_cursor da página anterior>
+    """
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    try:
+        pagina = atendimentos.listar(request.query.get('limite', atendimentos.LIMITE_PADRAO),
+                                     request.query.get('cursor'))
+    except ValueError:
+        return web.json_response({"message": "Parâmetros 'limite' ou 'cursor' inválidos"}, status=400)
+    return web.json_response(pagina)
+
+async def admin_regras(request):
+    """Relê o arquivo de regras neste worker (o cache de respostas descarta só o que mudou)."""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    # Lê o arquivo e segura TRAVA_SESSOES: fora do event loop.
+    alteradas = await asyncio.to_thread(recarregar_regras)
+    return web.json_response({"regras_alteradas": alteradas, "cache": cache_respostas.estatisticas()})
+
+async def admin_analise(request):
+    """
+    Agregados por hora de todos os workers com ANALISE_DIR (intenções, fluxos, transições, abandonos...).
+    Parâmetros: ?desde=2025-01-31T00&ate=2025-02-01T00&evento=transicao,abandono&por_hora=1
+    (padrão: últimas 24h, todos os eventos, só os totais).
+    """
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    eventos = [e for e in request.query.get('evento', '').split(',') if e]
+    try:
+        # Lê os arquivos de todos os workers: fora do event loop.
+        resultado = await asyncio.to_thread(analise.consultar, request.query.get('desde'),
+                                            request.query.get('ate'), eventos,
+                                            por_hora=request.query.get('por_hora') == '1')
+    except ValueError:
+        return web.json_response({"message": "Parâmetros 'desde' ou 'ate' inválidos"}, status=400)
+    return web.json_response(resultado)
+
+async def _json_cluster(request):
+    """Corpo JSON de uma chamada /cluster/* (levanta ValueError se não for um objeto)."""
+    dados = await request.json()
+    if not isinstance(dados, dict):
+        raise ValueError("corpo JSON inválido")
+    return dados
+
+async def cluster_estado(request):
+    """Nós do cluster e sessões deste nó."""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    return web.json_response(cluster.estado())
+
+async def cluster_nos(request):
+    """Troca a lista de nós (entrada/saída de nó). Ex.: {"nos": ["http://10.0.0.1:5000", ...]}"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    try:
+        return web.json_response(cluster.atualizar_nos((await _json_cluster(request)).get('nos')))
+    except ValueError as e:
+        return web.json_response({"message": str(e)}, status=400)
+
+async def cluster_sessoes(request):
+    """Recebe sessões migradas de outro nó. Ex.: {"sessoes": {"123": {...}}}"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    try:
+        instaladas = await asyncio.to_thread(cluster.receber_sessoes, (await _json_cluster(request)).get('sessoes'))
+    except ValueError as e:
+        return web.json_response({"message": str(e)}, status=400)
+    return web.json_response({"instaladas": instaladas})
+
+async def cluster_retirar(request):
+    """Entrega uma sessão ao nó que vai atendê-la (e a tira deste nó). Ex.: {"sessao_id": "123", "no": "http://..."}"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    try:
+        dados = await _json_cluster(request)
+        sessao_id, para = str(dados['sessao_id']), str(dados.get('no') or '')
+    except (ValueError, KeyError):
+        return web.json_response({"message": "Informe 'sessao_id'"}, status=400)
+    return web.json_response(await asyncio.to_thread(cluster.retirar_sessao, sessao_id, para))
+
+async def cluster_sessao(request):
+    """Estado de uma sessão deste nó: ?id=<conversation_id>"""
+    if not token_admin_valido(request.headers.get(CABECALHO_TOKEN)):
+        return web.json_response({"message": "Não autorizado"}, status=403)
+    estado = await asyncio.to_thread(cluster.sessao_local, request.query.get('id', ''))
+    if estado is None:
+        return web.json_response({"message": "Sessão não está neste nó"}, status=404)
+    return web.json_response({"estado": estado})
+
+async def oauth_callback(request):
+    """Endpoint para o callback OAuth da Shopee."""
+    code = request.query.get('code')
+    shop_id = request.query.get('shop_id')
+    print(f"OAuth Callback recebido: code={code}, shop_id={shop_id}")
+
+    if code and shop_id:
+        # TODO: Implementar a lógica de troca de código OAuth por tokens reais aqui!
+        print(
+            "⚠ ATENÇÃO: Implemente a lógica de troca de código OAuth por tokens reais aqui!"
+        )
+        return web.Response(text=(
+            f"OAuth Callback processado. Shop ID: {shop_id}, Code: {code}. "
+            "Agora troque o código por um access_token real."
+        ))
+    return web.Response(text="OAuth Callback: Parâmetros 'code' ou 'shop_id' ausentes.", status=400)
+
+# -------------------------------------------------
+# Ciclo de vida do cliente HTTP com pool de conexões
+# -------------------------------------------------
+async def _abrir_cliente_http(app):
+    app[CHAVE_CLIENTE_HTTP] = ClientSession(
+        connector=TCPConnector(limit=LIMITE_CONEXOES_SHOPEE, keepalive_timeout=30),
+        timeout=ClientTimeout(total=TIMEOUT_SHOPEE_SEGUNDOS),
+    )
+
+async def _fechar_cliente_http(app):
+    await app[CHAVE_CLIENTE_HTTP].close()
+
+def criar_app():
+    """Cria o aplicativo aiohttp com as mesmas rotas do server.py."""
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_route('GET', '/shopee/webhook', shopee_webhook)
+    app.router.add_route('POST', '/shopee/webhook', shopee_webhook)
+    app.router.add_get('/oauth/callback', oauth_callback)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_route('GET', '/admin/perfil', admin_perfil)
+    app.router.add_route('POST', '/admin/perfil', admin_perfil)
+    app.router.add_get('/admin/atendimentos', admin_atendimentos)
+    app.router.add_post('/admin/regras', admin_regras)
+    app.router.add_get('/admin/analise', admin_analise)
+    app.router.add_get('/cluster', cluster_estado)
+    app.router.add_post('/cluster/nos', cluster_nos)
+    app.router.add_post('/cluster/sessoes', cluster_sessoes)
+    app.router.add_post('/cluster/retirar', cluster_retirar)
+    app.router.add_get('/cluster/sessao', cluster_sessao)
+    app.on_startup.append(_abrir_cliente_http)
+    app.on_cleanup.append(_fechar_cliente_http)
+    return app
+
+if __name__ == "__main__":
+    import bot_logic
+    bot_logic.inicializar_worker()
+    web.run_app(criar_app(), port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,291 @@
+# shopee_api.py - Funções compartilhadas de acesso à Shopee API
+# -------------------------------------------------
+# Usado tanto pelo servidor Flask (server.py) quanto pelo servidor
+# asyncio (server_async.py). Aqui fica apenas o que independe do
+# cliente HTTP: credenciais, assinatura, cabeçalhos e leitura do webhook.
+# -------------------------------------------------
+
+import os
+import re
+import time
+import hashlib
+import hmac
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+
+from config import configuracao_shopee
+
+# -------------------------------------------------
+# Credenciais da Shopee (variáveis no .env, validadas em config.py)
+# -------------------------------------------------
+_CONFIGURACAO = configuracao_shopee()
+PARTNER_ID = _CONFIGURACAO.partner_id
+API_KEY = _CONFIGURACAO.api_key
+API_SECRET = _CONFIGURACAO.api_secret   # a chave secreta deve ser bytes
+SHOP_ID = _CONFIGURACAO.shop_id
+# URL base da API da Shopee (SHOPEE_BASE_URL pode apontar para um stub em testes de carga)
+BASE_URL = _CONFIGURACAO.base_url
+
+ACCESS_TOKEN_PLACEHOLDER = "SEU_ACCESS_TOKEN_REAL_AQUI"
+
+# A Shopee reenvia o webhook quando não recebe 200 a tempo. Guardamos os
+# últimos message_id vistos (por worker) para não responder duas vezes.
+LIMITE_MENSAGENS_RECENTES = 10000
+_MENSAGENS_RECENTES = OrderedDict()
+_trava_mensagens = threading.Lock()
+
+# As respostas do bot saem pela conta da loja, então a Shopee também as
+# entrega no webhook com from_user_id da loja. Anotamos cada envio (texto
+# normalizado e, quando a Shopee devolve, o message_id) para não confundir
+# esse eco com um atendente. Numa troca de worker o eco pode chegar ao
+# worker novo: com SHOPEE_ENVIOS_DIR (o gunicorn.conf.py define um por
+# padrão) os envios ficam em arquivos nesse diretório, um por envio,
+# visíveis a todos os processos; sem ele, ficam na memória do processo.
+ENVIOS_DIR = os.getenv('SHOPEE_ENVIOS_DIR') or None
+LIMITE_CONVERSAS_ENVIOS = 10000
+ENVIOS_POR_CONVERSA = 5
+PREFIXO_MINIMO_ECO = 20   # eco cortado pela Shopee: basta bater o começo do texto enviado
+_ENVIOS_RECENTES = OrderedDict()   # conversation_id -> {id do envio: (texto normalizado, message_id)}
+_trava_envios = threading.Lock()
+
+# -------------------------------------------------
+# Funções auxiliares
+# -------------------------------------------------
+def generate_shopee_signature(url_path, access_token, shop_id, partner_id, timestamp, secret_key):
+    """Gera a assinatura HMAC‑SHA256 para requisições da Shopee API."""
+    base_string = f"{url_path}|{access_token}|{shop_id}|{partner_id}|{timestamp}"
+    h = hmac.new(secret_key, base_string.encode('utf-8'), hashlib.sha256)
+    return h.hexdigest()
+
+def get_access_token(shop_id):
+    """
+    Função mock para obter o access_token.
+    Em produção, implemente o fluxo OAuth 2.0 completo
+    para obter e renovar o access_token.
+    """
+    # TODO: Implementar a lógica real de OAuth 2.0 para obter e renovar o access_token
+    # Por enquanto, estamos usando um placeholder.
+    # Você precisará de um access_token válido para fazer chamadas reais à API.
+    print(
+        "⚠️ ATENÇÃO: Usando access_token placeholder para shop_id "
+        f"{shop_id}. Implemente o fluxo OAuth 2.0 para obter um token real."
+    )
+    # --- IMPORTANTE: Substitua isso pelo seu token real obtido via OAuth ---
+    # Se você ainda não implementou o OAuth, pode usar um token de teste temporário aqui,
+    # mas ele expirará.
+    return os.getenv('SHOPEE_ACCESS_TOKEN_PLACEHOLDER', ACCESS_TOKEN_PLACEHOLDER)
+
+def montar_requisicao_shopee(url_path, shop_id, payload):
+    """
+    Monta URL, cabeçalhos assinados e corpo JSON de uma chamada à Shopee API.
+    Retorna None se não houver access_token válido.
+    """
+    timestamp = int(datetime.now().timestamp())
+    access_token = get_access_token(shop_id)   # Obtenha o token real
+
+    if not access_token or access_token == ACCESS_TOKEN_PLACEHOLDER:
+        return None
+
+    signature = generate_shopee_signature(
+        url_path,
+        access_token,
+        shop_id,
+        PARTNER_ID,
+        timestamp,
+        API_SECRET,
+    )
+
+    headers = {
+        "Content-Type": "application/json",
+        "Host": "open.shopee.com",
+        "x-shopee-api-partner-id": str(PARTNER_ID),
+        "x-shopee-api-timestamp": str(timestamp),
+        "x-shopee-api-access-token": access_token,
+        "x-shopee-api-shop-id": str(shop_id),
+        "x-shopee-api-signature": signature,
+    }
+
+    return f"{BASE_URL}{url_path}", headers, json.dumps(payload)
+
+def extrair_dados_mensagem(data):
+    """
+    Extrai (shop_id, conversation_id, sender_id, message_content) do payload do webhook.
+    Retorna None se faltar algum dado essencial.
+    """
+    shop_id = data.get('shop_id')
+    # Usar .get com fallback para dicionário vazio para evitar NoneType
+    message_data = data.get('data', {}).get('message', {})
+    conversation_id = message_data.get('conversation_id')
+    sender_id = message_data.get('from_user_id')          # ID do cliente
+    message_content = message_data.get('content', {}).get('text', '')
+
+    if not all([shop_id, conversation_id, sender_id, message_content is not None]):
+        return None
+    return shop_id, conversation_id, sender_id, message_content
+
+def id_mensagem(data):
+    """message_id do webhook (ou None)."""
+    return data.get('data', {}).get('message', {}).get('message_id')
+
+def mensagem_duplicada(data):
+    """
+    Retorna True se o message_id deste webhook já foi recebido recentemente. Se não, anota o
+    message_id (um reenvio que chegue durante o processamento também é ignorado); se o
+    processamento falhar, chame esquecer_mensagem para o reenvio da Shopee ser processado.
+    """
+    message_id = id_mensagem(data)
+    if not message_id:
+        return False
+    with _trava_mensagens:
+        if message_id in _MENSAGENS_RECENTES:
+            _MENSAGENS_RECENTES.move_to_end(message_id)
+            return True
+        _MENSAGENS_RECENTES[message_id] = True
+        if len(_MENSAGENS_RECENTES) > LIMITE_MENSAGENS_RECENTES:
+            _MENSAGENS_RECENTES.popitem(last=False)
+    return False
+
+def esquecer_mensagem(data):
+    """Tira o message_id do webhook da deduplicação (o processamento falhou e a Shopee vai reenviar)."""
+    message_id = id_mensagem(data)
+    if message_id:
+        with _trava_mensagens:
+            _MENSAGENS_RECENTES.pop(message_id, None)
+
+def remetente_e_loja(shop_id, sender_id):
+    """Retorna True se a mensagem foi enviada pela conta da loja (atendente ou o próprio bot)."""
+    return str(sender_id) == str(shop_id)
+
+# -------------------------------------------------
+# Eco das respostas do bot
+# -------------------------------------------------
+def _normalizar_eco(texto):
+    """Forma comparável do texto: a Shopee pode mexer em espaços e quebras de linha, tirar o negrito ou cortar o final."""
+    texto = " ".join(unicodedata.normalize('NFKC', texto).replace('*', '').split())
+    return texto.removesuffix('…').removesuffix('...').rstrip().casefold()
+
+def _bate_com_envio(enviado, recebido):
+    return recebido == enviado or (len(recebido) >= PREFIXO_MINIMO_ECO and enviado.startswith(recebido))
+
+def _diretorio_conversa(conversation_id):
+    return os.path.join(ENVIOS_DIR, re.sub(r'[^\w.-]', '_', str(conversation_id)))
+
+def _gravar_envio(diretorio, id_envio, texto, message_id):
+    temporario = os.path.join(diretorio, f".{id_envio}.tmp")
+    for tentativa in range(3):
+        try:
+            os.makedirs(diretorio, exist_ok=True)
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump({'texto': texto, 'message_id': message_id}, f)
+            os.replace(temporario, os.path.join(diretorio, id_envio))
+            return
+        except FileNotFoundError:
+            # Outro worker removeu o diretório vazio da conversa no meio do caminho
+            if tentativa == 2:
+                raise
+
+def _envios_em_arquivo(diretorio):
+    """[(id do envio, texto normalizado, message_id)] da conversa, do mais antigo para o mais recente."""
+    try:
+        nomes = sorted(nome for nome in os.listdir(diretorio) if not nome.startswith('.'))
+    except FileNotFoundError:
+        return []
+    envios = []
+    for nome in nomes:
+        try:
+            with open(os.path.join(diretorio, nome), encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            continue   # consumido por outro worker enquanto líamos
+        envios.append((nome, dados.get('texto', ''), dados.get('message_id')))
+    return envios
+
+def _remover_envio_arquivo(diretorio, id_envio):
+    """Remove o registro do envio. Retorna False se outro worker já o consumiu."""
+    try:
+        os.remove(os.path.join(diretorio, id_envio))
+    except FileNotFoundError:
+        return False
+    try:
+        os.rmdir(diretorio)   # só sai se era o último envio da conversa
+    except OSError:
+        pass
+    return True
+
+def registrar_envio(conversation_id, texto):
+    """
+    Anota um texto enviado pelo bot na conversa (antes de chamar a Shopee, que pode
+    entregar o eco antes de responder). Retorna o id do envio para confirmar_envio.
+    """
+    id_envio = f"{time.time_ns():020d}-{os.getpid()}"
+    texto = _normalizar_eco(texto)
+    if ENVIOS_DIR:
+        diretorio = _diretorio_conversa(conversation_id)
+        try:
+            _gravar_envio(diretorio, id_envio, texto, None)
+            for antigo, _, _ in _envios_em_arquivo(diretorio)[:-ENVIOS_POR_CONVERSA]:
+                _remover_envio_arquivo(diretorio, antigo)
+        except OSError as e:
+            print(f"❌ Erro ao anotar envio em {ENVIOS_DIR}: {e}. O eco desta resposta pode parecer um atendente.")
+        return id_envio
+    chave = str(conversation_id)
+    with _trava_envios:
+        enviados = _ENVIOS_RECENTES.get(chave)
+        if enviados is None:
+            enviados = _ENVIOS_RECENTES[chave] = OrderedDict()
+            if len(_ENVIOS_RECENTES) > LIMITE_CONVERSAS_ENVIOS:
+                _ENVIOS_RECENTES.popitem(last=False)
+        else:
+            _ENVIOS_RECENTES.move_to_end(chave)
+        enviados[id_envio] = (texto, None)
+        if len(enviados) > ENVIOS_POR_CONVERSA:
+            enviados.popitem(last=False)
+    return id_envio
+
+def confirmar_envio(conversation_id, id_envio, message_id):
+    """Guarda o message_id que a Shopee devolveu para o envio (o eco chega com o mesmo id)."""
+    if not message_id:
+        return
+    if ENVIOS_DIR:
+        diretorio = _diretorio_conversa(conversation_id)
+        try:
+            with open(os.path.join(diretorio, id_envio), encoding="utf-8") as f:
+                texto = json.load(f)['texto']
+            _gravar_envio(diretorio, id_envio, texto, str(message_id))
+        except (OSError, ValueError, KeyError):
+            pass   # o eco chegou (e consumiu o registro) antes da resposta da Shopee
+        return
+    with _trava_envios:
+        enviados = _ENVIOS_RECENTES.get(str(conversation_id))
+        if enviados and id_envio in enviados:
+            enviados[id_envio] = (enviados[id_envio][0], str(message_id))
+
+def eco_de_envio(conversation_id, texto, message_id=None):
+    """
+    Retorna True (e consome o registro) se a mensagem da loja é o eco de uma resposta
+    enviada pelo bot: mesmo message_id ou mesmo texto (normalizado, ou só o começo dele).
+    """
+    texto = _normalizar_eco(texto)
+    message_id = str(message_id) if message_id else None
+    if ENVIOS_DIR:
+        diretorio = _diretorio_conversa(conversation_id)
+        envios = _envios_em_arquivo(diretorio)
+        candidatos = ([nome for nome, _, mid in envios if message_id and mid == message_id]
+                      or [nome for nome, enviado, _ in envios if _bate_com_envio(enviado, texto)])
+        # Dois workers podem ver o mesmo eco (reenvio do webhook): só um consome cada registro
+        return any(_remover_envio_arquivo(diretorio, nome) for nome in candidatos)
+    with _trava_envios:
+        enviados = _ENVIOS_RECENTES.get(str(conversation_id))
+        if not enviados:
+            return False
+        candidatos = ([id_envio for id_envio, (_, mid) in enviados.items() if message_id and mid == message_id]
+                      or [id_envio for id_envio, (enviado, _) in enviados.items() if _bate_com_envio(enviado, texto)])
+        if not candidatos:
+            return False
+        del enviados[candidatos[0]]
+        if not enviados:
+            del _ENVIOS_RECENTES[str(conversation_id)]
+        return True
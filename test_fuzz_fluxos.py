@@ -0,0 +1,68 @@
+# test_fuzz_fluxos.py - Regressões encontradas pelo fuzz_fluxos.py
+# -------------------------------------------------
+# Cada teste refaz a sequência reduzida de uma falha que o fuzzing
+# encontrou, com as mesmas invariantes (fuzz_fluxos.passo), para a falha
+# não voltar. Rodar da raiz do projeto (as regras são lidas de lá):
+#     python -m pytest test_fuzz_fluxos.py
+#     python -m unittest test_fuzz_fluxos
+# -------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import bot_logic
+import fuzz_fluxos
+from fuzz_fluxos import CLIENTE, ATENDENTE
+
+class RegressoesFuzz(unittest.TestCase):
+
+    def setUp(self):
+        # Os pedidos confirmados gravam arquivos: roda num diretório temporário, como o fuzz
+        anterior = os.getcwd()
+        diretorio = tempfile.mkdtemp(prefix="test_fuzz_fluxos_")
+        os.chdir(diretorio)
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        self.addCleanup(os.chdir, anterior)
+
+    def reproduzir(self, mensagens):
+        """Roda as mensagens do cliente numa sessão nova e falha com a invariante violada, se houver."""
+        self.reproduzir_eventos([(CLIENTE, texto) for texto in mensagens])
+
+    def reproduzir_eventos(self, eventos):
+        falha = fuzz_fluxos.rodar_isolada(eventos, conferir_cache=True)
+        self.assertIsNone(falha, f"evento {falha.indice}: {falha}" if falha else None)
+
+    def test_correcao_de_nome_avanca_a_capinha(self):
+        # Antes: capinha_atual_nome ficava em 1 depois da correção e a mesma capinha era pedida de novo
+        self.reproduzir(['oi', '1', '2', 'iPhone 11, Ana1', 'Ana', 'iPhone 12, Bia'])
+
+    def test_opcao_12_das_duvidas_devolve_encaminhado(self):
+        # Antes: a conversa era encaminhada mas processar_mensagem_shopee devolvia encaminhado=False
+        self.reproduzir(['oi', '5', '12'])
+
+    def test_atendente_antes_da_primeira_mensagem(self):
+        # Antes: a assistente cumprimentava por cima do atendente que já tinha assumido a conversa
+        self.reproduzir_eventos([(ATENDENTE, 'Olá, aqui é a Ana do atendimento'), (CLIENTE, 'oi')])
+
+    def test_upload_de_foto_sem_modelo_salvo(self):
+        # Antes: KeyError em modelo_tema_atual_foto (sessão restaurada sem o modelo/tema)
+        sessao_id = "test-fuzz-foto"
+        self.addCleanup(bot_logic.remover_sessao, sessao_id)
+        for texto in ('oi', '2', '1', 'iPhone 13'):
+            fuzz_fluxos.passo(sessao_id, (CLIENTE, texto))
+        memoria = bot_logic.SESSAO_ESTADOS[sessao_id]['MEMORIA_USUARIO']
+        self.assertEqual(memoria['personalizacao_foto_estado'], 'aguardando_upload_foto')
+        del memoria['modelo_tema_atual_foto']
+
+        resposta, _ = fuzz_fluxos.passo(sessao_id, (CLIENTE, 'foto.jpg'))
+        self.assertEqual(resposta, bot_logic.texto_fluxo("FOTO_PEDIR_MODELO"))
+        self.assertEqual(memoria['personalizacao_foto_estado'], 'aguardando_modelo_foto')
+        fuzz_fluxos.passo(sessao_id, (CLIENTE, 'iPhone 13'))
+        fuzz_fluxos.passo(sessao_id, (CLIENTE, 'foto.jpg'))
+        self.assertEqual(memoria['personalizacao_foto_estado'], 'confirmacao_final')
+        self.assertEqual(memoria['detalhes_personalizacao_foto'], [{'tema': 'iPhone 13', 'nome_arquivo_foto': 'foto.jpg'}])
+
+if __name__ == "__main__":
+    unittest.main()